@@ -0,0 +1,74 @@
+"""测试用的模拟1分钟K线"""
+import datetime
+import random
+
+import pytest
+
+from trade.chanlog import ChanLog, OFF
+from trade.constant import Exchange, Interval
+from trade.object import BarData
+
+
+def generate_bars(days, seed=1, symbol='000001', exchange=Exchange.SZSE, start=datetime.date(2021, 1, 4)):
+    """随机游走的A股1分钟K线，按结束时间标记，每天240根，跳过周末"""
+    rnd = random.Random(seed)
+    price = 10.0
+    bars = []
+    day = start
+    count = 0
+    while count < days:
+        if day.weekday() < 5:
+            count += 1
+            for session_start in (datetime.time(9, 31), datetime.time(13, 1)):
+                base = datetime.datetime.combine(day, session_start)
+                for i in range(120):
+                    open_price = price
+                    price = max(1.0, price * (1 + rnd.gauss(0, 0.003)))
+                    close_price = round(price, 2)
+                    high_price = round(max(open_price, close_price) + abs(rnd.gauss(0, 0.01)), 2)
+                    low_price = round(min(open_price, close_price) - abs(rnd.gauss(0, 0.01)), 2)
+                    bars.append(BarData(symbol=symbol, exchange=exchange, interval=Interval.MINUTE,
+                                        datetime=base + datetime.timedelta(minutes=i),
+                                        open_price=round(open_price, 2), high_price=high_price,
+                                        low_price=low_price, close_price=close_price, volume=100.0))
+        day += datetime.timedelta(days=1)
+    return bars
+
+
+@pytest.fixture
+def make_bars():
+    return generate_bars
+
+
+@pytest.fixture(autouse=True)
+def quiet_chan_log():
+    """测试不写缠论日志文件"""
+    level = ChanLog.level
+    ChanLog.set_level(OFF)
+    yield
+    ChanLog.set_level(level)
+
+
+def dump_chan(chan, chan_map=None):
+    """Chan_Class的计算结果，按repr比较，qjt依据用chan_map重建"""
+    chan_map = chan_map or {chan.freq: chan}
+    chan_k_list = chan.chan_k_list
+    return {
+        'k_list': [repr(bar) for bar in chan.k_list],
+        'chan_k_list': repr([chan_k_list.open.tolist(), chan_k_list.high.tolist(), chan_k_list.low.tolist(),
+                             chan_k_list.close.tolist(), chan_k_list.datetimes()]),
+        'macd': repr(chan.k_macd.macd),
+        'fx_list': [repr(fx) for fx in chan.fx_list],
+        'stroke_list': [repr(fx) for fx in chan.stroke_list],
+        'line_list': [repr(fx) for fx in chan.line_list],
+        'line_index': list(chan.line_index.items()),
+        'pivot_list': [repr(pivot.to_list(chan_map)) for pivot in chan.pivot_list],
+        'trend_list': repr(chan.trend_list),
+        'buy_list': [repr(bs.to_list(chan_map)) for bs in chan.buy_list],
+        'sell_list': [repr(bs.to_list(chan_map)) for bs in chan.sell_list],
+    }
+
+
+@pytest.fixture
+def chan_state():
+    return dump_chan
@@ -0,0 +1,59 @@
+"""增量指标和TA-Lib/逐窗口计算的结果相同"""
+import datetime
+
+import numpy as np
+import pytest
+import talib
+
+from trade.constant import Exchange, Interval
+from trade.object import BarData
+from trade.utility import Accumulator, SmaAccumulator, EmaAccumulator, MacdAccumulator, AtrAccumulator, \
+    BollAccumulator
+
+
+def make_prices(count, level=10.0, seed=1):
+    rng = np.random.default_rng(seed)
+    close = np.round(level + np.cumsum(rng.normal(0, level * 0.002, count)), 2)
+    high = close + np.round(rng.random(count) * level * 0.003, 2)
+    low = close - np.round(rng.random(count) * level * 0.003, 2)
+    return high, low, close
+
+
+def make_bars(high, low, close):
+    dt = datetime.datetime(2021, 1, 4, 9, 31)
+    return [BarData(symbol='000001', exchange=Exchange.SZSE, interval=Interval.MINUTE, datetime=dt,
+                    open_price=c, high_price=h, low_price=l, close_price=c)
+            for h, l, c in zip(high.tolist(), low.tolist(), close.tolist())]
+
+
+def feed(accumulator, bars):
+    return [accumulator.update_bar(bar) for bar in bars]
+
+
+def test_accumulator_is_abstract():
+    with pytest.raises(TypeError):
+        Accumulator()
+
+
+def test_talib_parity():
+    high, low, close = make_prices(3000)
+    bars = make_bars(high, low, close)
+    assert np.allclose(feed(SmaAccumulator(20), bars), talib.SMA(close, 20), equal_nan=True)
+    assert np.allclose(feed(EmaAccumulator(20), bars), talib.EMA(close, 20), equal_nan=True)
+    assert np.allclose(feed(AtrAccumulator(14), bars), talib.ATR(high, low, close, 14), equal_nan=True)
+    macd = np.array(feed(MacdAccumulator(12, 26, 9), bars))
+    for values, expected in zip(macd.T, talib.MACD(close, 12, 26, 9)):
+        assert np.allclose(values, expected, equal_nan=True)
+
+
+def test_boll_long_history_high_price():
+    n = 20
+    high, low, close = make_prices(300000, level=1000.0)
+    boll = BollAccumulator(n, 2)
+    up = np.array([boll.update(value)[0] for value in close.tolist()])
+    windows = np.lib.stride_tricks.sliding_window_view(close, n)
+    expected = windows.mean(axis=1) + 2 * windows.std(axis=1)
+    assert np.all(np.isnan(up[:n - 1]))
+    std = (up[n - 1:] - windows.mean(axis=1)) / 2
+    assert np.max(np.abs(std - windows.std(axis=1)) / windows.std(axis=1)) < 1e-8
+    assert np.allclose(up[n - 1:], expected, rtol=0, atol=1e-9)
@@ -0,0 +1,79 @@
+"""历史K线批量计算和逐根处理的结果相同，之后可以继续逐根处理"""
+import pytest
+
+from trade.strategies.chan_class import Chan_Class
+from trade.strategies.chan_strategy import Chan_Strategy
+
+SETTINGS = [
+    {},
+    {'include': False},
+    {'build_pivot': True},
+    {'include_feature': True},
+    {'qjt': True, 'build_pivot': True},
+]
+
+
+def new_chan(setting, orders):
+    kwargs = dict(include=True, build_pivot=False, qjt=False)
+    kwargs.update(setting)
+    return Chan_Class('1分钟', '000001', sell=lambda price, volume, freq: orders.append(('S', price)),
+                      buy=lambda price, volume, freq: orders.append(('B', price)), **kwargs)
+
+
+@pytest.mark.parametrize('setting', SETTINGS)
+@pytest.mark.parametrize('seed', [1, 2])
+def test_chan_class_on_bars(make_bars, chan_state, setting, seed):
+    bars = make_bars(15, seed)
+    history = len(bars) - 200
+
+    expected_orders = []
+    expected = new_chan(setting, expected_orders)
+    for bar in bars:
+        expected.on_bar(bar)
+
+    orders = []
+    chan = new_chan(setting, orders)
+    chan.on_bars(bars[:history])
+    for bar in bars[history:]:
+        chan.on_bar(bar)
+
+    assert expected.pivot_list
+    assert chan_state(chan) == chan_state(expected)
+    assert orders == expected_orders
+
+
+def new_strategy(setting, orders):
+    strategy = Chan_Strategy('TEST', 'test', '000001', setting)
+    strategy.send_order = lambda direction, offset, price, volume, freq, *args, **kwargs: orders.append(
+        (direction, price, freq))
+    return strategy
+
+
+@pytest.mark.parametrize('setting', [{}, {'qjt': True}, {'qjt': True, 'build_pivot': True},
+                                     {'qjt': True, 'include_feature': True}])
+def test_strategy_on_bars(make_bars, chan_state, setting):
+    bars = make_bars(40)
+    history = len(bars) - 500
+
+    expected_orders = []
+    expected = new_strategy(setting, expected_orders)
+    for bar in bars:
+        expected.on_bar(bar)
+
+    orders = []
+    strategy = new_strategy(setting, orders)
+    assert strategy.on_bars(bars[:history])
+    for bar in bars[history:]:
+        strategy.on_bar(bar)
+
+    assert expected_orders
+    assert orders == expected_orders
+    for freq, chan in strategy.chan_freq_map.items():
+        assert chan_state(chan, strategy.chan_freq_map) == chan_state(expected.chan_freq_map[freq],
+                                                                      expected.chan_freq_map)
+
+
+def test_strategy_on_bars_cancel(make_bars):
+    strategy = new_strategy({}, [])
+    calls = []
+    assert not strategy.on_bars(make_bars(10), cancel=lambda: calls.append(1) or len(calls) > 3)
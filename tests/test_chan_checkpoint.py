@@ -0,0 +1,69 @@
+"""快照恢复：恢复后继续计算的结果和不中断相同，恢复后的价格校验"""
+import dataclasses
+
+import pytest
+
+from trade.strategies.chan_strategy import Chan_Strategy
+
+
+def new_strategy(setting=None, orders=None):
+    strategy = Chan_Strategy(engine='TEST', strategy_name='test', vt_symbol='000001', setting=setting or {})
+    if orders is not None:
+        strategy.send_order = lambda direction, offset, price, volume, freq, *args, **kwargs: orders.append(
+            (direction, price, freq))
+    return strategy
+
+
+@pytest.mark.parametrize('setting', [{}, {'qjt': True, 'build_pivot': True}, {'gz': True, 'qjt': True}])
+def test_checkpoint_round_trip(make_bars, chan_state, tmp_path, setting):
+    bars = make_bars(40)
+    # 停在30分钟K线中间，BarGenerator里有没完成的K线
+    cut = len(bars) - 1000 + 17
+
+    expected_orders = []
+    expected = new_strategy(setting, expected_orders)
+    for bar in bars[:cut]:
+        expected.on_bar(bar)
+    path = tmp_path / 'checkpoint.pkl'
+    expected.save_checkpoint(path)
+    del expected_orders[:]
+    for bar in bars[cut:]:
+        expected.on_bar(bar)
+
+    orders = []
+    restored = new_strategy(setting, orders)
+    assert restored.load_checkpoint(path)
+    assert restored.get_last_datetime() == bars[cut - 1].datetime
+    for bar in bars[cut:]:
+        restored.on_bar(bar)
+
+    assert expected_orders
+    assert orders == expected_orders
+    for freq, chan in restored.chan_freq_map.items():
+        assert chan_state(chan, restored.chan_freq_map) == chan_state(expected.chan_freq_map[freq],
+                                                                      expected.chan_freq_map)
+    # 参数不同的快照不能恢复
+    assert not new_strategy(dict(setting, include_feature=True)).load_checkpoint(path)
+
+
+def test_match_bars_detects_adjusted_prices(make_bars, tmp_path):
+    bars = make_bars(12)
+    strategy = new_strategy()
+    strategy.on_bars(bars[:-240])
+    path = tmp_path / 'checkpoint.pkl'
+    strategy.save_checkpoint(path)
+
+    restored = new_strategy()
+    assert restored.load_checkpoint(path)
+    # 重新下载最后一天及之后的K线
+    refetched = bars[-480:]
+    assert restored.match_bars(refetched)
+
+    # 除权除息后前复权价格整体变化
+    adjusted = [dataclasses.replace(bar, open_price=round(bar.open_price * 0.9, 2),
+                                    high_price=round(bar.high_price * 0.9, 2),
+                                    low_price=round(bar.low_price * 0.9, 2),
+                                    close_price=round(bar.close_price * 0.9, 2)) for bar in refetched]
+    assert not restored.match_bars(adjusted)
+    # 没有重叠的K线无法校验
+    assert not restored.match_bars(bars[-240:])
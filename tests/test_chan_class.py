@@ -0,0 +1,23 @@
+"""单个级别的Chan_Class，不经过Chan_Strategy"""
+from trade.strategies.chan_class import Chan_Class
+
+
+def test_set_prev_subscribes_gz(make_bars):
+    prev = Chan_Class('5分钟', '000001', sell=None, buy=None, qjt=False)
+    chan = Chan_Class('1分钟', '000001', sell=None, buy=None, qjt=False, gz=True)
+    prev.set_next(chan)
+    chan.set_prev(prev)
+    assert prev.listeners == [chan.on_prev_delta]
+    # 快照恢复时会再调用，不重复订阅
+    chan.subscribe_gz()
+    assert prev.listeners == [chan.on_prev_delta]
+
+    seen = 0
+    for bar in make_bars(30):
+        prev.on_bar(bar)
+        if prev.buy_list:
+            assert chan.gz_last_bs is prev.buy_list[-1]
+            seen += 1
+        else:
+            assert chan.gz_last_bs is None
+    assert seen
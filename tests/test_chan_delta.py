@@ -0,0 +1,85 @@
+"""按订阅到的ChanDelta依次修改，得到和Chan_Class相同的分型、笔、线段、中枢和买卖点"""
+import pytest
+
+from trade.strategies.chan_object import DELTA_FX, DELTA_STROKE_APPEND, DELTA_STROKE_EXTEND, \
+    DELTA_STROKE_REPLACE, DELTA_LINE_APPEND, DELTA_LINE_EXTEND, DELTA_LINE_REPLACE, DELTA_LINE_REMOVE, \
+    DELTA_PIVOT_CREATE, DELTA_PIVOT_UPDATE, DELTA_PIVOT_REMOVE, DELTA_BS_CREATE, DELTA_BS_INVALID, DELTA_RETAIN
+from trade.strategies.chan_strategy import Chan_Strategy
+
+APPEND = {DELTA_STROKE_APPEND: 'stroke', DELTA_LINE_APPEND: 'line', DELTA_PIVOT_CREATE: 'pivot'}
+SET = {DELTA_STROKE_EXTEND: 'stroke', DELTA_STROKE_REPLACE: 'stroke', DELTA_LINE_EXTEND: 'line',
+       DELTA_LINE_REPLACE: 'line', DELTA_PIVOT_UPDATE: 'pivot'}
+REMOVE = {DELTA_LINE_REMOVE: 'line', DELTA_PIVOT_REMOVE: 'pivot'}
+
+
+class Mirror:
+    """只靠ChanDelta维护的副本"""
+
+    def __init__(self):
+        self.lists = {'fx': [], 'stroke': [], 'line': [], 'pivot': []}
+        self.bs = []
+        self.invalid = set()
+        self.deltas = []
+
+    def on_delta(self, delta):
+        self.deltas.append((delta.kind, delta.index, repr(delta.data)))
+        if delta.kind == DELTA_FX:
+            self.lists['fx'].append(delta.data)
+        elif delta.kind in APPEND:
+            data = self.lists[APPEND[delta.kind]]
+            data.append(delta.data)
+            assert delta.index == len(data) - 1
+        elif delta.kind in SET:
+            self.lists[SET[delta.kind]][delta.index] = delta.data
+        elif delta.kind in REMOVE:
+            data = self.lists[REMOVE[delta.kind]]
+            assert delta.index == len(data) - 1
+            data.pop()
+        elif delta.kind == DELTA_BS_CREATE:
+            self.bs.append(delta.data)
+        elif delta.kind == DELTA_BS_INVALID:
+            self.invalid.add(id(delta.data))
+        elif delta.kind == DELTA_RETAIN:
+            for name, count in zip(('fx', 'stroke', 'line', 'pivot'), delta.data):
+                del self.lists[name][:count]
+
+
+def run(bars, setting, batch):
+    strategy = Chan_Strategy('TEST', 'test', '000001', setting)
+    mirrors = {}
+    for freq, chan in strategy.chan_freq_map.items():
+        mirrors[freq] = Mirror()
+        chan.subscribe(mirrors[freq].on_delta)
+    if batch:
+        strategy.on_bars(bars[:-300])
+        bars = bars[-300:]
+    for bar in bars:
+        strategy.on_bar(bar)
+    return strategy, mirrors
+
+
+@pytest.mark.parametrize('setting', [{}, {'build_pivot': True}, {'include_feature': True, 'qjt': True},
+                                     {'keep_pivots': 3}])
+@pytest.mark.parametrize('batch', [False, True])
+def test_delta_mirror(make_bars, setting, batch):
+    strategy, mirrors = run(make_bars(60), setting, batch)
+    for freq, chan in strategy.chan_freq_map.items():
+        mirror = mirrors[freq]
+        for name, data in (('fx', chan.fx_list), ('stroke', chan.stroke_list), ('line', chan.line_list),
+                           ('pivot', chan.pivot_list)):
+            assert [id(x) for x in mirror.lists[name]] == [id(x) for x in data], (freq, name)
+        created = {id(bs) for bs in mirror.bs}
+        for bs in chan.buy_list + chan.sell_list:
+            assert id(bs) in created
+            assert (id(bs) in mirror.invalid) == (bs.valid == 0)
+    assert mirrors['1分钟'].lists['pivot']
+
+
+@pytest.mark.parametrize('setting', [{}, {'build_pivot': True, 'qjt': True}])
+def test_batch_delta_sequence(make_bars, setting):
+    """批量计算发出的变化和逐根处理相同"""
+    bars = make_bars(30)
+    _, expected = run(bars, setting, False)
+    _, mirrors = run(bars, setting, True)
+    for freq, mirror in mirrors.items():
+        assert mirror.deltas == expected[freq].deltas
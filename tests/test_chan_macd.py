@@ -0,0 +1,55 @@
+"""逐根增量的ChanMacd和talib.MACD逐位一致"""
+import math
+import random
+
+import numpy as np
+import talib
+
+from trade.strategies.chan_class import Chan_Class
+from trade.strategies.chan_macd import ChanMacd
+
+
+def assert_same(values, expected):
+    values = np.array(values)
+    assert np.array_equal(np.isnan(values), np.isnan(expected))
+    # talib编译时可能把乘加合并成FMA，最后一位可以不同
+    np.testing.assert_allclose(values, expected, rtol=1e-12, atol=1e-15)
+
+
+def test_macd_talib_parity():
+    rnd = random.Random(1)
+    macd = ChanMacd()
+    closes = []
+    price = 10.0
+    for _ in range(3000):
+        price = round(price * (1 + rnd.gauss(0, 0.01)), 2)
+        # 模拟包含处理改写最后一根K线，种子区间内也会改写
+        if closes and rnd.random() < 0.3:
+            closes[-1] = price
+            macd.update(price)
+        else:
+            closes.append(price)
+            macd.append(price)
+
+    dif, dea, hist = talib.MACD(np.array(closes), 12, 26, 9)
+    assert_same(macd.dif, dif)
+    assert_same(macd.dea, dea)
+    assert_same(macd.macd, hist)
+
+    area = [round(abs(round(value, 4)) * 10000) for value in macd.macd[macd.start:]]
+    for start, end in ((macd.start, macd.start), (macd.start, 2999), (100, 250), (2000, 2999)):
+        assert macd.cal_area(start, end) == sum(area[start - macd.start:end - macd.start + 1]) / 10000
+    assert math.isnan(macd.cal_area(0, 100))
+
+    macd.trim(1000)
+    assert_same(macd.macd, hist[1000:])
+    assert macd.cal_area(0, 150) == sum(area[1000 - macd.start:1151 - macd.start]) / 10000
+
+
+def test_chan_macd_matches_chan_k_list(make_bars):
+    chan = Chan_Class('1分钟', '000001', sell=None, buy=None, qjt=False)
+    for bar in make_bars(10):
+        chan.on_bar(bar)
+    dif, dea, hist = talib.MACD(chan.chan_k_list.close, 12, 26, 9)
+    assert len(chan.k_macd) == len(chan.chan_k_list)
+    assert_same(chan.k_macd.macd, hist)
@@ -0,0 +1,45 @@
+"""keep_pivots只保留最近的中枢，之后的下单、中枢和买卖点和全部保留时相同"""
+import pytest
+
+from trade.strategies.chan_strategy import Chan_Strategy
+
+
+def bs_key(bs):
+    return bs.dt, bs.price, bs.kind, bs.eval_dt, bs.valid, bs.invalid_dt, bs.trend_type, bs.strength
+
+
+def pivot_key(pivot):
+    return (pivot.start, pivot.end, pivot.zd, pivot.zg, pivot.direction, pivot.gg, pivot.dd,
+            [bs_key(bs) if bs else None for bs in pivot.buy + pivot.sell])
+
+
+def run(bars, setting, history):
+    strategy = Chan_Strategy('TEST', 'test', '000001', setting)
+    orders = []
+    strategy.send_order = lambda direction, offset, price, volume, *args, **kwargs: orders.append(
+        (direction, price, volume))
+    strategy.on_bars(bars[:history])
+    sizes = {freq: len(chan.k_list) for freq, chan in strategy.chan_freq_map.items()}
+    for bar in bars[history:]:
+        strategy.on_bar(bar)
+    return strategy, orders, sizes
+
+
+@pytest.mark.parametrize('setting', [{}, {'qjt': True}, {'build_pivot': True}, {'include_feature': True}])
+def test_keep_pivots_same_results(make_bars, setting):
+    bars = make_bars(100)
+    history = len(bars) // 2
+    full, full_orders, full_sizes = run(bars, setting, history)
+    kept, kept_orders, kept_sizes = run(bars, dict(setting, keep_pivots=3), history)
+
+    assert kept_orders == full_orders
+    for freq, chan in kept.chan_freq_map.items():
+        full_chan = full.chan_freq_map[freq]
+        if len(full_chan.pivot_list) > 6:
+            # on_bars载入历史时已经丢弃
+            assert kept_sizes[freq] < full_sizes[freq]
+            assert len(chan.k_list) < len(full_chan.k_list)
+        count = len(chan.pivot_list)
+        assert [pivot_key(p) for p in chan.pivot_list] == [pivot_key(p) for p in full_chan.pivot_list[-count:]]
+        for kept_list, full_list in ((chan.buy_list, full_chan.buy_list), (chan.sell_list, full_chan.sell_list)):
+            assert [bs_key(bs) for bs in kept_list] == [bs_key(bs) for bs in full_list[-len(kept_list):]]
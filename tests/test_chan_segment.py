@@ -0,0 +1,60 @@
+"""特征序列划分线段：每条线段的端点是它范围内笔端点的极值"""
+import random
+from collections import namedtuple
+
+import pytest
+
+from trade.strategies.chan_object import UP, DOWN
+from trade.strategies.chan_segment import FeatureSegment, SEGMENT_APPEND, SEGMENT_REMOVE
+
+Fx = namedtuple('Fx', ['direction', 'high', 'low'])
+
+
+def make_strokes(seed, count=3000):
+    """随机游走的笔端点，顶底交替，顶高于前后的底"""
+    rnd = random.Random(seed)
+    price = 10.0
+    fx_list = [Fx(DOWN, price + 0.02, price)]
+    while len(fx_list) < count:
+        direction = -fx_list[-1].direction
+        last = fx_list[-1]
+        move = rnd.uniform(0.05, 0.6) * rnd.choice((1, 1, 1, 0.3, 2.5))
+        if direction == UP:
+            high = last.high + move
+            fx_list.append(Fx(UP, high, high - 0.02))
+        else:
+            low = last.low - move
+            fx_list.append(Fx(DOWN, low + 0.02, low))
+    return fx_list
+
+
+def feed_all(fx_list):
+    segment = FeatureSegment()
+    lines = []
+    for pos, fx in enumerate(fx_list):
+        for change, line_fx, line_pos in segment.feed(fx, pos):
+            if change == SEGMENT_REMOVE:
+                lines.pop()
+            elif change == SEGMENT_APPEND:
+                lines.append(line_pos)
+            else:
+                lines[-1] = line_pos
+    return lines
+
+
+@pytest.mark.parametrize('seed', range(1, 41))
+def test_segment_endpoints_are_extremes(seed):
+    fx_list = make_strokes(seed)
+    lines = feed_all(fx_list)
+    assert len(lines) > 10
+    for a, b in zip(lines, lines[1:]):
+        assert a < b
+        start, end = fx_list[a], fx_list[b]
+        assert start.direction == -end.direction
+        strokes = fx_list[a:b + 1]
+        if end.direction == UP:
+            assert start.low == min(fx.low for fx in strokes)
+            assert end.high == max(fx.high for fx in strokes)
+        else:
+            assert start.high == max(fx.high for fx in strokes)
+            assert end.low == min(fx.low for fx in strokes)
@@ -0,0 +1,64 @@
+"""缠论日志：每个Chan_Class自己的级别，文件句柄按最近写入淘汰"""
+from collections import OrderedDict
+
+import pytest
+
+from trade.chanlog import ChanLog, DEBUG, OFF
+from trade.strategies.chan_strategy import Chan_Strategy
+
+
+@pytest.fixture
+def log_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr('trade.chanlog.TEMP_DIR', tmp_path)
+    monkeypatch.setattr(ChanLog, 'files', OrderedDict())
+    yield tmp_path.joinpath('chan_log')
+    ChanLog.close()
+
+
+def test_log_level_per_strategy(log_dir):
+    loud = Chan_Strategy('TEST', 'loud', '000001', {'log_level': DEBUG})
+    quiet = Chan_Strategy('TEST', 'quiet', '600000', {'log_level': OFF})
+    assert ChanLog.level == OFF
+    for chan in loud.chan_freq_map.values():
+        assert chan.log_level == DEBUG
+    for chan in quiet.chan_freq_map.values():
+        assert chan.log_level == OFF
+
+    for strategy in (loud, quiet):
+        for chan in strategy.chan_freq_map.values():
+            chan.log('%s-%s', chan.symbol, chan.freq)
+    ChanLog.flush()
+    names = sorted(path.name for path in log_dir.iterdir())
+    assert names == sorted('000001-%s.txt' % freq for freq in loud.chan_freq_map)
+
+
+def test_log_files_evicted(log_dir, monkeypatch):
+    monkeypatch.setattr(ChanLog, 'max_files', 3)
+    for i in range(10):
+        ChanLog.write('1分钟', '%06d' % i, 'a')
+        ChanLog.write('1分钟', '000000', 'b')
+        assert len(ChanLog.files) <= 3
+    assert ('000000', '1分钟') in ChanLog.files
+
+    ChanLog.close('000000')
+    assert ('000000', '1分钟') not in ChanLog.files
+    assert log_dir.joinpath('000000-1分钟.txt').read_text() == 'a\n' + 'b\n' * 10
+
+
+def test_qjt_rebuild_keeps_log_level(log_dir, monkeypatch, make_bars):
+    strategy = Chan_Strategy('TEST', 'qjt', '000001', {'qjt': True, 'log_level': DEBUG})
+    strategy.on_bars(make_bars(40))
+    chan_map = strategy.chan_freq_map
+    bs_list = [bs for chan in chan_map.values() for bs in chan.buy_list + chan.sell_list if bs.qjt]
+    assert bs_list
+    ChanLog.flush()
+    sizes = {path.name: path.stat().st_size for path in log_dir.iterdir()}
+
+    def set_level(level):
+        raise AssertionError('rebuild_qjt_pivot changed the global log level')
+
+    monkeypatch.setattr(ChanLog, 'set_level', set_level)
+    for bs in bs_list:
+        bs.to_list(chan_map)
+    ChanLog.flush()
+    assert {path.name: path.stat().st_size for path in log_dir.iterdir()} == sizes
@@ -0,0 +1,108 @@
+"""FxList：各种修改之后dts和inversions和列表一致，between和从后往前遍历的结果相同"""
+import random
+
+import pytest
+
+from trade.strategies.chan_object import Fx, FxList, UP, DOWN
+
+
+def make_fx(rnd, dt):
+    return Fx(10.0, 9.0, dt, rnd.choice((UP, DOWN)), dt)
+
+
+def check(fx_list):
+    dts = [fx.dt for fx in fx_list]
+    assert fx_list.dts == dts
+    assert fx_list.inversions == sum(1 for i in range(1, len(dts)) if dts[i - 1] > dts[i])
+
+
+def scan_between(fx_list, start, end, direction):
+    """原来区间套从后往前遍历的写法"""
+    data = []
+    for i in range(-1, -len(fx_list), -1):
+        d = fx_list[i]
+        if d.dt >= start:
+            if d.dt <= end:
+                data.append(d)
+        else:
+            if d.direction == -direction:
+                data.append(d)
+            break
+    data.reverse()
+    return data
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_mutations_keep_dts_in_sync(seed):
+    rnd = random.Random(seed)
+    fx_list = FxList()
+    reference = []
+    for step in range(2000):
+        op = rnd.randrange(11)
+        fx = make_fx(rnd, rnd.randrange(1000))
+        if op <= 2 or not reference:
+            fx_list.append(fx)
+            reference.append(fx)
+        elif op == 3:
+            index = rnd.choice((-1, -min(2, len(reference)), 0, rnd.randrange(len(reference))))
+            fx_list[index] = fx
+            reference[index] = fx
+        elif op == 4:
+            assert fx_list.pop() is reference.pop()
+        elif op == 5:
+            index = rnd.randrange(-len(reference), len(reference))
+            assert fx_list.pop(index) is reference.pop(index)
+        elif op == 6:
+            cut = rnd.randrange(len(reference) + 1)
+            del fx_list[:cut]
+            del reference[:cut]
+        elif op == 7:
+            index = rnd.randrange(-len(reference) - 2, len(reference) + 2)
+            fx_list.insert(index, fx)
+            reference.insert(index, fx)
+        elif op == 8:
+            items = [make_fx(rnd, rnd.randrange(1000)) for _ in range(rnd.randrange(4))]
+            if rnd.random() < 0.5:
+                fx_list.extend(items)
+            else:
+                fx_list += items
+            reference.extend(items)
+        elif op == 9:
+            a = rnd.randrange(len(reference) + 1)
+            b = rnd.randrange(len(reference) + 1)
+            items = [make_fx(rnd, rnd.randrange(1000)) for _ in range(rnd.randrange(3))]
+            fx_list[a:b] = items
+            reference[a:b] = items
+        else:
+            if rnd.random() < 0.1:
+                fx_list.clear()
+                reference.clear()
+            elif rnd.random() < 0.5:
+                item = rnd.choice(reference)
+                fx_list.remove(item)
+                reference.remove(item)
+            else:
+                del fx_list[::2]
+                del reference[::2]
+        assert list(fx_list) == reference
+        check(fx_list)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_between_matches_scan(seed):
+    rnd = random.Random(seed)
+    fx_list = FxList()
+    dt = 0
+    for _ in range(300):
+        dt += rnd.randrange(1, 5)
+        if fx_list and rnd.random() < 0.3:
+            # 笔延伸：最后一个分型被更晚的分型替换
+            fx_list[-1] = make_fx(rnd, dt)
+        else:
+            fx_list.append(make_fx(rnd, dt))
+        if rnd.random() < 0.05:
+            del fx_list[:rnd.randrange(len(fx_list))]
+        start = rnd.randrange(dt + 2)
+        end = rnd.randrange(start, dt + 3)
+        direction = rnd.choice((UP, DOWN))
+        assert fx_list.between(start, end, direction) == scan_between(fx_list, start, end, direction)
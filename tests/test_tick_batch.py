@@ -0,0 +1,111 @@
+"""tick批量合成1分钟K线"""
+import dataclasses
+import datetime
+import random
+
+import numpy as np
+import pytest
+
+from trade.constant import Exchange
+from trade.object import TickData
+from trade.session import to_timestamp
+from trade.strategies.chan_strategy import Chan_Strategy
+from trade.utility import BarGenerator
+
+
+def generate_ticks(symbol, exchange, minutes=30, seed=1):
+    """每3秒一个tick，成交量为当天累计"""
+    rnd = random.Random(seed)
+    dt = datetime.datetime(2021, 1, 4, 9, 30)
+    price = 10.0
+    volume = 0.0
+    ticks = []
+    for _ in range(minutes * 20):
+        dt += datetime.timedelta(seconds=3)
+        price = round(price * (1 + rnd.gauss(0, 0.001)), 2)
+        volume += rnd.choice((0, 100, 300))
+        ticks.append(TickData(symbol=symbol, exchange=exchange, datetime=dt, last_price=price, volume=volume))
+    return ticks
+
+
+def tick_arrays(ticks):
+    return (np.array([to_timestamp(tick.datetime) for tick in ticks], dtype=np.int64),
+            np.array([tick.last_price for tick in ticks]),
+            np.array([tick.volume for tick in ticks]),
+            np.array([tick.open_interest for tick in ticks]))
+
+
+@pytest.mark.parametrize('vt_symbol, exchange', [('000001', Exchange.SZSE), ('600000', Exchange.SSE),
+                                                 ('000001.SZSE', Exchange.SZSE)])
+def test_on_ticks_bare_symbol(vt_symbol, exchange):
+    symbol = vt_symbol.split('.')[0]
+    ticks = generate_ticks(symbol, exchange)
+
+    expected = Chan_Strategy(engine='TEST', strategy_name='test', vt_symbol=vt_symbol, setting={})
+    for tick in ticks:
+        expected.on_tick(tick)
+
+    strategy = Chan_Strategy(engine='TEST', strategy_name='test', vt_symbol=vt_symbol, setting={})
+    for i in range(0, len(ticks), 50):
+        strategy.on_ticks(*tick_arrays(ticks[i:i + 50]))
+
+    k_list = strategy.chan_freq_map['1分钟'].k_list
+    assert len(k_list) == len(expected.chan_freq_map['1分钟'].k_list) > 0
+    assert [(bar.symbol, bar.exchange) for bar in k_list] == [(symbol, exchange)] * len(k_list)
+    assert list(k_list.close) == list(expected.chan_freq_map['1分钟'].k_list.close)
+    assert strategy.bg.bar.exchange == exchange
+
+
+def noisy_ticks(tzinfo=None, seed=2):
+    """带0价格、乱序、成交量回退和整分钟没有tick的情况"""
+    rnd = random.Random(seed)
+    ticks = generate_ticks('000001', Exchange.SZSE, minutes=60, seed=seed)
+    result = []
+    for i, tick in enumerate(ticks):
+        if 200 <= i < 260:
+            continue
+        dt = tick.datetime.replace(tzinfo=tzinfo)
+        r = rnd.random()
+        if r < 0.03:
+            result.append(dataclasses.replace(tick, datetime=dt, last_price=0))
+            continue
+        if r < 0.06 and result:
+            dt = result[-1].datetime - datetime.timedelta(seconds=rnd.choice((1, 3, 70)))
+        volume = tick.volume - 500 if r > 0.98 else tick.volume
+        result.append(dataclasses.replace(tick, datetime=dt, volume=volume))
+    return result
+
+
+def bar_key(bar):
+    return (bar.symbol, bar.exchange, bar.interval, bar.datetime, bar.open_price, bar.high_price, bar.low_price,
+            bar.close_price, bar.volume, bar.open_interest)
+
+
+@pytest.mark.parametrize('tzinfo', [None, datetime.timezone(datetime.timedelta(hours=8))])
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_update_ticks_same_as_update_tick(tzinfo, seed):
+    ticks = noisy_ticks(tzinfo, seed)
+    expected = []
+    expected_bg = BarGenerator(on_bar=expected.append)
+    for tick in ticks:
+        expected_bg.update_tick(tick)
+
+    # 随机长度的批量和单个tick混合
+    rnd = random.Random(seed)
+    bars = []
+    bg = BarGenerator(on_bar=bars.append)
+    i = 0
+    while i < len(ticks):
+        size = rnd.choice((1, 2, 7, 40, 150))
+        chunk = ticks[i:i + size]
+        if size == 1:
+            bg.update_tick(chunk[0])
+        else:
+            bg.update_ticks('000001', Exchange.SZSE, *tick_arrays(chunk), tzinfo=tzinfo)
+        i += size
+
+    assert len(expected) > 50
+    assert [bar_key(bar) for bar in bars] == [bar_key(bar) for bar in expected]
+    assert bar_key(bg.bar) == bar_key(expected_bg.bar)
+    assert bg.last_tick.datetime == expected_bg.last_tick.datetime
+    assert bg.last_tick.volume == expected_bg.last_tick.volume
@@ -1,16 +1,83 @@
+import atexit
+from collections import OrderedDict
+
 from trade.utility import TEMP_DIR
 
+# 日志级别，数值越大越重要
+DEBUG = 10
+INFO = 20
+OFF = 100
+
 
 class ChanLog:
+    """
+    缠论计算日志，每个symbol-freq一个文件：temp/chan_log/<symbol>-<freq>.txt
+    1. 文件句柄常驻，带缓冲写入，进程退出、flush()或close()时落盘
+    2. 打开的文件最多max_files个，超过时关闭最久没有写入的，扫描大量股票时句柄不会一直增加
+    3. 日志级别属于每个Chan_Class(Chan_Class.log_level)，level只是新建时的默认值；
+       低于级别的日志直接返回，不做任何格式化
+    4. 格式化延迟到确认需要写入时：log(freq, symbol, '%s:%s', a, b)
+    分型、笔、中枢等计算过程为DEBUG，买卖点为INFO
+    """
+
+    level = DEBUG
+    buffer_size = 64 * 1024
+    max_files = 64
+    files = OrderedDict()
+
+    @classmethod
+    def set_level(cls, level) -> None:
+        """之后新建的Chan_Class的默认级别，已经存在的不变"""
+        cls.level = level
+
+    @classmethod
+    def is_enabled(cls, level=DEBUG) -> bool:
+        return level >= cls.level
+
+    @classmethod
+    def log(cls, freq, symbol, data, *args, level=DEBUG) -> None:
+        """按默认级别写日志，Chan_Class用自己的级别，见Chan_Class.log"""
+        if level < cls.level:
+            return
+        cls.write(freq, symbol, data, *args)
 
-    @staticmethod
-    def log(freq, symbol, data) -> None:
+    @classmethod
+    def write(cls, freq, symbol, data, *args) -> None:
+        if args:
+            data = data % args
         data = str(data)
         if len(data) <= 0:
             return
+        key = (symbol, freq)
+        f = cls.files.get(key)
+        if f is None:
+            f = cls.open(symbol, freq)
+        else:
+            cls.files.move_to_end(key)
+        f.write(data + '\n')
+
+    @classmethod
+    def open(cls, symbol, freq):
+        while len(cls.files) >= cls.max_files:
+            cls.files.popitem(last=False)[1].close()
         chan_path = TEMP_DIR.joinpath('chan_log')
         if not chan_path.exists():
             chan_path.mkdir(parents=True)
         chan_file = chan_path.joinpath(symbol + '-' + freq + '.txt')
-        with open(chan_file, 'a') as f:
-            f.write(data + '\n')
+        f = open(chan_file, 'a', buffering=cls.buffer_size)
+        cls.files[(symbol, freq)] = f
+        return f
+
+    @classmethod
+    def flush(cls) -> None:
+        for f in cls.files.values():
+            f.flush()
+
+    @classmethod
+    def close(cls, symbol=None) -> None:
+        """关闭symbol的全部级别的文件，symbol为None时全部关闭；之后再写日志时重新打开"""
+        for key in [key for key in cls.files if symbol is None or key[0] == symbol]:
+            cls.files.pop(key).close()
+
+
+atexit.register(ChanLog.close)
@@ -2,6 +2,7 @@ from datetime import datetime, timedelta
 
 from PyQt5.QtWidgets import QMessageBox
 
+import numpy as np
 import pandas as pd
 from functools import partial
 from typing import List
@@ -9,12 +10,15 @@ from trade.engine import MainEngine, Event
 from trade.ui import QtCore, QtWidgets, QtGui
 from PyQt5.QtWebEngineWidgets import QWebEngineView
 from pathlib import Path
-from trade.constant import FREQS, EVENT_CHANTU, EVENT_RENDER
+from trade.constant import FREQS, FREQ_INTERVAL, EVENT_CHANTU, EVENT_RENDER
 from trade.strategies.chan_strategy import Chan_Strategy
-from trade.object import HistoryRequest, Interval, Exchange
+from trade.strategies.chan_object import UP, B1, B2, B3, S1, S2, S3
+from trade.object import HistoryRequest, Interval
 from trade.jqdata import jqdata_client
-import talib as tl
+from trade.utility import get_folder_path, extract_stock_symbol
+from trade.session import local_minutes, find_gaps, to_timestamp
 from threading import Thread
+import hashlib
 import json
 import time
 
@@ -87,9 +91,7 @@ class ChanTuManager(QtWidgets.QWidget):
             self.main_engine.put(event=Event(EVENT_RENDER, '错误的股票代码：' + vt_symbol))
             print('错误的股票代码：' + vt_symbol)
             return
-        exchange = Exchange.SZSE
-        if vt_symbol[0] == '6':
-            exchange = Exchange.SSE
+        _, exchange = extract_stock_symbol(vt_symbol)
         now_time = datetime.now()
         req = HistoryRequest(
             symbol=vt_symbol,
@@ -100,29 +102,74 @@ class ChanTuManager(QtWidgets.QWidget):
         )
         time_start = time.time()
 
+        # 高级别直接下载原生K线，{freq: 开始日期}，开始日期为None时和1分钟K线相同，见Chan_Strategy.on_bars
+        native_levels = setting.get('native_levels') or {}
+
+        # 同一股票、开始日期和参数算过的结果有缓存，只取缓存之后的K线
+        cache_path = self.get_cache_path(chan_strategy, start_time, setting['interval'], native_levels)
+        last_dt = None
+        if cache_path.exists():
+            try:
+                if chan_strategy.load_checkpoint(cache_path):
+                    last_dt = chan_strategy.get_last_datetime()
+            except Exception as e:
+                print('读取缓存失败：', e)
+        if last_dt:
+            req.start = last_dt.date()
+            print('使用缓存，最后一根k线：', last_dt)
+
         jqdata_client.init(jquser, jqpass)
         if not jqdata_client.inited:
             self.main_engine.put(event=Event(EVENT_RENDER, '聚宽账号或者密码错误！'))
             return
 
         rawData, BarDataList = jqdata_client.query_history(req)
+        if last_dt and not chan_strategy.match_bars(BarDataList):
+            # 前复权价格在除权除息后整体变化，和缓存的K线对不上时丢弃缓存，全部重新计算
+            print('缓存的k线价格已变化，重新计算')
+            chan_strategy = Chan_Strategy(engine=ENGINE, strategy_name=strategy_name, vt_symbol=vt_symbol,
+                                          setting=setting)
+            last_dt = None
+            req.start = start_time
+            rawData, BarDataList = jqdata_client.query_history(req)
+        if last_dt:
+            BarDataList = [bar for bar in BarDataList if bar.datetime > last_dt]
+        # 从缓存恢复时高级别已经由1分钟K线接着合成，不再下载
+        level_bars = {}
+        if not last_dt:
+            for freq, level_start in native_levels.items():
+                level_req = HistoryRequest(
+                    symbol=vt_symbol,
+                    exchange=exchange,
+                    interval=FREQ_INTERVAL[freq],
+                    start=level_start or start_time,
+                    end=now_time.date()
+                )
+                _, level_bars[freq] = jqdata_client.query_history(level_req)
+                print(freq + '原生k线数据大小：' + str(len(level_bars[freq])))
         time_end = time.time()
-        if len(BarDataList) <= 0:
+        if len(BarDataList) <= 0 and not last_dt:
             self.main_engine.put(event=Event(EVENT_RENDER, '获取K线错误，请检查开始日期'))
             print('获取K线错误，请检查开始日期')
             return
         print('获取k线花费时间：', time_end - time_start)
         print('总的1分钟k线数据大小：' + str(len(BarDataList)))
+        if BarDataList:
+            minutes = local_minutes(np.array([to_timestamp(bar.datetime) for bar in BarDataList], dtype=np.int64),
+                                    BarDataList[0].datetime.tzinfo)
+            trade_days = jqdata_client.calendar.trade_days(BarDataList[0].datetime.date(),
+                                                           BarDataList[-1].datetime.date())
+            gaps = find_gaps(minutes, trade_days)
+            if gaps:
+                print('1分钟k线缺失：%s天，共%s根' % (len(gaps), sum(gaps.values())))
         time_start = time_end
-        i = 1
-        for bar in BarDataList:
-            print(f'bar number {i}, ratio: {round(i / len(BarDataList) * 100, 2)}%')
-            chan_strategy.on_bar(bar)
-            if self.state:
-                break
-            # if self.render_interval > 0 and i % self.render_interval == 0:
-            #     self.render_html(chan_strategy, setting['include'])
-            i += 1
+        # 历史K线批量计算，结果和逐根on_bar相同；从缓存恢复时只逐根处理新的K线
+        # 重新运行时run_chan设置self.state，中途停止，不完整的结果不保存
+        if not chan_strategy.on_bars(BarDataList, level_bars, cancel=lambda: self.state):
+            print('缠论计算已取消')
+            return
+        if BarDataList or level_bars:
+            chan_strategy.save_checkpoint(cache_path)
         self.render_html(chan_strategy, setting['include'])
         chan_map = chan_strategy.chan_freq_map
         for freq in chan_map:
@@ -134,30 +181,40 @@ class ChanTuManager(QtWidgets.QWidget):
         time_end = time.time()
         print('缠论计算 totally cost', time_end - time_start)
 
+    @staticmethod
+    def get_cache_path(chan_strategy, start_time, interval, native_levels=None) -> Path:
+        """缓存文件按股票代码、开始日期、策略参数和原生K线的级别区分"""
+        parameters = {name: str(value) for name, value in chan_strategy.get_parameters().items()}
+        parameters['interval'] = interval.value
+        if native_levels:
+            parameters['native_levels'] = {freq: str(start) for freq, start in native_levels.items()}
+        digest = hashlib.md5(json.dumps(parameters, sort_keys=True).encode()).hexdigest()[:12]
+        return get_folder_path('chan_cache').joinpath(f'{chan_strategy.vt_symbol}-{start_time}-{digest}.pkl')
+
     def render_html(self, chan_strategy, include=True):
         chan_map = chan_strategy.chan_freq_map
         for freq in chan_map:
-            klist = pd.DataFrame(columns=["date", "open", "close", "low", "high", "volume"], dtype=object)
             chan = chan_map[freq]
             format_str = '%Y-%m-%d %H:%M'
             if freq == FREQS[0]:
                 format_str = '%Y-%m-%d'
-            for k in chan.chan_k_list:
-                klist = klist.append({
-                    "date": k.datetime.strftime(format_str), "open": k.open_price, "close": k.close_price,
-                    "low": k.low_price,
-                    "high": k.high_price, "volume": k.volume
-                }, ignore_index=True)
+            # 直接使用chan_k_list的列数组视图，不逐根构造BarData
+            chan_k_list = chan.chan_k_list
+            klist = pd.DataFrame({
+                "date": [dt.strftime(format_str) for dt in chan_k_list.datetimes()],
+                "open": chan_k_list.open, "close": chan_k_list.close,
+                "low": chan_k_list.low, "high": chan_k_list.high, "volume": chan_k_list.volume
+            }, columns=["date", "open", "close", "low", "high", "volume"])
             bl = self.reFormatBS(chan.buy_list, format_str)
             sl = self.reFormatBS(chan.sell_list, format_str)
             if len(klist) <= 0:
                 continue
-            dif, dea, macd = tl.MACD(klist['close'].values, fastperiod=12, slowperiod=26, signalperiod=9)
+            # chan_k_list的MACD已经增量算好，不再对全部收盘价重跑talib
+            k_macd = chan.k_macd
             Macd = {}
-            macd *= 2
-            Macd['dif'] = dif.tolist()
-            Macd['dea'] = dea.tolist()
-            Macd['macd'] = macd.tolist()
+            Macd['dif'] = k_macd.dif
+            Macd['dea'] = k_macd.dea
+            Macd['macd'] = [v * 2 for v in k_macd.macd]
             Macd = json.dumps(Macd)
             self.ans = self.plot(
                 klist.to_json(orient='split'),
@@ -194,36 +251,36 @@ class ChanTuManager(QtWidgets.QWidget):
         s3_valid = set()
         s3_invalid = set()
         for data in buy:
-            if data[5] == 1:
-                if data[2] == 'B1':
-                    b1_valid.add(data[0])
-                if data[2] == 'B2':
-                    b2_valid.add(data[0])
-                if data[2] == 'B3':
-                    b3_valid.add(data[0])
+            if data.valid == 1:
+                if data.kind == B1:
+                    b1_valid.add(data.dt)
+                if data.kind == B2:
+                    b2_valid.add(data.dt)
+                if data.kind == B3:
+                    b3_valid.add(data.dt)
             else:
-                if data[2] == 'B1':
-                    b1_invalid.add(data[0])
-                if data[2] == 'B2':
-                    b2_invalid.add(data[0])
-                if data[2] == 'B3':
-                    b3_invalid.add(data[0])
+                if data.kind == B1:
+                    b1_invalid.add(data.dt)
+                if data.kind == B2:
+                    b2_invalid.add(data.dt)
+                if data.kind == B3:
+                    b3_invalid.add(data.dt)
 
         for data in sell:
-            if data[5] == 1:
-                if data[2] == 'S1':
-                    s1_valid.add(data[0])
-                if data[2] == 'S2':
-                    s2_valid.add(data[0])
-                if data[2] == 'S3':
-                    s3_valid.add(data[0])
+            if data.valid == 1:
+                if data.kind == S1:
+                    s1_valid.add(data.dt)
+                if data.kind == S2:
+                    s2_valid.add(data.dt)
+                if data.kind == S3:
+                    s3_valid.add(data.dt)
             else:
-                if data[2] == 'S1':
-                    s1_invalid.add(data[0])
-                if data[2] == 'S2':
-                    s2_invalid.add(data[0])
-                if data[2] == 'S3':
-                    s3_invalid.add(data[0])
+                if data.kind == S1:
+                    s1_invalid.add(data.dt)
+                if data.kind == S2:
+                    s2_invalid.add(data.dt)
+                if data.kind == S3:
+                    s3_invalid.add(data.dt)
         print(freq + ':')
         print("valid: B1\tB2\tB3")
         print(f'{len(b1_valid)}\t{len(b2_valid)}\t{len(b3_valid)}')
@@ -443,28 +500,29 @@ class ChanTuManager(QtWidgets.QWidget):
         reformatpivot = []
         for Item in pivot:
             reformatpivot.append(
-                [Item[0].strftime(format_str), Item[1].strftime(format_str), Item[2], Item[3]])
+                [Item.start.strftime(format_str), Item.end.strftime(format_str), Item.zd, Item.zg])
         return reformatpivot
 
     def reFormatLine(self, line, format_str):
         reformatline = []
         for Item in line:
-            if Item[3] == 'up':
-                reformatline.append([Item[2].strftime(format_str), Item[0]])
+            if Item.direction == UP:
+                reformatline.append([Item.dt.strftime(format_str), Item.high])
             else:
-                reformatline.append([Item[2].strftime(format_str), Item[1]])
+                reformatline.append([Item.dt.strftime(format_str), Item.low])
         return reformatline
 
     def reFormatBS(self, BS, format_str):
         rebs = []
         for bs in BS:
             valid = '有效'
-            if bs[5] == 0:
+            if bs.valid == 0:
                 valid = '无效'
-                rebs.append([bs[0].strftime(format_str), bs[1], bs[2], bs[3].strftime(format_str),
-                             valid + ':' + bs[6].strftime(format_str), bs[7], bs[8]])
+                rebs.append([bs.dt.strftime(format_str), bs.price, bs.name, bs.eval_dt.strftime(format_str),
+                             valid + ':' + bs.invalid_dt.strftime(format_str), bs.trend_type, bs.strength])
             else:
-                rebs.append([bs[0].strftime(format_str), bs[1], bs[2], bs[3].strftime(format_str), '', bs[7], bs[8]])
+                rebs.append([bs.dt.strftime(format_str), bs.price, bs.name, bs.eval_dt.strftime(format_str), '',
+                             bs.trend_type, bs.strength])
         return rebs
 
     def reFormatBuyAndSell(self, buy, sell):
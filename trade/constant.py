@@ -151,6 +151,8 @@ INTERVAL_FREQ = {
     '1m': '1分钟'
 }
 
+FREQ_INTERVAL = {freq: Interval(value) for value, freq in INTERVAL_FREQ.items()}
+
 STOPORDER_PREFIX = 'stop_order'
 
 PARAM_ZH_MAP = {'method': '交易方法', 'vt_symbol': '股票代码', 'symbol': '股票代码', 'strategy_name': '策略名称', 'include': 'K线包含',
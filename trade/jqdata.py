@@ -9,10 +9,14 @@ from numpy import ndarray
 import jqdatasdk as jq
 from trade.constant import Exchange, Interval
 from trade.object import BarData, HistoryRequest
+from trade.session import SessionCalendar
+from trade.utility import get_file_path
 from pathlib import Path
 
 INTERVAL_VT2RQ = {
     Interval.MINUTE: "1m",
+    Interval.MINUTE5: "5m",
+    Interval.MINUTE30: "30m",
     Interval.HOUR: "60m",
     Interval.DAILY: "1d",
 }
@@ -33,6 +37,8 @@ class JqdataClient:
 
         self.inited: bool = False
         self.symbols: ndarray = None
+        # 交易日历保存在本地，每天最多下载一次
+        self.calendar = SessionCalendar(self.load_trade_days, get_file_path('trade_days.json'))
 
     def init(self, username: str = "", password: str = "") -> bool:
         if self.inited:
@@ -188,12 +194,14 @@ class JqdataClient:
         # return self.query_bar_xq(vt_symbol)
 
 
+    def load_trade_days(self):
+        if not self.inited:
+            return None
+        return jq.get_all_trade_days()
+
     def is_trade_day(self) -> bool:
         yd = datetime.now() - timedelta(days=1)
-        days = jq.get_trade_days(start_date=yd.date(), end_date=None)
-        if days and len(days) > 0:
-            return True
-        return False
+        return len(self.calendar.trade_days(yd.date(), datetime.now().date())) > 0
 
     def query_history(self, req: HistoryRequest) -> Optional[List[BarData]]:
         # if self.symbols is None:
@@ -234,6 +242,9 @@ class JqdataClient:
         if df is not None:
             for ix, row in df.iterrows():
                 dt = row.name.to_pydatetime()
+                if interval == Interval.DAILY:
+                    # 日线时间取收盘时间，和1分钟K线合成的日线一致
+                    dt = dt.replace(hour=15)
                 dt = CHINA_TZ.localize(dt)
 
                 bar = BarData(
@@ -0,0 +1,209 @@
+"""
+A股交易日历和交易时段
+1. 1分钟K线按结束时间标记：上午09:31-11:30，下午13:01-15:00，每天240个slot(0-239)
+2. 一天中的第几分钟(0-1439)到slot的表预先算好，5/30/240分钟K线的序号为slot // window，查询O(1)，不解析字符串
+3. 交易日从数据源下载后保存在本地，同一天只下载一次，见SessionCalendar
+"""
+import bisect
+import datetime
+import json
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+SLOTS_PER_DAY = 240
+MINUTES_PER_DAY = 1440
+MORNING_START = 9 * 60 + 31
+AFTERNOON_START = 13 * 60 + 1
+
+# 一天中的第几分钟 -> slot，不在交易时段为-1
+MINUTE_SLOT = [-1] * MINUTES_PER_DAY
+for _i in range(SLOTS_PER_DAY // 2):
+    MINUTE_SLOT[MORNING_START + _i] = _i
+    MINUTE_SLOT[AFTERNOON_START + _i] = SLOTS_PER_DAY // 2 + _i
+MINUTE_SLOT_ARRAY = np.array(MINUTE_SLOT, dtype=np.int64)
+# slot -> 一天中的第几分钟
+SLOT_MINUTE = [MORNING_START + i for i in range(SLOTS_PER_DAY // 2)] + \
+              [AFTERNOON_START + i for i in range(SLOTS_PER_DAY // 2)]
+
+# check_run_time的时段，单位微秒，两端包含：9:30-11:32，13:00-15:02
+RUN_TIME = [((9 * 60 + 30) * 60000000, (11 * 60 + 32) * 60000000),
+            ((13 * 60) * 60000000, (15 * 60 + 2) * 60000000)]
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+NAIVE_EPOCH = datetime.datetime(1970, 1, 1)
+ONE_MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+def minute_slot(dt: datetime.datetime) -> int:
+    """1分钟K线的slot，不在交易时段为-1"""
+    return MINUTE_SLOT[dt.hour * 60 + dt.minute]
+
+
+def session_bucket(dt: datetime.datetime, window: int) -> int:
+    """
+    window分钟K线的序号，跨天连续编号：第几天 * 240 / window + slot // window
+    window需要整除120，日线为240；不在交易时段为-1
+    """
+    slot = MINUTE_SLOT[dt.hour * 60 + dt.minute]
+    if slot < 0:
+        return -1
+    return (dt.toordinal() * SLOTS_PER_DAY + slot) // window
+
+
+def is_bucket_end(dt: datetime.datetime, window: int) -> bool:
+    """是否是window分钟K线的最后一根1分钟K线"""
+    slot = MINUTE_SLOT[dt.hour * 60 + dt.minute]
+    return slot >= 0 and (slot + 1) % window == 0
+
+
+def is_run_time(dt: datetime.datetime) -> bool:
+    """是否在盘中，包括开盘前1分钟和收盘后2分钟"""
+    t = ((dt.hour * 60 + dt.minute) * 60 + dt.second) * 1000000 + dt.microsecond
+    for start, end in RUN_TIME:
+        if start <= t <= end:
+            return True
+    return False
+
+
+def to_timestamp(dt: datetime.datetime) -> int:
+    """datetime转为int64微秒时间戳，没有时区的datetime按本地时间原样换算"""
+    if dt.tzinfo is None:
+        return (dt - NAIVE_EPOCH) // ONE_MICROSECOND
+    return (dt - EPOCH) // ONE_MICROSECOND
+
+
+def to_datetime(ts: int, tzinfo=None) -> datetime.datetime:
+    """to_timestamp的逆运算"""
+    if tzinfo is None:
+        return NAIVE_EPOCH + datetime.timedelta(microseconds=ts)
+    return (EPOCH + datetime.timedelta(microseconds=ts)).astimezone(tzinfo)
+
+
+def local_minutes(timestamps: np.ndarray, tzinfo=None) -> np.ndarray:
+    """
+    BarBuffer的微秒时间戳转为本地时间的分钟数(从1970-01-01起)
+    带时区的时间戳是UTC，按tzinfo的utc偏移换算，A股所在时区现在没有夏令时，取固定的偏移
+    """
+    minutes = timestamps // 60000000
+    if tzinfo is not None:
+        minutes = minutes + int(tzinfo.utcoffset(datetime.datetime(2000, 1, 1)).total_seconds()) // 60
+    return minutes
+
+
+def session_slots(minutes: np.ndarray) -> np.ndarray:
+    """local_minutes的结果 -> slot，不在交易时段为-1"""
+    return MINUTE_SLOT_ARRAY[minutes % MINUTES_PER_DAY]
+
+
+def session_buckets(minutes: np.ndarray, window: int) -> np.ndarray:
+    """local_minutes的结果 -> session_bucket，不在交易时段为-1"""
+    slots = session_slots(minutes)
+    # 1970-01-01的toordinal为719163
+    days = minutes // MINUTES_PER_DAY + 719163
+    return np.where(slots >= 0, (days * SLOTS_PER_DAY + slots) // window, -1)
+
+
+def find_gaps(minutes: np.ndarray, trade_days: List[datetime.date] = None) -> Dict[datetime.date, int]:
+    """
+    缺失的1分钟K线，minutes为local_minutes的结果
+    返回{日期: 缺失根数}，只统计有K线的日期；给出trade_days时这段时间里没有K线的交易日缺240根
+    """
+    slots = session_slots(minutes)
+    days = minutes[slots >= 0] // MINUTES_PER_DAY
+    gaps = {}
+    if len(days):
+        day_list, counts = np.unique(days, return_counts=True)
+        epoch = datetime.date(1970, 1, 1)
+        for day, count in zip(day_list.tolist(), counts.tolist()):
+            if count < SLOTS_PER_DAY:
+                gaps[epoch + datetime.timedelta(days=day)] = SLOTS_PER_DAY - count
+        if trade_days:
+            present = {epoch + datetime.timedelta(days=day) for day in day_list.tolist()}
+            first = epoch + datetime.timedelta(days=day_list[0].item())
+            last = epoch + datetime.timedelta(days=day_list[-1].item())
+            for day in trade_days:
+                if first <= day <= last and day not in present:
+                    gaps[day] = SLOTS_PER_DAY
+    return gaps
+
+
+class SessionCalendar:
+    """
+    交易日历
+    loader()返回全部交易日(包括今年之后已经公布的)，数据源不可用时返回None；结果保存在path，每天最多下载一次
+    没有loader或者下载失败时，周一到周五都按交易日处理
+    """
+
+    def __init__(self, loader: Callable = None, path: Path = None):
+        self.loader = loader
+        self.path = path
+        self.days: List[datetime.date] = []
+        self.day_set = set()
+        self.updated: Optional[datetime.date] = None
+        self.loaded = False
+        # 本进程最后一次尝试下载的日期，下载失败当天也不再重试
+        self.checked: Optional[datetime.date] = None
+
+    def load(self) -> None:
+        """读取本地保存的交易日"""
+        self.loaded = True
+        if not self.path or not self.path.exists():
+            return
+        try:
+            with open(self.path, mode="r", encoding="UTF-8") as f:
+                data = json.load(f)
+            self.set_days([datetime.date.fromisoformat(day) for day in data["days"]])
+            self.updated = datetime.date.fromisoformat(data["updated"])
+        except (ValueError, KeyError) as e:
+            print("读取交易日历失败：", e)
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        data = {"updated": self.updated.isoformat(), "days": [day.isoformat() for day in self.days]}
+        with open(self.path, mode="w+", encoding="UTF-8") as f:
+            json.dump(data, f)
+
+    def set_days(self, days: list) -> None:
+        self.days = sorted(days)
+        self.day_set = set(self.days)
+
+    def refresh(self, today: datetime.date = None) -> None:
+        """本地的交易日不是今天下载的，重新下载"""
+        if not self.loaded:
+            self.load()
+        today = today or datetime.date.today()
+        if not self.loader or self.updated == today or self.checked == today:
+            return
+        self.checked = today
+        try:
+            days = self.loader()
+        except Exception as e:
+            print("下载交易日历失败：", e)
+            return
+        if days is None:
+            # 数据源还没有登录，之后再试
+            self.checked = None
+            return
+        self.set_days([day if type(day) is datetime.date else day.date() for day in days])
+        self.updated = today
+        self.save()
+
+    def covers(self, day: datetime.date) -> bool:
+        return bool(self.days) and self.days[0] <= day <= self.days[-1]
+
+    def is_trade_day(self, day: datetime.date) -> bool:
+        self.refresh()
+        if self.covers(day):
+            return day in self.day_set
+        return day.weekday() < 5
+
+    def trade_days(self, start: datetime.date, end: datetime.date) -> List[datetime.date]:
+        """[start, end]之间的交易日"""
+        self.refresh()
+        if not self.days:
+            return [start + datetime.timedelta(days=i) for i in range((end - start).days + 1)
+                    if (start + datetime.timedelta(days=i)).weekday() < 5]
+        return self.days[bisect.bisect_left(self.days, start):bisect.bisect_right(self.days, end)]
@@ -0,0 +1,372 @@
+from datetime import datetime
+
+import numpy as np
+
+from trade.object import BarData
+from trade.session import local_minutes, session_buckets, session_slots, to_timestamp, to_datetime
+
+
+class BarBuffer:
+    """
+    列式存储的K线序列，一个级别的k_list或chan_k_list
+    1. open/high/low/close/volume/open_interest为float64数组，datetime为int64微秒时间戳数组
+    2. 容量不够时成倍扩容，append均摊O(1)
+    3. open/high/low/close/volume/datetime属性返回有效长度的切片视图，不复制数据
+    4. 下标访问返回BarData，兼容原来list[BarData]的用法；热点代码直接读写数组
+    symbol/exchange/interval/时区对整个序列只存一份
+    """
+
+    ARRAY_NAMES = ["open_array", "high_array", "low_array", "close_array", "volume_array", "open_interest_array",
+                   "datetime_array"]
+
+    def __init__(self, capacity: int = 1024):
+        self.size: int = 0
+        self.capacity: int = max(capacity, 1)
+
+        self.symbol: str = ""
+        self.exchange = None
+        self.interval = None
+        self.tzinfo = None
+
+        self.open_array: np.ndarray = np.zeros(self.capacity)
+        self.high_array: np.ndarray = np.zeros(self.capacity)
+        self.low_array: np.ndarray = np.zeros(self.capacity)
+        self.close_array: np.ndarray = np.zeros(self.capacity)
+        self.volume_array: np.ndarray = np.zeros(self.capacity)
+        self.open_interest_array: np.ndarray = np.zeros(self.capacity)
+        self.datetime_array: np.ndarray = np.zeros(self.capacity, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getstate__(self) -> dict:
+        """只保存有效长度的数据"""
+        state = self.__dict__.copy()
+        for name in self.ARRAY_NAMES:
+            state[name] = state[name][:self.size].copy()
+        state["capacity"] = self.size
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        if not self.size:
+            self.capacity = 1
+            for name in self.ARRAY_NAMES:
+                setattr(self, name, np.zeros(1, dtype=getattr(self, name).dtype))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.get_bar(i) for i in range(*index.indices(self.size))]
+        return self.get_bar(self.check_index(index))
+
+    def __setitem__(self, index: int, bar: BarData) -> None:
+        self.set_bar(self.check_index(index), bar)
+
+    def __iter__(self):
+        for i in range(self.size):
+            yield self.get_bar(i)
+
+    def check_index(self, index: int) -> int:
+        if index < 0:
+            index += self.size
+        if index < 0 or index >= self.size:
+            raise IndexError("BarBuffer index out of range")
+        return index
+
+    def reserve(self, capacity: int) -> None:
+        """扩容到至少capacity"""
+        if capacity <= self.capacity:
+            return
+        new_capacity = self.capacity
+        while new_capacity < capacity:
+            new_capacity *= 2
+        for name in self.ARRAY_NAMES:
+            old = getattr(self, name)
+            new = np.zeros(new_capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+        self.capacity = new_capacity
+
+    def append(self, bar: BarData) -> None:
+        if not self.size:
+            self.symbol = bar.symbol
+            self.exchange = bar.exchange
+            self.interval = bar.interval
+            self.tzinfo = bar.datetime.tzinfo
+        if self.size == self.capacity:
+            self.reserve(self.size + 1)
+        self.size += 1
+        self.set_bar(self.size - 1, bar)
+
+    def extend(self, bars: list) -> None:
+        """批量追加BarData"""
+        if not bars:
+            return
+        if not self.size:
+            bar = bars[0]
+            self.symbol = bar.symbol
+            self.exchange = bar.exchange
+            self.interval = bar.interval
+            self.tzinfo = bar.datetime.tzinfo
+        start = self.size
+        end = start + len(bars)
+        self.reserve(end)
+        self.open_array[start:end] = [bar.open_price for bar in bars]
+        self.high_array[start:end] = [bar.high_price for bar in bars]
+        self.low_array[start:end] = [bar.low_price for bar in bars]
+        self.close_array[start:end] = [bar.close_price for bar in bars]
+        self.volume_array[start:end] = [bar.volume for bar in bars]
+        self.open_interest_array[start:end] = [bar.open_interest for bar in bars]
+        self.datetime_array[start:end] = [to_timestamp(bar.datetime) for bar in bars]
+        self.size = end
+
+    def extend_buffer(self, source: "BarBuffer") -> None:
+        """批量追加另一个BarBuffer的全部K线"""
+        if not source.size:
+            return
+        if not self.size:
+            self.symbol = source.symbol
+            self.exchange = source.exchange
+            self.interval = source.interval
+            self.tzinfo = source.tzinfo
+        start = self.size
+        end = start + source.size
+        self.reserve(end)
+        for name in self.ARRAY_NAMES:
+            getattr(self, name)[start:end] = getattr(source, name)[:source.size]
+        self.size = end
+
+    def extend_merged(self, source: "BarBuffer", src: np.ndarray, open: np.ndarray, high: np.ndarray,
+                      low: np.ndarray, close: np.ndarray) -> None:
+        """
+        批量追加包含处理后的K线，见chan_batch.merge_k
+        价格用合并后的值，datetime/volume/open_interest取source中下标为src的K线
+        """
+        if not len(src):
+            return
+        if not self.size:
+            self.symbol = source.symbol
+            self.exchange = source.exchange
+            self.interval = source.interval
+            self.tzinfo = source.tzinfo
+        start = self.size
+        end = start + len(src)
+        self.reserve(end)
+        self.open_array[start:end] = open
+        self.high_array[start:end] = high
+        self.low_array[start:end] = low
+        self.close_array[start:end] = close
+        self.volume_array[start:end] = source.volume_array[src]
+        self.open_interest_array[start:end] = source.open_interest_array[src]
+        self.datetime_array[start:end] = source.datetime_array[src]
+        self.size = end
+
+    def trim(self, count: int) -> None:
+        """丢弃前count根K线，之后的下标都减count"""
+        count = min(count, self.size)
+        if count <= 0:
+            return
+        size = self.size - count
+        for name in self.ARRAY_NAMES:
+            array = getattr(self, name)
+            array[:size] = array[count:self.size]
+        self.size = size
+
+    def set_bar(self, i: int, bar: BarData) -> None:
+        self.open_array[i] = bar.open_price
+        self.high_array[i] = bar.high_price
+        self.low_array[i] = bar.low_price
+        self.close_array[i] = bar.close_price
+        self.volume_array[i] = bar.volume
+        self.open_interest_array[i] = bar.open_interest
+        self.datetime_array[i] = to_timestamp(bar.datetime)
+
+    def set_merged(self, i: int, bar: BarData, open: float, high: float, low: float, close: float) -> None:
+        """包含处理后原地改写第i根K线：价格用合并后的值，datetime/volume/open_interest取bar的"""
+        self.open_array[i] = open
+        self.high_array[i] = high
+        self.low_array[i] = low
+        self.close_array[i] = close
+        self.volume_array[i] = bar.volume
+        self.open_interest_array[i] = bar.open_interest
+        self.datetime_array[i] = to_timestamp(bar.datetime)
+
+    def get_bar(self, i: int) -> BarData:
+        return BarData(
+            symbol=self.symbol,
+            exchange=self.exchange,
+            interval=self.interval,
+            datetime=to_datetime(self.datetime_array.item(i), self.tzinfo),
+            open_price=self.open_array.item(i),
+            high_price=self.high_array.item(i),
+            low_price=self.low_array.item(i),
+            close_price=self.close_array.item(i),
+            volume=self.volume_array.item(i),
+            open_interest=self.open_interest_array.item(i)
+        )
+
+    def datetime_at(self, index: int) -> datetime:
+        """只取datetime，不构造BarData"""
+        return to_datetime(self.datetime_array.item(self.check_index(index)), self.tzinfo)
+
+    @property
+    def open(self) -> np.ndarray:
+        return self.open_array[:self.size]
+
+    @property
+    def high(self) -> np.ndarray:
+        return self.high_array[:self.size]
+
+    @property
+    def low(self) -> np.ndarray:
+        return self.low_array[:self.size]
+
+    @property
+    def close(self) -> np.ndarray:
+        return self.close_array[:self.size]
+
+    @property
+    def volume(self) -> np.ndarray:
+        return self.volume_array[:self.size]
+
+    @property
+    def open_interest(self) -> np.ndarray:
+        return self.open_interest_array[:self.size]
+
+    @property
+    def datetime(self) -> np.ndarray:
+        return self.datetime_array[:self.size]
+
+    def datetimes(self) -> list:
+        """全部K线的datetime，给图表和导出使用"""
+        return [to_datetime(ts, self.tzinfo) for ts in self.datetime.tolist()]
+
+
+class IndexMap:
+    """
+    以chan_k_list下标为key的映射，代替以datetime或str(datetime)为key的dict
+    1. 分型的dt和index一一对应，key直接用Fx.index，不做字符串格式化和哈希
+    2. 值存在numpy数组里，没有写入过的位置返回default
+    3. 下标超出容量时成倍扩容，trim()和BarBuffer.trim()一起丢弃前面的数据
+    4. version为值改变的次数，写入相同的值不计
+    """
+
+    def __init__(self, default=0, dtype=np.float64, capacity: int = 1024):
+        self.default = default
+        self.size: int = 0
+        self.version: int = 0
+        self.array: np.ndarray = np.full(max(capacity, 1), default, dtype=dtype)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getstate__(self) -> dict:
+        """只保存写入过的范围"""
+        state = self.__dict__.copy()
+        state["array"] = self.array[:max(self.size, 1)].copy()
+        return state
+
+    def __getitem__(self, index: int):
+        if index < self.size:
+            return self.array.item(index)
+        return self.default
+
+    def __setitem__(self, index: int, value) -> None:
+        if index >= len(self.array):
+            capacity = len(self.array)
+            while capacity <= index:
+                capacity *= 2
+            array = np.full(capacity, self.default, dtype=self.array.dtype)
+            array[:self.size] = self.array[:self.size]
+            self.array = array
+        old = self.array.item(index)
+        self.array[index] = value
+        new = self.array.item(index)
+        if old != new and (old == old or new == new):
+            self.version += 1
+        if index >= self.size:
+            self.size = index + 1
+
+    def items(self):
+        """写入过且不等于default的(index, value)"""
+        values = self.array[:self.size]
+        index = np.nonzero(values != self.default)[0]
+        return zip(index.tolist(), values[index].tolist())
+
+    def trim(self, count: int) -> None:
+        """丢弃前count个位置，之后的下标都减count"""
+        count = min(count, self.size)
+        if count <= 0:
+            return
+        size = self.size - count
+        self.array[:size] = self.array[count:self.size]
+        self.array[size:self.size] = self.default
+        self.size = size
+        self.version += 1
+
+
+def resample(source: BarBuffer, window: int, interval, start: int = 0, session: bool = False) -> tuple:
+    """
+    从第start根开始，1分钟K线合成window分钟的K线，结果和BarGenerator(window, Interval.MINUTE, session=session)
+    逐根update_bar相同：open取第一根，high/low取极值，close/open_interest取最后一根，volume为int(volume)之和，
+    datetime为最后一根去掉秒
+    session=False按根数切分：A股每天240根1分钟K线，上下午各120根，5/30/240都能整除，数据完整时就是按交易时段对齐
+    session=True按交易时段切分，见trade.session：时段的最后一分钟完成，缺了最后几分钟时下一个时段的第一根到来时完成
+    返回(bars, end, rest)：bars为完成的K线，end[i]为第i根K线完成时的1分钟K线下标，
+    rest为没有完成的第一根1分钟K线的下标，之后的交给BarGenerator
+    """
+    if session:
+        first, last, end = session_windows(source, window, start)
+    else:
+        count = (len(source) - start) // window
+        last = np.arange(1, count + 1, dtype=np.int64) * window - 1 + start
+        first = last - (window - 1)
+        end = last
+    count = len(first)
+    rest = last[-1].item() + 1 if count else start
+
+    bars = BarBuffer(max(count, 1))
+    bars.symbol = source.symbol
+    bars.exchange = source.exchange
+    bars.interval = interval
+    bars.tzinfo = source.tzinfo
+    if not count:
+        return bars, end, rest
+    offset = first - start
+    bars.open_array[:count] = source.open_array[first]
+    bars.high_array[:count] = np.maximum.reduceat(source.high_array[start:rest], offset)
+    bars.low_array[:count] = np.minimum.reduceat(source.low_array[start:rest], offset)
+    bars.close_array[:count] = source.close_array[last]
+    bars.volume_array[:count] = np.add.reduceat(np.trunc(source.volume_array[start:rest]), offset)
+    bars.open_interest_array[:count] = source.open_interest_array[last]
+    dt = source.datetime_array[last]
+    bars.datetime_array[:count] = dt - dt % 60000000
+    bars.size = count
+    return bars, end, rest
+
+
+def session_windows(source: BarBuffer, window: int, start: int) -> tuple:
+    """
+    按交易时段切分，返回完成的K线的(第一根下标, 最后一根下标, 完成时的下标)
+    不在交易时段的1分钟K线并入前一根K线
+    """
+    minutes = local_minutes(source.datetime_array[start:len(source)], source.tzinfo)
+    n = len(minutes)
+    if not n:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    bucket = session_buckets(minutes, window)
+    slot = session_slots(minutes)
+    prev = np.maximum.accumulate(np.where(bucket >= 0, np.arange(n), -1))
+    bucket = np.where(prev >= 0, bucket[np.maximum(prev, 0)], -1)
+    bucket_end = (slot >= 0) & ((slot + 1) % window == 0)
+
+    new = np.ones(n, dtype=bool)
+    new[1:] = (bucket[1:] != bucket[:-1]) | bucket_end[:-1]
+    first = np.flatnonzero(new)
+    last = np.append(first[1:] - 1, n - 1)
+    done = bucket_end[last]
+    # 最后一根K线没到时段的最后一分钟，还没有完成
+    count = len(first) if done[-1] else len(first) - 1
+    end = np.where(done[:count], last[:count], np.append(first[1:], n)[:count])
+    return first[:count] + start, last[:count] + start, end + start
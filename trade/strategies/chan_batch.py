@@ -0,0 +1,234 @@
+"""
+历史K线的批量计算，结果和Chan_Class逐根处理相同
+1. merge_k：包含处理，一次循环得到合并后的K线，以及每根原始K线处理完时chan_k_list的长度和最后一根的高低点
+2. find_fx：用1的结果向量化判断每一步形成的分型
+3. ChanBatch/replay_levels：按分型形成的先后回放笔、线段、中枢，得到和逐根处理相同的状态，之后继续增量计算
+包含处理依赖上一根合并后的K线，只能顺序计算，循环里只做浮点比较，不构造BarData
+"""
+import bisect
+import heapq
+
+import numpy as np
+
+from .chan_array import BarBuffer
+from .chan_object import Fx, UP, DOWN, DELTA_FX
+
+
+def merge_k(open, high, low, close, include=True):
+    """
+    包含处理
+    返回(open, high, low, close, src, k_len, last_high, last_low)
+    open/high/low/close：合并后的K线
+    src：合并后每根K线最后一次写入时的原始K线下标，datetime和volume取这根K线的
+    k_len[t]：处理完第t根原始K线时chan_k_list的长度
+    last_high[t]/last_low[t]：此时chan_k_list最后一根的高低点，之后可能还会被合并改写
+    """
+    n = len(high)
+    if not include:
+        src = np.arange(n)
+        return (np.array(open, dtype=float), np.array(high, dtype=float), np.array(low, dtype=float),
+                np.array(close, dtype=float), src, src + 1, np.array(high, dtype=float), np.array(low, dtype=float))
+
+    o_list = open.tolist()
+    h_list = high.tolist()
+    l_list = low.tolist()
+    c_list = close.tolist()
+
+    k_o = []
+    k_h = []
+    k_l = []
+    k_c = []
+    src = []
+    k_len = np.zeros(n, dtype=np.int64)
+    last_high = np.zeros(n)
+    last_low = np.zeros(n)
+
+    for t in range(n):
+        bar_h = h_list[t]
+        bar_l = l_list[t]
+        if len(k_h) < 2:
+            k_o.append(o_list[t])
+            k_h.append(bar_h)
+            k_l.append(bar_l)
+            k_c.append(c_list[t])
+            src.append(t)
+        else:
+            pre_high = k_h[-2]
+            k_high = k_h[-1]
+            k_low = k_l[-1]
+            if (k_high >= bar_h and k_low <= bar_l) or (k_high <= bar_h and k_low >= bar_l):
+                if k_high > pre_high:
+                    k_h[-1] = max(k_high, bar_h)
+                    k_l[-1] = max(k_low, bar_l)
+                    k_o[-1] = max(k_o[-1], o_list[t])
+                    k_c[-1] = max(k_c[-1], c_list[t])
+                else:
+                    k_h[-1] = min(k_high, bar_h)
+                    k_l[-1] = min(k_low, bar_l)
+                    k_o[-1] = min(k_o[-1], o_list[t])
+                    k_c[-1] = min(k_c[-1], c_list[t])
+                src[-1] = t
+            else:
+                k_o.append(o_list[t])
+                k_h.append(bar_h)
+                k_l.append(bar_l)
+                k_c.append(c_list[t])
+                src.append(t)
+        k_len[t] = len(k_h)
+        last_high[t] = k_h[-1]
+        last_low[t] = k_l[-1]
+
+    return (np.array(k_o), np.array(k_h), np.array(k_l), np.array(k_c), np.array(src, dtype=np.int64), k_len,
+            last_high, last_low)
+
+
+def find_fx(high, low, k_len, last_high, last_low):
+    """
+    分型判断，high/low为合并后的K线，其余参数见merge_k
+    第t根原始K线处理完时判断倒数第二根chan K线，它之前的K线不会再变，最后一根取当时的值
+    返回(t, index, direction, notify)，按形成的先后排序，同一步先顶后底
+    notify为这一步最后形成的分型，只有它会进入笔的计算
+    """
+    steps = np.nonzero(k_len > 2)[0]
+    mid = k_len[steps] - 2
+    pre = mid - 1
+    top = (high[mid] >= last_high[steps]) & (high[mid] >= high[pre])
+    bottom = (low[mid] <= last_low[steps]) & (low[mid] <= low[pre])
+
+    # 每一步最多两个分型，顶在前底在后
+    t = np.stack([steps, steps], axis=1).ravel()
+    index = np.stack([mid, mid], axis=1).ravel()
+    direction = np.tile(np.array([UP, DOWN]), len(steps))
+    mask = np.stack([top, bottom], axis=1).ravel()
+    notify = np.stack([top & ~bottom, bottom], axis=1).ravel()
+    return t[mask], index[mask], direction[mask], notify[mask]
+
+
+class ChanBatch:
+    """
+    一个级别的历史K线批量计算
+    载入时算完k_list、chan_k_list、MACD和分型表，replay()再按分型形成的先后回放笔、线段、中枢的计算
+    回放时用seek()把K线序列退回到分型形成的那一步，买卖点的评估时间、下单价格和逐根处理时相同
+    bars为list[BarData]或BarBuffer
+    """
+
+    def __init__(self, chan, bars):
+        self.chan = chan
+        k_list = chan.k_list
+        chan_k_list = chan.chan_k_list
+        if isinstance(bars, BarBuffer):
+            k_list.extend_buffer(bars)
+        else:
+            k_list.extend(bars)
+        open, high, low, close, src, k_len, last_high, last_low = merge_k(
+            k_list.open, k_list.high, k_list.low, k_list.close, chan.include)
+        chan_k_list.extend_merged(k_list, src, open, high, low, close)
+        chan.k_macd.extend(close.tolist())
+
+        self.n = len(k_list)
+        self.k_size = len(chan_k_list)
+        self.src = src
+        self.k_len = k_len.tolist()
+        self.high = high.tolist()
+        self.low = low.tolist()
+        self.fx_table = find_fx(high, low, k_len, last_high, last_low)
+        # seek()退回到的原始K线根数，以及改写了datetime的chan K线下标
+        self.size = self.n
+        self.dt_index = -1
+
+    def seek(self, size):
+        """K线序列退回到前size根原始K线刚处理完的状态，最后一根chan K线的datetime是当时原始K线的"""
+        size = min(size, self.n)
+        if size == self.size:
+            return
+        self.size = size
+        k_list = self.chan.k_list
+        chan_k_list = self.chan.chan_k_list
+        chan_dt = chan_k_list.datetime_array
+        if self.dt_index >= 0:
+            chan_dt[self.dt_index] = k_list.datetime_array[self.src[self.dt_index]]
+            self.dt_index = -1
+        if size == self.n:
+            k_list.size = self.n
+            chan_k_list.size = self.k_size
+            return
+        k_list.size = size
+        chan_k_list.size = self.k_len[size - 1] if size else 0
+        if chan_k_list.size:
+            self.dt_index = chan_k_list.size - 1
+            chan_dt[self.dt_index] = k_list.datetime_array[size - 1]
+
+    def retain(self):
+        """回放结束后按keep_pivots丢弃旧数据，回放时K线序列要保持完整，不能丢弃，见Chan_Class.on_retain"""
+        self.seek(self.n)
+        if self.chan.keep_pivots:
+            self.chan.on_retain()
+
+    def replay(self):
+        """
+        生成器，每次先yield下一个进入笔计算的分型所在的原始K线下标，恢复后再计算它
+        单独一个级别直接遍历即可，多个级别见replay_levels
+        """
+        chan = self.chan
+        k_list = chan.k_list
+        k_len = self.k_len
+        log_merge = chan.include and chan.is_log_enabled()
+        merge_t = 2
+        for t, index, direction, notify in zip(*[column.tolist() for column in self.fx_table]):
+            if log_merge:
+                while merge_t <= t:
+                    if k_len[merge_t] == k_len[merge_t - 1]:
+                        chan.log("combine k line: %s", k_list.datetime_at(merge_t))
+                    merge_t += 1
+            fx = Fx(self.high[index], self.low[index], chan.chan_k_list.datetime_at(index), direction, index)
+            chan.fx_list.append(fx)
+            chan.emit(DELTA_FX, fx, len(chan.fx_list) - 1)
+            if notify:
+                yield t
+                self.seek(t + 1)
+                chan.on_stroke(fx)
+                self.seek(self.n)
+                chan.log("fx_list: ")
+                chan.log(fx)
+        if log_merge:
+            while merge_t < self.n:
+                if k_len[merge_t] == k_len[merge_t - 1]:
+                    chan.log("combine k line: %s", k_list.datetime_at(merge_t))
+                merge_t += 1
+
+
+def replay_levels(batches, steps, cancel=None):
+    """
+    多个级别按时间先后交替回放
+    batches：从高到低级别的ChanBatch，同一根1分钟K线上先处理高级别
+    steps[i]：batches[i]每根K线是在第几根1分钟K线处理时生成的
+    区间套要读低级别的笔和chan K线，回放某个级别前把低级别都退回到同一时刻
+    高级别只有共振会读，批量计算不支持共振
+    cancel()返回True时停止回放，返回False，这时的状态不完整
+    全部级别回放完才按keep_pivots丢弃旧数据，见ChanBatch.retain
+    """
+    heap = []
+    for order, batch in enumerate(batches):
+        events = batch.replay()
+        t = next(events, None)
+        if t is not None:
+            heapq.heappush(heap, (steps[order][t], order, events))
+
+    cancelled = False
+    while heap:
+        if cancel and cancel():
+            cancelled = True
+            break
+        step, order, events = heapq.heappop(heap)
+        for other in range(order + 1, len(batches)):
+            batches[other].seek(bisect.bisect_left(steps[other], step))
+        t = next(events, None)
+        if t is not None:
+            heapq.heappush(heap, (steps[order][t], order, events))
+
+    for batch in batches:
+        if cancelled:
+            batch.seek(batch.n)
+        else:
+            batch.retain()
+    return not cancelled
@@ -1,37 +1,54 @@
 import math
-import talib as tl
-from trade.object import BarData
-from copy import copy
+
 import numpy as np
-from trade.chanlog import ChanLog
+from trade.object import BarData
+from trade.chanlog import ChanLog, DEBUG, INFO, OFF
+from .chan_macd import ChanMacd
+from .chan_array import BarBuffer, IndexMap
+from .chan_batch import ChanBatch
+from .chan_segment import FeatureSegment, SEGMENT_APPEND, SEGMENT_REMOVE
+from .chan_object import Fx, FxList, BsPoint, Pivot, QjtEvidence, FixedTime, ChanDelta, UP, DOWN, B1, B2, B3, S1, S2, S3
+from .chan_object import DELTA_FX, DELTA_STROKE_APPEND, DELTA_STROKE_EXTEND, DELTA_STROKE_REPLACE, DELTA_LINE_APPEND, \
+    DELTA_LINE_EXTEND, DELTA_LINE_REPLACE, DELTA_LINE_REMOVE, DELTA_PIVOT_CREATE, DELTA_PIVOT_UPDATE, DELTA_PIVOT_REMOVE, \
+    DELTA_BS_CREATE, DELTA_BS_INVALID, DELTA_RETAIN, PIVOT_DELTAS, STROKE_DELTAS, LINE_DELTAS
 
 
 class Chan_Class:
 
     def __init__(self, freq, symbol, sell, buy, include=True, include_feature=False, build_pivot=False, qjt=True,
-                 gz=False, buy1=100, buy2=200, buy3=200, sell1=100, sell2=200, sell3=200):
+                 gz=False, buy1=100, buy2=200, buy3=200, sell1=100, sell2=200, sell3=200, keep_pivots=None,
+                 log_level=None):
 
         self.freq = freq
         self.symbol = symbol
+        # 这个级别的日志级别，None为ChanLog.level，见log
+        self.log_level = ChanLog.level if log_level is None else log_level
         self.prev = None
         self.next = None
-        self.k_list = []
-        self.chan_k_list = []
+        # K线列式存储，见BarBuffer
+        self.k_list = BarBuffer()
+        self.chan_k_list = BarBuffer()
         self.fx_list = []
-        self.stroke_list = []
+        self.stroke_list = FxList()
         self.stroke_index_in_k = {}
-        self.line_list = []
-        self.line_index = {}
+        self.line_list = FxList()
+        # 线段分型在stroke_list中的位置，key为分型的chan_k_list下标，见IndexMap
+        self.line_index = IndexMap(-1, np.int64)
         self.line_index_in_k = {}
-        self.line_feature = []
-        self.s_feature = []
-        self.x_feature = []
+        # 特征序列划分线段，include_feature=True时使用，见FeatureSegment
+        self.line_feature = FeatureSegment()
+        # 已输入line_feature的笔端点数，on_retain丢弃的笔数，两者都是绝对位置
+        self.feature_pos = 0
+        self.stroke_drop = 0
 
         self.pivot_list = []
         self.trend_list = []
         self.buy_list = []
         self.sell_list = []
-        self.macd = {}
+        # 笔/线段的MACD面积，key为结束分型的chan_k_list下标
+        self.macd = IndexMap()
+        # chan_k_list的增量MACD，包含处理改写最后一根K线时同步更新
+        self.k_macd = ChanMacd()
         self.buy = buy
         self.sell = sell
         self.buy1 = buy1
@@ -64,13 +81,83 @@ class Chan_Class:
         self.gz_tmp_bs = None
         # 高级别bs
         self.gz_prev_last_bs = None
+        # 上一个级别最新的买点，由subscribe_gz订阅更新，不再每根K线读prev.buy_list
+        self.gz_last_bs = None
+        # 只保留最近keep_pivots个中枢用到的数据，None为全部保留，见on_retain
+        self.keep_pivots = keep_pivots
+        # 结构变化的订阅者，见subscribe
+        self.listeners = []
+        # 中枢和买卖点的变化次数，只增不减，见on_pivot
+        self.pivot_version = 0
+        # 上次on_pivot之后stroke_list/line_list被改写的最小下标，None为没有改写
+        self.stroke_dirty = None
+        self.line_dirty = None
+        # 上次计算开始时的(pivot_version, macd.version, type)，以及区间套读到的低级别K线状态
+        self.pivot_state = None
+        self.pivot_lower = None
+        self.pivot_calls = 0
+        self.pivot_skips = 0
+
+    def __getstate__(self):
+        """快照不保存下单回调，恢复后由Chan_Strategy重新设置"""
+        state = self.__dict__.copy()
+        state['buy'] = None
+        state['sell'] = None
+        state['listeners'] = []
+        return state
+
+    def log(self, data, *args, level=DEBUG):
+        """按这个级别自己的log_level写日志，同一进程里的其他策略不受影响，见ChanLog"""
+        if level < self.log_level:
+            return
+        ChanLog.write(self.freq, self.symbol, data, *args)
+
+    def is_log_enabled(self, level=DEBUG):
+        return level >= self.log_level
 
     def set_prev(self, chan):
         self.prev = chan
+        self.subscribe_gz()
 
     def set_next(self, chan):
         self.next = chan
 
+    def subscribe_gz(self):
+        """
+        共振：订阅上一个级别新增的买点，set_prev时自动调用；
+        set_prev之后才打开gz或者快照恢复后需要再调用，重复调用不会重复订阅
+        """
+        if not self.gz or not self.prev:
+            return
+        self.gz_last_bs = self.prev.buy_list[-1] if self.prev.buy_list else None
+        if self.on_prev_delta not in self.prev.listeners:
+            self.prev.subscribe(self.on_prev_delta)
+
+    def on_prev_delta(self, delta):
+        if delta.kind == DELTA_BS_CREATE and delta.data.kind > 0:
+            self.gz_last_bs = delta.data
+
+    def subscribe(self, listener):
+        """订阅分型、笔、线段、中枢和买卖点的变化，listener(delta: ChanDelta)，快照恢复后需要重新订阅"""
+        self.listeners.append(listener)
+
+    def emit(self, kind, data, index=None):
+        if kind in STROKE_DELTAS:
+            self.stroke_dirty = index if self.stroke_dirty is None else min(self.stroke_dirty, index)
+        elif kind in LINE_DELTAS:
+            self.line_dirty = index if self.line_dirty is None else min(self.line_dirty, index)
+        elif kind in PIVOT_DELTAS:
+            self.pivot_version += 1
+            if kind == DELTA_RETAIN:
+                # 丢弃前面的数据后下标都变了
+                self.stroke_dirty = 0
+                self.line_dirty = 0
+        if not self.listeners:
+            return
+        delta = ChanDelta(kind, data, index)
+        for listener in self.listeners:
+            listener(delta)
+
     def on_bar(self, bar: BarData):
         self.k_list.append(bar)
         if self.gz and self.gz_tmp_bs:
@@ -80,89 +167,218 @@ class Chan_Class:
             self.on_process_k_include(bar)
         else:
             self.on_process_k_no_include(bar)
+        if self.keep_pivots and len(self.pivot_list) >= 2 * self.keep_pivots:
+            self.on_retain()
+
+    def on_bars(self, bars):
+        """
+        批量处理历史K线，结果和逐根调用on_bar相同，之后可以继续on_bar，见ChanBatch
+        共振和区间套要读其他级别同一时刻的状态，这种情况以及已有数据时逐根处理，多级别见Chan_Strategy.on_bars
+        """
+        if len(self.k_list) or self.gz or self.next:
+            for bar in bars:
+                self.on_bar(bar)
+            return
+        batch = ChanBatch(self, bars)
+        for _ in batch.replay():
+            pass
+        batch.retain()
+
+    def on_retain(self):
+        """
+        长时间实盘运行时限制内存：丢弃最近keep_pivots个中枢之前的中枢、笔、线段、分型、K线、MACD和买卖点
+        保留的数据里的下标同时修正：
+        Fx.index(chan_k_list)，Pivot.enter/exit和BsPoint.pos(构成中枢的笔或线段)，line_index(笔)，trend_list(中枢)
+        保留范围覆盖中枢、买卖点、笔/线段修正和背驰判断用到的数据，所以之后的计算结果不变；
+        区间套会往前读低级别的笔，低级别的keep_pivots要足够覆盖高级别的一笔
+        """
+        pivot_drop = len(self.pivot_list) - self.keep_pivots
+        if pivot_drop <= 0:
+            return
+        data = self.line_list if self.build_pivot else self.stroke_list
+        # 构成中枢的笔/线段：保留中枢进入段的前一段和买卖点所在段的前一段
+        data_cut = len(data) - 6
+        for pivot in self.pivot_list[pivot_drop:]:
+            data_cut = min(data_cut, pivot.enter - 1)
+            for bs in pivot.buy + pivot.sell:
+                if bs:
+                    data_cut = min(data_cut, bs.pos - 1)
+        if data_cut <= 0:
+            return
+
+        # 笔：保留线段修正往回找到的笔
+        stroke_cut = len(self.stroke_list) - 6
+        if len(self.line_list) > 1:
+            stroke_cut = min(stroke_cut, self.line_index[self.line_list[-2].index] - 2)
+        if self.build_pivot:
+            stroke_cut = min(stroke_cut, self.line_index[self.line_list[data_cut].index] - 2)
+            line_cut = data_cut
+        else:
+            stroke_cut = min(stroke_cut, data_cut)
+            line_cut = 0
+            while line_cut < len(self.line_list) and \
+                    self.line_index[self.line_list[line_cut].index] < stroke_cut:
+                line_cut += 1
+        if stroke_cut <= 0:
+            return
+        pos_cut = line_cut if self.build_pivot else stroke_cut
+
+        # chan K线：保留笔和线段的分型所在的K线
+        k_cut = self.stroke_list[stroke_cut].index
+        cut_dt = self.stroke_list[stroke_cut].dt
+        if line_cut < len(self.line_list):
+            k_cut = min(k_cut, self.line_list[line_cut].index)
+            cut_dt = min(cut_dt, self.line_list[line_cut].dt)
+        if k_cut <= 0 or len(self.k_macd) + self.k_macd.offset <= self.k_macd.start + 1:
+            return
+        fx_cut = 0
+        while fx_cut < len(self.fx_list) and self.fx_list[fx_cut].index < k_cut:
+            fx_cut += 1
+
+        # 中枢和走势
+        del self.pivot_list[:pivot_drop]
+        for trend in self.trend_list:
+            trend[4] = [i - pivot_drop for i in trend[4] if i >= pivot_drop]
+        self.trend_list = [trend for trend in self.trend_list if trend[4]]
+
+        # 买卖点，至少保留最后一个，共振会读
+        self.buy_list = [bs for bs in self.buy_list[:-1] if bs.dt >= cut_dt] + self.buy_list[-1:]
+        self.sell_list = [bs for bs in self.sell_list[:-1] if bs.dt >= cut_dt] + self.sell_list[-1:]
+        bs_set = {}
+        for pivot in self.pivot_list:
+            for bs in pivot.buy + pivot.sell:
+                if bs:
+                    bs_set[id(bs)] = bs
+        for bs in self.buy_list + self.sell_list:
+            bs_set[id(bs)] = bs
+        for bs in bs_set.values():
+            bs.pos -= pos_cut
+        for pivot in self.pivot_list:
+            pivot.enter -= pos_cut
+            pivot.exit -= pos_cut
+
+        # 笔、线段和分型
+        if self.include_feature and line_cut < len(self.line_list):
+            # 特征序列只保留还在line_list里的线段，之前的不再延伸
+            self.line_feature.trim(self.line_index[self.line_list[line_cut].index] + self.stroke_drop)
+        del self.fx_list[:fx_cut]
+        del self.stroke_list[:stroke_cut]
+        del self.line_list[:line_cut]
+        fx_set = {}
+        for fx in self.fx_list + self.stroke_list + self.line_list:
+            fx_set[id(fx)] = fx
+        for fx in fx_set.values():
+            fx.index -= k_cut
+        self.macd.trim(k_cut)
+        self.line_index.trim(k_cut)
+        line_index = self.line_index.array[:len(self.line_index)]
+        line_index -= stroke_cut
+        line_index[line_index < 0] = -1
+        self.stroke_drop += stroke_cut
+
+        # K线和MACD
+        k_dt = self.chan_k_list.datetime_array.item(k_cut)
+        self.chan_k_list.trim(k_cut)
+        self.k_macd.trim(k_cut)
+        self.k_list.trim(int(np.searchsorted(self.k_list.datetime, k_dt)))
+        self.log('retain: %s', cut_dt)
+        self.emit(DELTA_RETAIN, (fx_cut, stroke_cut, line_cut, pivot_drop))
 
     def on_process_k_include(self, bar: BarData):
         """合并k线"""
-        if len(self.chan_k_list) < 2:
-            self.chan_k_list.append(bar)
+        chan_k_list = self.chan_k_list
+        if len(chan_k_list) < 2:
+            chan_k_list.append(bar)
+            self.k_macd.append(bar.close_price)
         else:
-            pre_bar = self.chan_k_list[-2]
-            last_bar = self.chan_k_list[-1]
-            if (last_bar.high_price >= bar.high_price and last_bar.low_price <= bar.low_price) or (
-                    last_bar.high_price <= bar.high_price and last_bar.low_price >= bar.low_price):
-                if last_bar.high_price > pre_bar.high_price:
-                    new_bar = copy(bar)
-                    new_bar.high_price = max(last_bar.high_price, new_bar.high_price)
-                    new_bar.low_price = max(last_bar.low_price, new_bar.low_price)
-                    new_bar.open_price = max(last_bar.open_price, new_bar.open_price)
-                    new_bar.close_price = max(last_bar.close_price, new_bar.close_price)
+            i = len(chan_k_list) - 1
+            pre_high = chan_k_list.high_array.item(i - 1)
+            last_high = chan_k_list.high_array.item(i)
+            last_low = chan_k_list.low_array.item(i)
+            if (last_high >= bar.high_price and last_low <= bar.low_price) or (
+                    last_high <= bar.high_price and last_low >= bar.low_price):
+                last_open = chan_k_list.open_array.item(i)
+                last_close = chan_k_list.close_array.item(i)
+                # 直接改写最后一根chan K线的列数据，不复制BarData
+                if last_high > pre_high:
+                    close = max(last_close, bar.close_price)
+                    chan_k_list.set_merged(i, bar, max(last_open, bar.open_price), max(last_high, bar.high_price),
+                                           max(last_low, bar.low_price), close)
                 else:
-                    new_bar = copy(bar)
-                    new_bar.high_price = min(last_bar.high_price, new_bar.high_price)
-                    new_bar.low_price = min(last_bar.low_price, new_bar.low_price)
-                    new_bar.open_price = min(last_bar.open_price, new_bar.open_price)
-                    new_bar.close_price = min(last_bar.close_price, new_bar.close_price)
-
-                self.chan_k_list[-1] = new_bar
-                ChanLog.log(self.freq, self.symbol, "combine k line: " + str(new_bar.datetime))
+                    close = min(last_close, bar.close_price)
+                    chan_k_list.set_merged(i, bar, min(last_open, bar.open_price), min(last_high, bar.high_price),
+                                           min(last_low, bar.low_price), close)
+                self.k_macd.update(close)
+                self.log("combine k line: %s", bar.datetime)
             else:
-                self.chan_k_list.append(bar)
+                chan_k_list.append(bar)
+                self.k_macd.append(bar.close_price)
             # 包含和非包含处理的k线都需要判断是否分型了
-            self.on_process_fx(self.chan_k_list)
+            self.on_process_fx(chan_k_list)
 
     def on_process_k_no_include(self, bar: BarData):
         """不用合并k线"""
         self.chan_k_list.append(bar)
+        self.k_macd.append(bar.close_price)
         self.on_process_fx(self.chan_k_list)
 
     def on_process_fx(self, data):
-        if len(data) > 2:
+        n = len(data)
+        if n > 2:
             flag = False
-            if data[-2].high_price >= data[-1].high_price and data[-2].high_price >= data[-3].high_price:
+            high = data.high_array
+            low = data.low_array
+            # 直接读列数组，分型时才取datetime
+            if high.item(n - 2) >= high.item(n - 1) and high.item(n - 2) >= high.item(n - 3):
                 # 形成顶分型 [high_price, low, dt, direction, index of k_list]
-                self.fx_list.append([data[-2].high_price, data[-2].low_price, data[-2].datetime, 'up', len(data) - 2])
+                self.fx_list.append(Fx(high.item(n - 2), low.item(n - 2), data.datetime_at(n - 2), UP, n - 2))
+                self.emit(DELTA_FX, self.fx_list[-1], len(self.fx_list) - 1)
                 flag = True
 
-            if data[-2].low_price <= data[-1].low_price and data[-2].low_price <= data[-3].low_price:
+            if low.item(n - 2) <= low.item(n - 1) and low.item(n - 2) <= low.item(n - 3):
                 # 形成底分型
-                self.fx_list.append([data[-2].high_price, data[-2].low_price, data[-2].datetime, 'down', len(data) - 2])
+                self.fx_list.append(Fx(high.item(n - 2), low.item(n - 2), data.datetime_at(n - 2), DOWN, n - 2))
+                self.emit(DELTA_FX, self.fx_list[-1], len(self.fx_list) - 1)
                 flag = True
 
             if flag:
                 self.on_stroke(self.fx_list[-1])
-                ChanLog.log(self.freq, self.symbol, "fx_list: ")
-                ChanLog.log(self.freq, self.symbol, self.fx_list[-1])
+                self.log("fx_list: ")
+                self.log(self.fx_list[-1])
 
     def on_stroke(self, data):
         """生成笔"""
         if len(self.stroke_list) < 1:
             self.stroke_list.append(data)
-            ChanLog.log(self.freq, self.symbol, self.stroke_list)
+            self.emit(DELTA_STROKE_APPEND, data, 0)
+            self.log(self.stroke_list)
         else:
             last_fx = self.stroke_list[-1]
             cur_fx = data
             pivot_flag = False
             # 分型之间需要超过三根chank线
             # 延申也是需要条件的
-            if last_fx[3] == cur_fx[3]:
-                if (last_fx[3] == 'down' and cur_fx[1] < last_fx[1]) or (
-                        last_fx[3] == 'up' and cur_fx[0] > last_fx[0]):
+            if last_fx.direction == cur_fx.direction:
+                if (last_fx.direction == DOWN and cur_fx.low < last_fx.low) or (
+                        last_fx.direction == UP and cur_fx.high > last_fx.high):
                     # 笔延申
                     self.stroke_list[-1] = cur_fx
+                    self.emit(DELTA_STROKE_EXTEND, cur_fx, len(self.stroke_list) - 1)
                     pivot_flag = True
 
             else:
                 # if (cur_fx[4] - last_fx[4] > 3) and (
                 #         (cur_fx[3] == 'down' and cur_fx[1] < last_fx[1] and cur_fx[0] < last_fx[0]) or (
                 #         cur_fx[3] == 'up' and cur_fx[0] > last_fx[0] and cur_fx[1] > last_fx[1])):
-                if (cur_fx[4] - last_fx[4] > 3) and (
-                        (cur_fx[3] == 'down' and cur_fx[0] < last_fx[1]) or (
-                        cur_fx[3] == 'up' and cur_fx[1] > last_fx[0])):
+                if (cur_fx.index - last_fx.index > 3) and (
+                        (cur_fx.direction == DOWN and cur_fx.high < last_fx.low) or (
+                        cur_fx.direction == UP and cur_fx.low > last_fx.high)):
                     # 笔新增
                     self.stroke_list.append(cur_fx)
-                    ChanLog.log(self.freq, self.symbol, "stroke_list: ")
-                    ChanLog.log(self.freq, self.symbol, self.stroke_list[-1])
-                    # ChanLog.log(self.freq, self.symbol, self.stroke_list)
+                    self.emit(DELTA_STROKE_APPEND, cur_fx, len(self.stroke_list) - 1)
+                    self.log("stroke_list: ")
+                    self.log(self.stroke_list[-1])
+                    # self.log(self.stroke_list)
                     pivot_flag = True
 
             # 修正倒数第二个分型是否是最高的顶分型或者是否是最低的底分型
@@ -171,26 +387,28 @@ class Chan_Class:
             stroke_change = None
             if pivot_flag and len(self.stroke_list) > 1:
                 stroke_change = self.stroke_list[-2]
-                if cur_fx[3] == 'down':
-                    while len(self.fx_list) > abs(start) and self.fx_list[start][2] > self.stroke_list[-2][2]:
-                        if self.fx_list[start][3] == 'up' and self.fx_list[start][0] > stroke_change[0]:
-                            if len(self.stroke_list) < 3 or (cur_fx[4] - self.fx_list[start][4] > 3):
+                if cur_fx.direction == DOWN:
+                    while len(self.fx_list) > abs(start) and self.fx_list[start].dt > self.stroke_list[-2].dt:
+                        if self.fx_list[start].direction == UP and self.fx_list[start].high > stroke_change.high:
+                            if len(self.stroke_list) < 3 or (cur_fx.index - self.fx_list[start].index > 3):
                                 stroke_change = self.fx_list[start]
                         start -= 1
                 else:
-                    while len(self.fx_list) > abs(start) and self.fx_list[start][2] > self.stroke_list[-2][2]:
-                        if self.fx_list[start][3] == 'down' and self.fx_list[start][1] < stroke_change[1]:
-                            if len(self.stroke_list) < 3 or (cur_fx[4] - self.fx_list[start][4] > 3):
+                    while len(self.fx_list) > abs(start) and self.fx_list[start].dt > self.stroke_list[-2].dt:
+                        if self.fx_list[start].direction == DOWN and self.fx_list[start].low < stroke_change.low:
+                            if len(self.stroke_list) < 3 or (cur_fx.index - self.fx_list[start].index > 3):
                                 stroke_change = self.fx_list[start]
                         start -= 1
-            if stroke_change and not stroke_change == self.stroke_list[-2]:
-                ChanLog.log(self.freq, self.symbol, 'stroke_change')
-                ChanLog.log(self.freq, self.symbol, stroke_change)
+            # 只会换成更高的顶或者更低的底，所以用is判断是否修正了
+            if stroke_change and stroke_change is not self.stroke_list[-2]:
+                self.log('stroke_change')
+                self.log(stroke_change)
                 self.stroke_list[-2] = stroke_change
+                self.emit(DELTA_STROKE_REPLACE, stroke_change, len(self.stroke_list) - 2)
                 if len(self.stroke_list) > 2:
                     cur_fx = self.stroke_list[-2]
                     last_fx = self.stroke_list[-3]
-                    self.macd[cur_fx[2]] = self.cal_macd(last_fx[4], cur_fx[4])
+                    self.macd[cur_fx.index] = self.cal_macd(last_fx.index, cur_fx.index)
                 # if cur_fx[4] - self.stroke_list[-2][4] < 4:
                 #     self.stroke_list.pop()
 
@@ -200,7 +418,7 @@ class Chan_Class:
                 if len(self.stroke_list) > 1:
                     cur_fx = self.stroke_list[-1]
                     last_fx = self.stroke_list[-2]
-                    self.macd[cur_fx[2]] = self.cal_macd(last_fx[4], cur_fx[4])
+                    self.macd[cur_fx.index] = self.cal_macd(last_fx.index, cur_fx.index)
                 self.on_line(self.stroke_list)
                 if pivot_flag:
                     self.on_pivot(self.stroke_list, None)
@@ -208,37 +426,44 @@ class Chan_Class:
     def on_line(self, data):
         # line_list保持和stroke_list结构相同，都是由分型构成的
         # 特征序列则不同，
+        if self.include_feature:
+            self.on_feature_line(data)
+            return
         if len(data) > 4:
-            # ChanLog.log(self.freq, self.symbol, 'line_index:')
-            # ChanLog.log(self.freq, self.symbol, self.line_index)
+            # self.log('line_index:')
+            # self.log(self.line_index)
             pivot_flag = False
-            if data[-1][3] == 'up' and data[-3][0] >= data[-1][0] and data[-3][0] >= data[-5][0]:
-                if not self.line_list or self.line_list[-1][3] == 'down':
-                    if not self.line_list or ((len(self.stroke_list) - 3) - self.line_index[
-                        str(self.line_list[-1][2])] > 2 and self.line_list[-1][1] < data[-3][0]):
+            if data[-1].direction == UP and data[-3].high >= data[-1].high and data[-3].high >= data[-5].high:
+                if not self.line_list or self.line_list[-1].direction == DOWN:
+                    if not self.line_list or ((len(self.stroke_list) - 3) - self.line_index[self.line_list[-1].index] > 2
+                                               and self.line_list[-1].low < data[-3].high):
                         # 出现顶
                         self.line_list.append(data[-3])
-                        self.line_index[str(self.line_list[-1][2])] = len(self.stroke_list) - 3
+                        self.emit(DELTA_LINE_APPEND, data[-3], len(self.line_list) - 1)
+                        self.line_index[self.line_list[-1].index] = len(self.stroke_list) - 3
                         pivot_flag = True
                 else:
                     # 延申顶
-                    if self.line_list[-1][0] < data[-3][0]:
+                    if self.line_list[-1].high < data[-3].high:
                         self.line_list[-1] = data[-3]
-                        self.line_index[str(self.line_list[-1][2])] = len(self.stroke_list) - 3
+                        self.emit(DELTA_LINE_EXTEND, data[-3], len(self.line_list) - 1)
+                        self.line_index[self.line_list[-1].index] = len(self.stroke_list) - 3
                         pivot_flag = True
-            if data[-1][3] == 'down' and data[-3][1] <= data[-1][1] and data[-3][1] <= data[-5][1]:
-                if not self.line_list or self.line_list[-1][3] == 'up':
-                    if not self.line_list or ((len(self.stroke_list) - 3) - self.line_index[
-                        str(self.line_list[-1][2])] > 2 and self.line_list[-1][0] > data[-3][1]):
+            if data[-1].direction == DOWN and data[-3].low <= data[-1].low and data[-3].low <= data[-5].low:
+                if not self.line_list or self.line_list[-1].direction == UP:
+                    if not self.line_list or ((len(self.stroke_list) - 3) - self.line_index[self.line_list[-1].index] > 2
+                                               and self.line_list[-1].high > data[-3].low):
                         # 出现底
                         self.line_list.append(data[-3])
-                        self.line_index[str(self.line_list[-1][2])] = len(self.stroke_list) - 3
+                        self.emit(DELTA_LINE_APPEND, data[-3], len(self.line_list) - 1)
+                        self.line_index[self.line_list[-1].index] = len(self.stroke_list) - 3
                         pivot_flag = True
                 else:
                     # 延申底
-                    if self.line_list[-1][1] > data[-3][1]:
+                    if self.line_list[-1].low > data[-3].low:
                         self.line_list[-1] = data[-3]
-                        self.line_index[str(self.line_list[-1][2])] = len(self.stroke_list) - 3
+                        self.emit(DELTA_LINE_EXTEND, data[-3], len(self.line_list) - 1)
+                        self.line_index[self.line_list[-1].index] = len(self.stroke_list) - 3
                         pivot_flag = True
 
             line_change = None
@@ -246,49 +471,125 @@ class Chan_Class:
                 last_fx = self.line_list[-2]
                 line_change = last_fx
                 cur_fx = self.line_list[-1]
-                cur_index = self.line_index[str(cur_fx[2])]
+                cur_index = self.line_index[cur_fx.index]
                 start = -6
-                last_index = self.line_index[str(last_fx[2])]
+                last_index = self.line_index[last_fx.index]
                 if cur_index - last_index > 3:
-                    while len(self.stroke_list) >= abs(start - 2) and self.stroke_list[start][2] > last_fx[2]:
-                        if cur_fx[3] == 'down' and self.stroke_list[start][0] > self.stroke_list[start + 2][0] and \
-                                self.stroke_list[start][0] > self.stroke_list[start - 2][0] and self.stroke_list[start][
-                            0] > line_change[0]:
+                    while len(self.stroke_list) >= abs(start - 2) and self.stroke_list[start].dt > last_fx.dt:
+                        if cur_fx.direction == DOWN and self.stroke_list[start].high > self.stroke_list[start + 2].high \
+                                and self.stroke_list[start].high > self.stroke_list[start - 2].high \
+                                and self.stroke_list[start].high > line_change.high:
                             line_change = self.stroke_list[start]
-                        if cur_fx[3] == 'up' and self.stroke_list[start][1] < self.stroke_list[start + 2][1] and \
-                                self.stroke_list[start][1] < self.stroke_list[start - 2][1] and self.stroke_list[start][
-                            1] < line_change[1]:
+                        if cur_fx.direction == UP and self.stroke_list[start].low < self.stroke_list[start + 2].low \
+                                and self.stroke_list[start].low < self.stroke_list[start - 2].low \
+                                and self.stroke_list[start].low < line_change.low:
                             line_change = self.stroke_list[start]
                         start -= 2
 
-            if line_change and not line_change == self.line_list[-2]:
-                ChanLog.log(self.freq, self.symbol, 'line_change')
-                ChanLog.log(self.freq, self.symbol, line_change)
-                ChanLog.log(self.freq, self.symbol, self.line_list)
-                self.line_index[str(line_change[2])] = self.line_index[str(self.line_list[-2][2])]
+            if line_change and line_change is not self.line_list[-2]:
+                self.log('line_change')
+                self.log(line_change)
+                self.log(self.line_list)
+                self.line_index[line_change.index] = self.line_index[self.line_list[-2].index]
                 self.line_list[-2] = line_change
+                self.emit(DELTA_LINE_REPLACE, line_change, len(self.line_list) - 2)
                 if len(self.line_list) > 2:
                     cur_fx = self.line_list[-2]
                     last_fx = self.line_list[-3]
-                    self.macd[cur_fx[2]] = self.cal_macd(last_fx[4], cur_fx[4])
-
-            if self.line_list and self.build_pivot:
-                if len(self.line_list) > 1:
+                    self.macd[cur_fx.index] = self.cal_macd(last_fx.index, cur_fx.index)
+
+            self.on_line_pivot()
+
+    def on_feature_line(self, data):
+        """
+        特征序列划分线段，见FeatureSegment
+        笔只会改写最后两个分型，倒数第三个及之前的分型不再变化，按顺序输入，每个分型只输入一次
+        """
+        end = self.stroke_drop + len(data) - 2
+        while self.feature_pos < end:
+            fx = data[self.feature_pos - self.stroke_drop]
+            for change, line_fx, pos in self.line_feature.feed(fx, self.feature_pos):
+                if change == SEGMENT_REMOVE:
+                    # 线段确认前突破起点，去掉它的极值点，上一条线段接着延伸
+                    line_fx = self.line_list.pop()
+                    self.line_index[line_fx.index] = -1
+                    self.emit(DELTA_LINE_REMOVE, line_fx, len(self.line_list))
+                    continue
+                if change == SEGMENT_APPEND:
+                    self.line_list.append(line_fx)
+                    self.emit(DELTA_LINE_APPEND, line_fx, len(self.line_list) - 1)
+                else:
+                    self.line_list[-1] = line_fx
+                    self.emit(DELTA_LINE_EXTEND, line_fx, len(self.line_list) - 1)
+                self.line_index[line_fx.index] = pos - self.stroke_drop
+                if self.build_pivot and len(self.line_list) > 1:
                     cur_fx = self.line_list[-1]
                     last_fx = self.line_list[-2]
-                    self.macd[cur_fx[2]] = self.cal_macd(last_fx[4], cur_fx[4])
-                ChanLog.log(self.freq, self.symbol, 'line_list:')
-                ChanLog.log(self.freq, self.symbol, self.line_list[-1])
-                self.on_pivot(self.line_list, None)
+                    self.macd[cur_fx.index] = self.cal_macd(last_fx.index, cur_fx.index)
+            self.feature_pos += 1
+        self.on_line_pivot()
+
+    def on_line_pivot(self):
+        """线段构成中枢"""
+        if self.line_list and self.build_pivot:
+            if len(self.line_list) > 1:
+                cur_fx = self.line_list[-1]
+                last_fx = self.line_list[-2]
+                self.macd[cur_fx.index] = self.cal_macd(last_fx.index, cur_fx.index)
+            self.log('line_list:')
+            self.log(self.line_list[-1])
+            self.on_pivot(self.line_list, None)
 
     def on_pivot(self, data, type):
-        # 中枢列表[[日期1，日期2，中枢低点，中枢高点, 中枢类型，中枢进入段，中枢离开段, 形成时间, GG, DD,BS,BS,TS]]]
-        # 日期1：中枢开始的时间
-        # 日期2：中枢结束的时间，可能延申
-        # 中枢类型： ‘up', 'down'
-        # BS: 买点
-        # BS: 卖点
-        # TS: 背驰段
+        """
+        中枢和买卖点的计算入口
+        只判断最后三个中枢的买卖点，都要读到data最后的分型，所以上次调用之后data被改写过(最小下标见emit)就重新计算。
+        data没有改写、上次计算开始时的状态到现在都没变(pivot_version和macd.version只增不减)、
+        区间套读到的低级别K线也没变时，再算一遍结果相同，跳过。线段构成中枢时多数调用可以跳过
+        pivot_calls/pivot_skips统计调用和跳过的次数
+        """
+        self.pivot_calls += 1
+        if data is self.stroke_list:
+            dirty = self.stroke_dirty
+            self.stroke_dirty = None
+        elif data is self.line_list:
+            dirty = self.line_dirty
+            self.line_dirty = None
+        else:
+            # qjt_pivot传入的临时列表
+            dirty = 0
+        state = (self.pivot_version, self.macd.version, type)
+        if dirty is None and state == self.pivot_state and (
+                self.pivot_lower is None or self.pivot_lower == self.get_lower_state()):
+            self.pivot_skips += 1
+            return
+        self.pivot_state = state
+        self.pivot_lower = None
+        self.cal_pivot(data, type)
+
+    def on_pivot_change(self):
+        """中枢和买卖点不发出事件的改变：背驰段、共振待确认的一买，下一次on_pivot不能跳过"""
+        self.pivot_version += 1
+
+    def get_lower_state(self):
+        """低级别chan K线的(根数, 最后一根的时间)，区间套只读低级别，它们不变时结果不变"""
+        lower = []
+        chan = self.next
+        while chan:
+            chan_k_list = chan.chan_k_list
+            lower.append(len(chan_k_list))
+            lower.append(chan_k_list.datetime_array.item(len(chan_k_list) - 1) if len(chan_k_list) else None)
+            chan = chan.next
+        return tuple(lower)
+
+    def cal_pivot(self, data, type):
+        # 中枢列表[Pivot]，见Pivot
+        # start：中枢开始的时间
+        # end：中枢结束的时间，可能延申
+        # direction：UP, DOWN
+        # buy: 买点
+        # sell: 卖点
+        # ts: 背驰段
         if len(data) > 5:
             # 构成笔或者是线段的分型
             cur_fx = data[-1]
@@ -297,132 +598,114 @@ class Chan_Class:
             flag = False
             # 构成新的中枢
             # 判断形成新的中枢的可能性
-            if not self.pivot_list or (len(self.pivot_list) > 0 and len(data) - self.pivot_list[-1][6] > 4):
-                cur_pivot = [data[-5][2], last_fx[2]]
-                if cur_fx[3] == 'down' and data[-2][0] > data[-5][1]:
-                    ZD = max(data[-3][1], data[-5][1])
-                    ZG = min(data[-2][0], data[-4][0])
-                    DD = min(data[-3][1], data[-5][1])
-                    GG = max(data[-2][0], data[-4][0])
+            if not self.pivot_list or (len(self.pivot_list) > 0 and len(data) - self.pivot_list[-1].exit > 4):
+                if cur_fx.direction == DOWN and data[-2].high > data[-5].low:
+                    ZD = max(data[-3].low, data[-5].low)
+                    ZG = min(data[-2].high, data[-4].high)
+                    DD = min(data[-3].low, data[-5].low)
+                    GG = max(data[-2].high, data[-4].high)
                     if ZG > ZD:
-                        cur_pivot.append(ZD)
-                        cur_pivot.append(ZG)
-                        cur_pivot.append('down')
-                        cur_pivot.append(len(data) - 5)
-                        cur_pivot.append(len(data) - 2)
-                        cur_pivot.append(cur_fx[2])
-                        cur_pivot.append(GG)
-                        cur_pivot.append(DD)
-                        cur_pivot.append([[], [], []])
-                        cur_pivot.append([[], [], []])
-                        cur_pivot.append([])
-                        new_pivot = cur_pivot
+                        new_pivot = Pivot(data[-5].dt, last_fx.dt, ZD, ZG, DOWN, len(data) - 5, len(data) - 2,
+                                          cur_fx.dt, GG, DD)
                         # 中枢形成，判断背驰
-                if cur_fx[3] == 'up' and data[-2][1] < data[-5][0]:
-                    ZD = max(data[-2][1], data[-4][1])
-                    ZG = min(data[-3][0], data[-5][0])
-                    DD = min(data[-2][1], data[-4][1])
-                    GG = max(data[-3][0], data[-5][0])
+                if cur_fx.direction == UP and data[-2].low < data[-5].high:
+                    ZD = max(data[-2].low, data[-4].low)
+                    ZG = min(data[-3].high, data[-5].high)
+                    DD = min(data[-2].low, data[-4].low)
+                    GG = max(data[-3].high, data[-5].high)
                     if ZG > ZD:
-                        cur_pivot.append(ZD)
-                        cur_pivot.append(ZG)
-                        cur_pivot.append('up')
-                        cur_pivot.append(len(data) - 5)
-                        cur_pivot.append(len(data) - 2)
-                        cur_pivot.append(cur_fx[2])
-                        cur_pivot.append(GG)
-                        cur_pivot.append(DD)
-                        cur_pivot.append([[], [], []])
-                        cur_pivot.append([[], [], []])
-                        cur_pivot.append([])
-                        new_pivot = cur_pivot
+                        new_pivot = Pivot(data[-5].dt, last_fx.dt, ZD, ZG, UP, len(data) - 5, len(data) - 2,
+                                          cur_fx.dt, GG, DD)
                 if not self.pivot_list:
                     if new_pivot:
                         flag = True
                 else:
                     last_pivot = self.pivot_list[-1]
-                    if new_pivot and ((new_pivot[2] > last_pivot[3] and cur_fx[3] == 'up') or (
-                            new_pivot[3] < last_pivot[2] and cur_fx[3] == 'down')):
+                    if new_pivot and ((new_pivot.zd > last_pivot.zg and cur_fx.direction == UP) or (
+                            new_pivot.zg < last_pivot.zd and cur_fx.direction == DOWN)):
                         flag = True
-                    if type and new_pivot and type == new_pivot[4]:
+                    if type and new_pivot and type == new_pivot.direction:
                         flag = True
 
             if len(self.pivot_list) > 0 and not flag:
                 last_pivot = self.pivot_list[-1]
-                ts = last_pivot[12]
+                ts = last_pivot.ts
                 # 由于stroke/line_change，不断change中枢
-                start = last_pivot[5]
+                start = last_pivot.enter
                 # 防止异常
                 if len(data) <= start:
                     self.pivot_list.pop()
+                    self.emit(DELTA_PIVOT_REMOVE, last_pivot, len(self.pivot_list))
                     if not self.pivot_list:
                         return
                     last_pivot = self.pivot_list[-1]
-                    start = last_pivot[5]
-                buy = last_pivot[10]
-                sell = last_pivot[11]
-                enter = data[start][2]
-                exit = cur_fx[2]
+                    start = last_pivot.enter
+                buy = last_pivot.buy
+                sell = last_pivot.sell
+                enter = data[start].index
+                exit = cur_fx.index
                 ee_data = [[data[start - 1], data[start]],
                            [data[len(data) - 2], data[len(data) - 1]]]
 
-                if last_pivot[4] == 'up':
+                if last_pivot.direction == UP:
                     # stroke_change导致的笔减少了
                     if len(data) > start + 3:
-                        last_pivot[2] = max(data[start + 1][1], data[start + 3][1])
-                        last_pivot[3] = min(data[start][0], data[start + 2][0])
-                        last_pivot[8] = max(data[start][0], data[start + 2][0])
-                        last_pivot[9] = min(data[start + 1][1], data[start + 3][1])
-                    if cur_fx[3] == 'up':
+                        zone = (last_pivot.zd, last_pivot.zg, last_pivot.gg, last_pivot.dd)
+                        last_pivot.zd = max(data[start + 1].low, data[start + 3].low)
+                        last_pivot.zg = min(data[start].high, data[start + 2].high)
+                        last_pivot.gg = max(data[start].high, data[start + 2].high)
+                        last_pivot.dd = min(data[start + 1].low, data[start + 3].low)
+                        if zone != (last_pivot.zd, last_pivot.zg, last_pivot.gg, last_pivot.dd):
+                            self.emit(DELTA_PIVOT_UPDATE, last_pivot, len(self.pivot_list) - 1)
+                    if cur_fx.direction == UP:
                         if sell[0]:
                             # 一卖后的顶分型判断一卖是否有效，无效则将上一个一卖置为无效
-                            if sell[0][1] < cur_fx[0] and len(data) - last_pivot[6] < 3:
+                            if sell[0].price < cur_fx.high and len(data) - last_pivot.exit < 3:
                                 # 置一卖无效
-                                sell[0][5] = 0
-                                sell[0][6] = self.k_list[-1].datetime
-                                sell[0] = []
+                                self.on_bs_invalid(sell[0])
+                                sell[0] = None
                                 # 置二卖无效
                                 if sell[1]:
-                                    sell[1][5] = 0
-                                    sell[1][6] = self.k_list[-1].datetime
-                                    sell[1] = []
+                                    self.on_bs_invalid(sell[1])
+                                    sell[1] = None
                         # 判断背驰
-                        if self.on_turn(enter, exit, ee_data, last_pivot[4]) and cur_fx[0] > last_pivot[8]:
-                            ts.append([last_fx[2], cur_fx[2]])
+                        if self.on_turn(enter, exit, ee_data, last_pivot.direction) and cur_fx.high > last_pivot.gg:
+                            ts.append([last_fx.dt, cur_fx.dt])
+                            self.on_pivot_change()
                             if not sell[0]:
                                 # 形成一卖
-                                ans, qjt_pivot_list = self.qjt_turn(last_fx[2], cur_fx[2], 'up')
+                                ans, qjt_pivot_list = self.qjt_turn(last_fx.dt, cur_fx.dt, UP)
                                 if ans:
-                                    sell[0] = [cur_fx[2], cur_fx[0], 'S1', self.k_list[-1].datetime, len(data) - 1, 1,
-                                               None, self.cal_bs_type(), None, qjt_pivot_list]
+                                    sell[0] = BsPoint(cur_fx.dt, cur_fx.high, S1, self.k_list.datetime_at(-1),
+                                                      len(data) - 1, 1, None, self.cal_bs_type(), None, qjt_pivot_list)
                                     self.on_buy_sell(sell[0])
                         if sell[0] and not sell[1]:
-                            pos_sell1 = sell[0][4]
+                            pos_sell1 = sell[0].pos
                             if len(data) > pos_sell1 + 2:
                                 pos_fx = data[pos_sell1 + 2]
-                                if pos_fx[3] == 'up':
-                                    if pos_fx[1] < sell[0][1]:
+                                if pos_fx.direction == UP:
+                                    if pos_fx.low < sell[0].price:
                                         # 形成二卖
-                                        ans, qjt_pivot_list = self.qjt_trend(last_fx[2], cur_fx[2], 'up')
+                                        ans, qjt_pivot_list = self.qjt_trend(last_fx.dt, cur_fx.dt, UP)
                                         if ans:
-                                            sell[1] = [pos_fx[2], pos_fx[0], 'S2', self.k_list[-1].datetime,
-                                                       pos_sell1 + 2, 1, None, self.cal_bs_type(), None, qjt_pivot_list]
+                                            sell[1] = BsPoint(pos_fx.dt, pos_fx.high, S2, self.k_list.datetime_at(-1),
+                                                              pos_sell1 + 2, 1, None, self.cal_bs_type(), None,
+                                                              qjt_pivot_list)
                                         self.on_buy_sell(sell[1])
                                     else:
                                         # 一卖无效
-                                        sell[0][5] = 0
-                                        sell[0][6] = self.k_list[-1].datetime
-                                        sell[0] = []
+                                        self.on_bs_invalid(sell[0])
+                                        sell[0] = None
 
-                        if cur_fx[0] < last_pivot[2] and not sell[2] and not buy[0]:
+                        if cur_fx.high < last_pivot.zd and not sell[2] and not buy[0]:
                             # 形成三卖
-                            ans, qjt_pivot_list = self.qjt_trend(last_fx[2], cur_fx[2], 'up')
+                            ans, qjt_pivot_list = self.qjt_trend(last_fx.dt, cur_fx.dt, UP)
                             if ans:
-                                condition = len(data) > 2 and data[-3][0] < last_pivot[2] and data[-3][2] > last_pivot[
-                                    1]
+                                condition = len(data) > 2 and data[-3].high < last_pivot.zd and data[-3].dt > \
+                                            last_pivot.end
                                 if not condition:
-                                    sell[2] = [cur_fx[2], cur_fx[0], 'S3', self.k_list[-1].datetime, len(data) - 1, 1,
-                                               None, self.cal_bs_type(), None, qjt_pivot_list]
+                                    sell[2] = BsPoint(cur_fx.dt, cur_fx.high, S3, self.k_list.datetime_at(-1),
+                                                      len(data) - 1, 1, None, self.cal_bs_type(), None, qjt_pivot_list)
                                     self.on_buy_sell(sell[2])
 
                         # if (not last_fx[1] > last_pivot[3]) and (not cur_fx[0] < last_pivot[2]):
@@ -431,105 +714,109 @@ class Chan_Class:
 
                     else:
                         # 判断是否延申
-                        if (not cur_fx[1] > last_pivot[3]) and (not last_fx[0] < last_pivot[2]):
-                            last_pivot[1] = cur_fx[2]
-                            last_pivot[6] = len(data) - 1
+                        if (not cur_fx.low > last_pivot.zg) and (not last_fx.high < last_pivot.zd):
+                            if last_pivot.end != cur_fx.dt or last_pivot.exit != len(data) - 1:
+                                last_pivot.end = cur_fx.dt
+                                last_pivot.exit = len(data) - 1
+                                self.emit(DELTA_PIVOT_UPDATE, last_pivot, len(self.pivot_list) - 1)
                         else:
                             # 判断形成第三类买点
-                            if cur_fx[1] > last_pivot[2] and not buy[2] and not sell[0]:
-                                ans, qjt_pivot_list = self.qjt_trend(last_fx[2], cur_fx[2], 'down')
+                            if cur_fx.low > last_pivot.zd and not buy[2] and not sell[0]:
+                                ans, qjt_pivot_list = self.qjt_trend(last_fx.dt, cur_fx.dt, DOWN)
                                 if ans:
-                                    condition = len(data) > 2 and data[-3][1] > last_pivot[3] and data[-3][2] > \
-                                                last_pivot[1]
+                                    condition = len(data) > 2 and data[-3].low > last_pivot.zg and data[-3].dt > \
+                                                last_pivot.end
                                     if not condition:
                                         sth_pivot = last_pivot
                                         # if len(self.pivot_list) > 1:
                                         #     sth_pivot = self.pivot_list[-2]
-                                        buy[2] = [cur_fx[2], cur_fx[1], 'B3', self.k_list[-1].datetime, len(data) - 1,
-                                                  1, None, self.cal_bs_type(),
-                                                  self.cal_b3_strength(cur_fx[1], sth_pivot), qjt_pivot_list]
-                                        ChanLog.log(self.freq, self.symbol, 'B3-pivot')
-                                        ChanLog.log(self.freq, self.symbol, sth_pivot)
-                                        ChanLog.log(self.freq, self.symbol, buy[2])
+                                        buy[2] = BsPoint(cur_fx.dt, cur_fx.low, B3, self.k_list.datetime_at(-1),
+                                                         len(data) - 1, 1, None, self.cal_bs_type(),
+                                                         self.cal_b3_strength(cur_fx.low, sth_pivot), qjt_pivot_list)
+                                        self.log('B3-pivot')
+                                        self.log(sth_pivot)
+                                        self.log(buy[2])
                                         self.on_buy_sell(buy[2])
 
 
                 else:
                     # stroke_change导致的笔减少了
                     if len(data) > start + 3:
-                        last_pivot[2] = max(data[start][1], data[start + 2][1])
-                        last_pivot[3] = min(data[start + 1][0], data[start + 3][0])
-                        last_pivot[8] = max(data[start + 1][0], data[start + 3][0])
-                        last_pivot[9] = min(data[start][1], data[start + 2][1])
-                    if cur_fx[3] == 'down':
+                        zone = (last_pivot.zd, last_pivot.zg, last_pivot.gg, last_pivot.dd)
+                        last_pivot.zd = max(data[start].low, data[start + 2].low)
+                        last_pivot.zg = min(data[start + 1].high, data[start + 3].high)
+                        last_pivot.gg = max(data[start + 1].high, data[start + 3].high)
+                        last_pivot.dd = min(data[start].low, data[start + 2].low)
+                        if zone != (last_pivot.zd, last_pivot.zg, last_pivot.gg, last_pivot.dd):
+                            self.emit(DELTA_PIVOT_UPDATE, last_pivot, len(self.pivot_list) - 1)
+                    if cur_fx.direction == DOWN:
                         if buy[0]:
                             # 一买后的底分型判断一买是否有效，无效则将上一个一买置为无效
-                            if buy[0][1] > cur_fx[1] and len(data) - last_pivot[6] < 3:
+                            if buy[0].price > cur_fx.low and len(data) - last_pivot.exit < 3:
                                 # 置一买无效
-                                buy[0][5] = 0
-                                buy[0][6] = self.k_list[-1].datetime
-                                buy[0] = []
+                                self.on_bs_invalid(buy[0])
+                                buy[0] = None
                                 # 置二买无效
                                 if buy[1]:
-                                    buy[1][5] = 0
-                                    buy[1][6] = self.k_list[-1].datetime
-                                    buy[1] = []
+                                    self.on_bs_invalid(buy[1])
+                                    buy[1] = None
 
                         # 判断背驰
-                        if self.on_turn(enter, exit, ee_data, last_pivot[4]) and cur_fx[1] < last_pivot[9]:
-                            ts.append([last_fx[2], cur_fx[2]])
+                        if self.on_turn(enter, exit, ee_data, last_pivot.direction) and cur_fx.low < last_pivot.dd:
+                            ts.append([last_fx.dt, cur_fx.dt])
+                            self.on_pivot_change()
                             if not buy[0]:
                                 # 形成一买
-                                ans, qjt_pivot_list = self.qjt_turn(last_fx[2], cur_fx[2], 'down')
+                                ans, qjt_pivot_list = self.qjt_turn(last_fx.dt, cur_fx.dt, DOWN)
                                 if ans:
-                                    buy[0] = [cur_fx[2], cur_fx[1], 'B1', self.k_list[-1].datetime, len(data) - 1, 1,
-                                              None, self.cal_bs_type(), None, qjt_pivot_list]
+                                    buy[0] = BsPoint(cur_fx.dt, cur_fx.low, B1, self.k_list.datetime_at(-1),
+                                                     len(data) - 1, 1, None, self.cal_bs_type(), None, qjt_pivot_list)
                                     if self.gz:
-                                        self.gz_prev_last_bs = self.get_prev_last_bs()
+                                        self.gz_prev_last_bs = self.gz_last_bs
                                         self.gz_tmp_bs = buy
-                                        buy[0][5] = 0
+                                        self.on_pivot_change()
+                                        buy[0].valid = 0
                                     else:
                                         self.on_buy_sell(buy[0])
 
-                        if buy[0] and buy[0][5] == 1 and not buy[1]:
-                            pos_buy1 = buy[0][4]
+                        if buy[0] and buy[0].valid == 1 and not buy[1]:
+                            pos_buy1 = buy[0].pos
                             if len(data) > pos_buy1 + 2:
                                 pos_fx = data[pos_buy1 + 2]
-                                if pos_fx[3] == 'down':
-                                    if pos_fx[1] > buy[0][1]:
+                                if pos_fx.direction == DOWN:
+                                    if pos_fx.low > buy[0].price:
                                         # 形成二买
-                                        ans, qjt_pivot_list = self.qjt_trend(last_fx[2], cur_fx[2], 'down')
+                                        ans, qjt_pivot_list = self.qjt_trend(last_fx.dt, cur_fx.dt, DOWN)
                                         if ans:
                                             sth_pivot = last_pivot
                                             # if len(self.pivot_list) > 1:
                                             #     sth_pivot = self.pivot_list[-2]
-                                            buy[1] = [pos_fx[2], pos_fx[1], 'B2', self.k_list[-1].datetime,
-                                                      pos_buy1 + 2, 1, None, self.cal_bs_type(),
-                                                      self.cal_b2_strength(pos_fx[1], last_fx, sth_pivot),
-                                                      qjt_pivot_list]
+                                            buy[1] = BsPoint(pos_fx.dt, pos_fx.low, B2, self.k_list.datetime_at(-1),
+                                                             pos_buy1 + 2, 1, None, self.cal_bs_type(),
+                                                             self.cal_b2_strength(pos_fx.low, last_fx, sth_pivot),
+                                                             qjt_pivot_list)
                                             self.on_buy_sell(buy[1])
                                     else:
                                         # 一买无效
-                                        buy[0][5] = 0
-                                        buy[0][6] = self.k_list[-1].datetime
-                                        buy[0] = []
+                                        self.on_bs_invalid(buy[0])
+                                        buy[0] = None
 
-                        if cur_fx[1] > last_pivot[3] and not buy[2] and not sell[0]:
+                        if cur_fx.low > last_pivot.zg and not buy[2] and not sell[0]:
                             # 形成三买
-                            ans, qjt_pivot_list = self.qjt_trend(last_fx[2], cur_fx[2], 'down')
+                            ans, qjt_pivot_list = self.qjt_trend(last_fx.dt, cur_fx.dt, DOWN)
                             if ans:
-                                condition = len(data) > 2 and data[-3][1] > last_pivot[3] and data[-3][2] > \
-                                            last_pivot[1]
+                                condition = len(data) > 2 and data[-3].low > last_pivot.zg and data[-3].dt > \
+                                            last_pivot.end
                                 if not condition:
                                     sth_pivot = last_pivot
                                     # if len(self.pivot_list) > 1:
                                     #     sth_pivot = self.pivot_list[-2]
-                                    buy[2] = [cur_fx[2], cur_fx[1], 'B3', self.k_list[-1].datetime, len(data) - 1, 1,
-                                              None, self.cal_bs_type(), self.cal_b3_strength(cur_fx[1], sth_pivot),
-                                              qjt_pivot_list]
-                                    ChanLog.log(self.freq, self.symbol, 'B3-pivot')
-                                    ChanLog.log(self.freq, self.symbol, sth_pivot)
-                                    ChanLog.log(self.freq, self.symbol, buy[2])
+                                    buy[2] = BsPoint(cur_fx.dt, cur_fx.low, B3, self.k_list.datetime_at(-1),
+                                                     len(data) - 1, 1, None, self.cal_bs_type(),
+                                                     self.cal_b3_strength(cur_fx.low, sth_pivot), qjt_pivot_list)
+                                    self.log('B3-pivot')
+                                    self.log(sth_pivot)
+                                    self.log(buy[2])
                                     self.on_buy_sell(buy[2])
 
                         # if (not cur_fx[1] > last_pivot[3]) and (not last_fx[0] < last_pivot[2]):
@@ -537,77 +824,80 @@ class Chan_Class:
                         #     last_pivot[6] = len(data) - 1
                     else:
                         # 判断是否延申
-                        if (not last_fx[1] > last_pivot[3]) and (not cur_fx[0] < last_pivot[2]):
-                            last_pivot[1] = cur_fx[2]
-                            last_pivot[6] = len(data) - 1
+                        if (not last_fx.low > last_pivot.zg) and (not cur_fx.high < last_pivot.zd):
+                            if last_pivot.end != cur_fx.dt or last_pivot.exit != len(data) - 1:
+                                last_pivot.end = cur_fx.dt
+                                last_pivot.exit = len(data) - 1
+                                self.emit(DELTA_PIVOT_UPDATE, last_pivot, len(self.pivot_list) - 1)
                         else:
                             # 判断形成第三类卖点
-                            if cur_fx[1] < last_pivot[3] and not sell[2] and not buy[0]:
-                                ans, qjt_pivot_list = self.qjt_trend(last_fx[2], cur_fx[2], 'up')
+                            if cur_fx.low < last_pivot.zg and not sell[2] and not buy[0]:
+                                ans, qjt_pivot_list = self.qjt_trend(last_fx.dt, cur_fx.dt, UP)
                                 if ans:
-                                    condition = len(data) > 2 and data[-3][0] < last_pivot[2] and data[-3][2] > \
-                                                last_pivot[1]
+                                    condition = len(data) > 2 and data[-3].high < last_pivot.zd and data[-3].dt > \
+                                                last_pivot.end
                                     if not condition:
-                                        sell[2] = [cur_fx[2], cur_fx[0], 'S3', self.k_list[-1].datetime, len(data) - 1,
-                                                   1, None, self.cal_bs_type(), None, qjt_pivot_list]
+                                        sell[2] = BsPoint(cur_fx.dt, cur_fx.high, S3, self.k_list.datetime_at(-1),
+                                                          len(data) - 1, 1, None, self.cal_bs_type(), None,
+                                                          qjt_pivot_list)
                                         self.on_buy_sell(sell[2])
 
                 # 判断一二类买卖点失效
                 if len(self.pivot_list) > 1:
                     pre = self.pivot_list[-2]
-                    pre_buy = pre[10]
-                    pre_sell = pre[11]
+                    pre_buy = pre.buy
+                    pre_sell = pre.sell
                     if pre_sell[0] and not pre_sell[1]:
-                        pos_sell1 = pre_sell[0][4]
+                        pos_sell1 = pre_sell[0].pos
                         if len(data) > pos_sell1 + 2:
                             pos_fx = data[pos_sell1 + 2]
-                            if pos_fx[3] == 'up':
-                                if pos_fx[0] < pre_sell[0][1]:
+                            if pos_fx.direction == UP:
+                                if pos_fx.high < pre_sell[0].price:
                                     # 形成二卖
-                                    pre_sell[1] = [pos_fx[2], pos_fx[0], 'S2', self.k_list[-1].datetime, pos_sell1 + 2,
-                                                   1, None, pre_sell[0][7], None]
+                                    pre_sell[1] = BsPoint(pos_fx.dt, pos_fx.high, S2, self.k_list.datetime_at(-1),
+                                                          pos_sell1 + 2, 1, None, pre_sell[0].trend_type, None)
                                     self.on_buy_sell(pre_sell[1])
                                 else:
                                     # 一卖无效
-                                    pre_sell[0][5] = 0
-                                    pre_sell[0][6] = self.k_list[-1].datetime
-                                    pre_sell[0] = []
+                                    self.on_bs_invalid(pre_sell[0])
+                                    pre_sell[0] = None
 
-                    if pre_buy[0] and pre_buy[0][5] == 1 and not pre_buy[1]:
-                        pos_buy1 = pre_buy[0][4]
+                    if pre_buy[0] and pre_buy[0].valid == 1 and not pre_buy[1]:
+                        pos_buy1 = pre_buy[0].pos
                         if len(data) > pos_buy1 + 2:
                             pos_fx = data[pos_buy1 + 2]
-                            if pos_fx[3] == 'down':
-                                if pos_fx[1] > pre_buy[0][1]:
+                            if pos_fx.direction == DOWN:
+                                if pos_fx.low > pre_buy[0].price:
                                     sth_pivot = None
                                     # if len(self.pivot_list) > 2:
                                     #     sth_pivot = self.pivot_list[-3]
                                     if len(self.pivot_list) > 1:
                                         sth_pivot = self.pivot_list[-2]
                                     # 形成二买
-                                    pre_buy[1] = [pos_fx[2], pos_fx[1], 'B2', self.k_list[-1].datetime, pos_buy1 + 2, 1,
-                                                  None, pre_buy[0][7],
-                                                  self.cal_b2_strength(pos_fx[1], data[pos_buy1 + 1], sth_pivot)]
+                                    pre_buy[1] = BsPoint(pos_fx.dt, pos_fx.low, B2, self.k_list.datetime_at(-1),
+                                                         pos_buy1 + 2, 1, None, pre_buy[0].trend_type,
+                                                         self.cal_b2_strength(pos_fx.low, data[pos_buy1 + 1],
+                                                                              sth_pivot))
                                     self.on_buy_sell(pre_buy[1])
                                 else:
                                     # 一买无效
-                                    pre_buy[0][5] = 0
-                                    pre_buy[0][6] = self.k_list[-1].datetime
-                                    pre_buy[0] = []
+                                    self.on_bs_invalid(pre_buy[0])
+                                    pre_buy[0] = None
 
                     # B2失效的判断标准：以B2为起点的笔的顶不大于反转笔的顶。
                     # 判断条件有问题
-                    if pre_buy[1] and len(data) > pre_buy[1][4] + 2:
-                        start = pre_buy[1][4] + 1
-                        if data[start] < data[start - 2]:
+                    if pre_buy[1] and len(data) > pre_buy[1].pos + 2:
+                        start = pre_buy[1].pos + 1
+                        # 按原来[high, low, dt, direction, index]的顺序比较两个分型
+                        cur, pre_fx = data[start], data[start - 2]
+                        if (cur.high, cur.low, cur.dt, cur.direction, cur.index) < (
+                                pre_fx.high, pre_fx.low, pre_fx.dt, pre_fx.direction, pre_fx.index):
                             if pre_buy[0]:
                                 # 一买无效
-                                pre_buy[0][5] = 0
-                                pre_buy[0][6] = self.k_list[-1].datetime
-                                pre_buy[0] = []
-                                pre_buy[1][5] = 0
-                                pre_buy[1][6] = self.k_list[-1].datetime
-                                pre_buy[1] = []
+                                self.on_bs_invalid(pre_buy[0])
+                                pre_buy[0] = None
+                                self.on_bs_invalid(pre_buy[1])
+                                pre_buy[1] = None
 
                     sth_pivot = None
                     # if len(self.pivot_list) > 2:
@@ -618,22 +908,20 @@ class Chan_Class:
 
                 if len(self.pivot_list) > 2:
                     pre2 = self.pivot_list[-3]
-                    pre_buy = pre2[10]
-                    pre_sell = pre2[11]
+                    pre_buy = pre2.buy
+                    pre_sell = pre2.sell
                     pre1 = self.pivot_list[-2]
-                    if pre1[3] < last_pivot[2] and pre2[3] < pre1[2]:
+                    if pre1.zg < last_pivot.zd and pre2.zg < pre1.zd:
                         # 上升趋势
                         if pre_sell[0]:
                             # 置一卖无效
-                            pre_sell[0][5] = 0
-                            pre_sell[0][6] = self.k_list[-1].datetime
-                            pre_sell[0] = []
+                            self.on_bs_invalid(pre_sell[0])
+                            pre_sell[0] = None
 
                         if pre_sell[1]:
                             # 置二卖无效
-                            pre_sell[1][5] = 0
-                            pre_sell[1][6] = self.k_list[-1].datetime
-                            pre_sell[1] = []
+                            self.on_bs_invalid(pre_sell[1])
+                            pre_sell[1] = None
                     # if pre1[2] > last_pivot[3]:
                     #     # 下降趋势
                     #     if pre_buy[0]:
@@ -648,15 +936,13 @@ class Chan_Class:
                     #         pre_buy[1][6] = self.k_list[-1].datetime
                     #         pre_buy[1] = []
                 # 判断三类买卖点失效
-                if sell[2] and sell[2][0] < last_pivot[1]:
-                    sell[2][5] = 0
-                    sell[2][6] = self.k_list[-1].datetime
-                    sell[2] = []
-
-                if buy[2] and buy[2][0] < last_pivot[1]:
-                    buy[2][5] = 0
-                    buy[2][6] = self.k_list[-1].datetime
-                    buy[2] = []
+                if sell[2] and sell[2].dt < last_pivot.end:
+                    self.on_bs_invalid(sell[2])
+                    sell[2] = None
+
+                if buy[2] and buy[2].dt < last_pivot.end:
+                    self.on_bs_invalid(buy[2])
+                    buy[2] = None
                 sth_pivot = last_pivot
                 # if len(self.pivot_list) > 1:
                 #     sth_pivot = self.pivot_list[-2]
@@ -665,165 +951,158 @@ class Chan_Class:
             if flag:
                 if new_pivot:
                     self.pivot_list.append(new_pivot)
+                    self.emit(DELTA_PIVOT_CREATE, new_pivot, len(self.pivot_list) - 1)
                     # 中枢形成，判断背驰
-                    ts = new_pivot[12]
-                    buy = new_pivot[10]
-                    sell = new_pivot[11]
-                    enter = data[new_pivot[5]][2]
-                    exit = data[new_pivot[6]][2]
-                    ee_data = [[data[new_pivot[5] - 1], data[new_pivot[5]]],
-                               [data[new_pivot[6] - 1], data[new_pivot[6]]]]
-                    if new_pivot[4] == 'up':
-                        if self.on_turn(enter, exit, ee_data, new_pivot[4]) and cur_fx[0] > new_pivot[8]:
-                            ts.append([last_fx[2], cur_fx[2]])
+                    ts = new_pivot.ts
+                    buy = new_pivot.buy
+                    sell = new_pivot.sell
+                    enter = data[new_pivot.enter].index
+                    exit = data[new_pivot.exit].index
+                    ee_data = [[data[new_pivot.enter - 1], data[new_pivot.enter]],
+                               [data[new_pivot.exit - 1], data[new_pivot.exit]]]
+                    if new_pivot.direction == UP:
+                        if self.on_turn(enter, exit, ee_data, new_pivot.direction) and cur_fx.high > new_pivot.gg:
+                            ts.append([last_fx.dt, cur_fx.dt])
+                            self.on_pivot_change()
                             if not sell[0]:
                                 # 形成一卖
-                                ans, qjt_pivot_list = self.qjt_turn(last_fx[2], cur_fx[2], 'up')
+                                ans, qjt_pivot_list = self.qjt_turn(last_fx.dt, cur_fx.dt, UP)
                                 if ans:
-                                    sell[0] = [cur_fx[2], cur_fx[0], 'S1', self.k_list[-1].datetime, len(data) - 1, 1,
-                                               None, self.cal_bs_type(), None, qjt_pivot_list]
+                                    sell[0] = BsPoint(cur_fx.dt, cur_fx.high, S1, self.k_list.datetime_at(-1),
+                                                      len(data) - 1, 1, None, self.cal_bs_type(), None, qjt_pivot_list)
                                     self.on_buy_sell(sell[0])
 
-                    if new_pivot[4] == 'down':
-                        if self.on_turn(enter, exit, ee_data, new_pivot[4]) and cur_fx[1] < new_pivot[9]:
-                            ts.append([last_fx[2], cur_fx[2]])
+                    if new_pivot.direction == DOWN:
+                        if self.on_turn(enter, exit, ee_data, new_pivot.direction) and cur_fx.low < new_pivot.dd:
+                            ts.append([last_fx.dt, cur_fx.dt])
+                            self.on_pivot_change()
                             if not buy[0]:
                                 # 形成一买
-                                ans, qjt_pivot_list = self.qjt_turn(last_fx[2], cur_fx[2], 'down')
+                                ans, qjt_pivot_list = self.qjt_turn(last_fx.dt, cur_fx.dt, DOWN)
                                 if ans:
-                                    buy[0] = [cur_fx[2], cur_fx[1], 'B1', self.k_list[-1].datetime, len(data) - 1, 1,
-                                              None, self.cal_bs_type(), None, qjt_pivot_list]
+                                    buy[0] = BsPoint(cur_fx.dt, cur_fx.low, B1, self.k_list.datetime_at(-1),
+                                                     len(data) - 1, 1, None, self.cal_bs_type(), None, qjt_pivot_list)
                                     if self.gz:
-                                        self.gz_prev_last_bs = self.get_prev_last_bs()
+                                        self.gz_prev_last_bs = self.gz_last_bs
                                         self.gz_tmp_bs = buy
-                                        buy[0][5] = 0
+                                        self.on_pivot_change()
+                                        buy[0].valid = 0
                                     else:
                                         self.on_buy_sell(buy[0])
 
-                    ChanLog.log(self.freq, self.symbol, "pivot_list:")
-                    ChanLog.log(self.freq, self.symbol, new_pivot)
+                    self.log("pivot_list:")
+                    self.log(new_pivot)
                     self.on_trend(new_pivot, data)
 
     def x_bs_pos(self, data, buy, sell, last_pivot, sth_pivot):
         if not self.gz:
-            if buy[0] and len(data) > buy[0][4] and data[buy[0][4]][2] != buy[0][0]:
-                pos_fx = data[buy[0][4]]
-                buy[0][5] = 0
-                buy[0][6] = self.k_list[-1].datetime
+            if buy[0] and len(data) > buy[0].pos and data[buy[0].pos].dt != buy[0].dt:
+                pos_fx = data[buy[0].pos]
+                self.on_bs_invalid(buy[0])
                 # B1<DD
-                buy[0] = [pos_fx[2], pos_fx[1], 'B1', self.k_list[-1].datetime, buy[0][4], 1, None, buy[0][7], None]
+                buy[0] = BsPoint(pos_fx.dt, pos_fx.low, B1, self.k_list.datetime_at(-1), buy[0].pos, 1, None,
+                                 buy[0].trend_type, None)
                 self.on_buy_sell(buy[0])
 
-        if sell[0] and len(data) > sell[0][4] and data[sell[0][4]][2] != sell[0][0]:
-            pos_fx = data[sell[0][4]]
-            sell[0][5] = 0
-            sell[0][6] = self.k_list[-1].datetime
+        if sell[0] and len(data) > sell[0].pos and data[sell[0].pos].dt != sell[0].dt:
+            pos_fx = data[sell[0].pos]
+            self.on_bs_invalid(sell[0])
             # S1>GG
-            sell[0] = [pos_fx[2], pos_fx[0], 'S1', self.k_list[-1].datetime, sell[0][4], 1, None, sell[0][7], None]
+            sell[0] = BsPoint(pos_fx.dt, pos_fx.high, S1, self.k_list.datetime_at(-1), sell[0].pos, 1, None,
+                              sell[0].trend_type, None)
             self.on_buy_sell(sell[0])
 
-        if buy[1] and len(data) > buy[1][4] and data[buy[1][4]][2] != buy[1][0]:
-            pos_fx = data[buy[1][4]]
-            buy[1][5] = 0
-            buy[1][6] = self.k_list[-1].datetime
+        if buy[1] and len(data) > buy[1].pos and data[buy[1].pos].dt != buy[1].dt:
+            pos_fx = data[buy[1].pos]
+            self.on_bs_invalid(buy[1])
             if buy[0]:
-                if pos_fx[1] > buy[0][1]:
+                if pos_fx.low > buy[0].price:
                     # todo 笔延申重新判断为强弱
-                    buy[1] = [pos_fx[2], pos_fx[1], 'B2', self.k_list[-1].datetime, buy[1][4], 1, None, buy[1][7],
-                              self.cal_b2_strength(pos_fx[1], data[buy[1][4]], sth_pivot)]
+                    buy[1] = BsPoint(pos_fx.dt, pos_fx.low, B2, self.k_list.datetime_at(-1), buy[1].pos, 1, None,
+                                     buy[1].trend_type, self.cal_b2_strength(pos_fx.low, data[buy[1].pos], sth_pivot))
                     self.on_buy_sell(buy[1])
                 else:
                     # 一买无效
-                    buy[0][5] = 0
-                    buy[0][6] = self.k_list[-1].datetime
+                    self.on_bs_invalid(buy[0])
 
-        if sell[1] and len(data) > sell[1][4] and data[sell[1][4]][2] != sell[1][0]:
-            pos_fx = data[sell[1][4]]
-            sell[1][5] = 0
-            sell[1][6] = self.k_list[-1].datetime
+        if sell[1] and len(data) > sell[1].pos and data[sell[1].pos].dt != sell[1].dt:
+            pos_fx = data[sell[1].pos]
+            self.on_bs_invalid(sell[1])
 
-            if pos_fx[0] < sell[0][1]:
-                sell[1] = [pos_fx[2], pos_fx[0], 'S2', self.k_list[-1].datetime, sell[1][4], 1, None, sell[1][7], None]
+            if pos_fx.high < sell[0].price:
+                sell[1] = BsPoint(pos_fx.dt, pos_fx.high, S2, self.k_list.datetime_at(-1), sell[1].pos, 1, None,
+                                  sell[1].trend_type, None)
                 self.on_buy_sell(sell[1])
             else:
                 # 一卖无效
-                sell[0][5] = 0
-                sell[0][6] = self.k_list[-1].datetime
-
-        if buy[2] and len(data) > buy[2][4] and data[buy[2][4]][2] != buy[2][0] and buy[2][0] > last_pivot[1]:
-            pos_fx = data[buy[2][4]]
-            buy[2][5] = 0
-            buy[2][6] = self.k_list[-1].datetime
-            if pos_fx[1] > last_pivot[3]:
-                buy[2] = [pos_fx[2], pos_fx[1], 'B3', self.k_list[-1].datetime, buy[2][4], 1, None, buy[2][7],
-                          self.cal_b3_strength(pos_fx[1], sth_pivot)]
-                ChanLog.log(self.freq, self.symbol, 'B3-pivot')
-                ChanLog.log(self.freq, self.symbol, sth_pivot)
-                ChanLog.log(self.freq, self.symbol, buy[2])
+                self.on_bs_invalid(sell[0])
+
+        if buy[2] and len(data) > buy[2].pos and data[buy[2].pos].dt != buy[2].dt and buy[2].dt > last_pivot.end:
+            pos_fx = data[buy[2].pos]
+            self.on_bs_invalid(buy[2])
+            if pos_fx.low > last_pivot.zg:
+                buy[2] = BsPoint(pos_fx.dt, pos_fx.low, B3, self.k_list.datetime_at(-1), buy[2].pos, 1, None,
+                                 buy[2].trend_type, self.cal_b3_strength(pos_fx.low, sth_pivot))
+                self.log('B3-pivot')
+                self.log(sth_pivot)
+                self.log(buy[2])
                 self.on_buy_sell(buy[2])
-        if sell[2] and len(data) > sell[2][4] and data[sell[2][4]][2] != sell[2][0] and sell[2][0] > last_pivot[1]:
-            pos_fx = data[sell[2][4]]
-            sell[2][5] = 0
-            sell[2][6] = self.k_list[-1].datetime
-            if pos_fx[0] < last_pivot[2]:
-                sell[2] = [pos_fx[2], pos_fx[0], 'S3', self.k_list[-1].datetime, sell[2][4], 1, None, sell[2][7], None]
+        if sell[2] and len(data) > sell[2].pos and data[sell[2].pos].dt != sell[2].dt and sell[2].dt > last_pivot.end:
+            pos_fx = data[sell[2].pos]
+            self.on_bs_invalid(sell[2])
+            if pos_fx.high < last_pivot.zd:
+                sell[2] = BsPoint(pos_fx.dt, pos_fx.high, S3, self.k_list.datetime_at(-1), sell[2].pos, 1, None,
+                                  sell[2].trend_type, None)
                 self.on_buy_sell(sell[2])
 
     def cal_bs_type(self):
-        if len(self.pivot_list) > 1 and self.pivot_list[-1][4] == self.pivot_list[-2][4]:
+        if len(self.pivot_list) > 1 and self.pivot_list[-1].direction == self.pivot_list[-2].direction:
             return '趋势'
         return '盘整'
 
     def cal_b3_strength(self, price, last_pivot):
         if last_pivot:
-            if price > last_pivot[8]:
+            if price > last_pivot.gg:
                 return '强'
         return '弱'
 
     def cal_b2_strength(self, price, fx, last_pivot):
         if last_pivot:
-            if price > last_pivot[3]:
+            if price > last_pivot.zg:
                 return '超强'
-            if fx[0] > last_pivot[3]:
+            if fx.high > last_pivot.zg:
                 return '强'
-            if fx[0] > last_pivot[2]:
+            if fx.high > last_pivot.zd:
                 return '中'
         return '弱'
 
     def cal_macd(self, start, end):
-        sum = 0
         if start >= end:
-            return sum
-        if self.include:
-            close_list = np.array([x.close_price for x in self.chan_k_list], dtype=np.double)
-        else:
-            close_list = np.array([x.close_price for x in self.k_list], dtype=np.double)
-        dif, dea, macd = tl.MACD(close_list, fastperiod=12,
-                                 slowperiod=26, signalperiod=9)
-        for i, v in enumerate(macd.tolist()):
-            if start <= i <= end:
-                sum += abs(round(v, 4))
-        return round(sum, 4)
+            return 0
+        # 不包含处理时chan_k_list和k_list相同，统一使用chan_k_list的增量MACD
+        # 前缀和相减，任意笔/线段的面积都是O(1)
+        return self.k_macd.cal_area(start, end)
 
     def on_turn(self, start, end, ee_data, type):
         # ee_data: 笔/段列表 [[start, end]]
         # 判断背驰
-        start_macd = None
-        if start in self.macd:
-            start_macd = self.macd[start]
-        end_macd = None
-        if end in self.macd:
-            end_macd = self.macd[end]
+        # start/end为进入段和离开段结束分型的chan_k_list下标，没有计算过的面积为0
+        start_macd = self.macd[start]
+        end_macd = self.macd[end]
         if start_macd and end_macd:
             if math.isnan(start_macd) or math.isnan(end_macd):
                 if len(ee_data) > 1:
-                    if type == 'down':
-                        enter_slope = (ee_data[0][0][0] - ee_data[0][1][1]) / (ee_data[0][1][4] - ee_data[0][0][4] + 1)
-                        exit_slope = (ee_data[1][0][0] - ee_data[1][1][1]) / (ee_data[1][1][4] - ee_data[1][0][4] + 1)
+                    if type == DOWN:
+                        enter_slope = (ee_data[0][0].high - ee_data[0][1].low) / (
+                                ee_data[0][1].index - ee_data[0][0].index + 1)
+                        exit_slope = (ee_data[1][0].high - ee_data[1][1].low) / (
+                                ee_data[1][1].index - ee_data[1][0].index + 1)
                         return abs(enter_slope) > abs(exit_slope)
                     else:
-                        enter_slope = (ee_data[0][0][1] - ee_data[0][1][0]) / (ee_data[0][1][4] - ee_data[0][0][4] + 1)
-                        exit_slope = (ee_data[1][0][1] - ee_data[1][1][0]) / (ee_data[1][1][4] - ee_data[1][0][4] + 1)
+                        enter_slope = (ee_data[0][0].low - ee_data[0][1].high) / (
+                                ee_data[0][1].index - ee_data[0][0].index + 1)
+                        exit_slope = (ee_data[1][0].low - ee_data[1][1].high) / (
+                                ee_data[1][1].index - ee_data[1][0].index + 1)
                         return abs(enter_slope) > abs(exit_slope)
             else:
                 return start_macd > end_macd
@@ -838,25 +1117,25 @@ class Chan_Class:
         if not chan:
             return True, qjt_pivot_list
         ans = False
-        ChanLog.log(self.freq, self.symbol, '区间套判断背驰：')
-        ChanLog.log(self.freq, self.symbol, self.freq)
-        ChanLog.log(self.freq, self.symbol, str(self.pivot_list[-1]) + ':' + str(start))
+        self.log('区间套判断背驰：')
+        self.log(self.freq)
+        self.log('%s:%s', self.pivot_list[-1], start)
         while chan:
             last_pivot = chan.pivot_list[-1]
             tmp = False
-            if last_pivot[1] > start:
-                if last_pivot[11][0]:
+            if last_pivot.end > start:
+                if last_pivot.sell[0]:
                     tmp = True
-                    start = chan.stroke_list[last_pivot[11][0][4] - 1][2]
+                    start = chan.stroke_list[last_pivot.sell[0].pos - 1].dt
                     if chan.build_pivot:
-                        start = chan.stroke_list[last_pivot[11][0][4] - 1][2]
-                if last_pivot[10][0]:
+                        start = chan.stroke_list[last_pivot.sell[0].pos - 1].dt
+                if last_pivot.buy[0]:
                     tmp = True
-                    start = chan.stroke_list[last_pivot[10][0][4] - 1][2]
+                    start = chan.stroke_list[last_pivot.buy[0].pos - 1].dt
                     if chan.build_pivot:
-                        start = chan.stroke_list[last_pivot[10][0][4] - 1][2]
-            ChanLog.log(self.freq, self.symbol, chan.freq + ':' + str(tmp))
-            ChanLog.log(self.freq, self.symbol, str(last_pivot) + ':' + str(start))
+                        start = chan.stroke_list[last_pivot.buy[0].pos - 1].dt
+            self.log('%s:%s', chan.freq, tmp)
+            self.log('%s:%s', last_pivot, start)
             ans = ans or tmp
             chan = chan.next
         return ans, qjt_pivot_list
@@ -870,19 +1149,19 @@ class Chan_Class:
         if not chan:
             return True, qjt_pivot_list
         ans = False
-        ChanLog.log(self.freq, self.symbol, '区间套判断背驰：')
-        ChanLog.log(self.freq, self.symbol, self.freq)
-        ChanLog.log(self.freq, self.symbol, str(self.pivot_list[-1]) + ':' + str(start))
+        self.log('区间套判断背驰：')
+        self.log(self.freq)
+        self.log('%s:%s', self.pivot_list[-1], start)
         while chan:
             tmp = False
             for i in range(-1, -len(chan.buy_list), -1):
-                buy_dt = chan.buy_list[i]
+                buy_dt = chan.buy_list[i].dt
                 if buy_dt >= end and buy_dt < start:
                     tmp = True
                     break
             tmp = False
             for i in range(-1, -len(chan.sell_list), -1):
-                sell_dt = chan.sell_list[i]
+                sell_dt = chan.sell_list[i].dt
                 if sell_dt >= end and sell_dt < start:
                     tmp = True
                     break
@@ -890,17 +1169,45 @@ class Chan_Class:
             chan = chan.next
         return ans, qjt_pivot_list
 
-    def qjt_pivot(self, data, type):
+    def qjt_pivot(self, data, type, macd=None, k_list=None, log_level=None):
         chan_pivot = Chan_Class(freq=self.freq, symbol=self.symbol, sell=None, buy=None, include=self.include,
-                                include_feature=self.include_feature, build_pivot=self.build_pivot, qjt=False)
-        chan_pivot.macd = self.macd
-        chan_pivot.k_list = self.chan_k_list
+                                include_feature=self.include_feature, build_pivot=self.build_pivot, qjt=False,
+                                log_level=self.log_level if log_level is None else log_level)
+        chan_pivot.macd = self.macd if macd is None else macd
+        chan_pivot.k_list = self.chan_k_list if k_list is None else k_list
         new_data = []
         for d in data:
             new_data.append(d)
             chan_pivot.on_pivot(new_data, type)
         return chan_pivot.pivot_list
 
+    def qjt_evidence(self, data, type):
+        """买卖点里保存的区间套依据，只记录重建需要的输入，见QjtEvidence"""
+        eval_dt = self.chan_k_list.datetime_at(-1) if len(self.chan_k_list) else None
+        # k_macd.offset为on_retain丢弃的chan K线根数
+        offset = self.k_macd.offset
+        return QjtEvidence(self.freq, [fx.index + offset for fx in data], [fx.direction for fx in data], type,
+                           eval_dt, [self.macd[fx.index] for fx in data])
+
+    def rebuild_qjt_pivot(self, evidence):
+        """
+        按QjtEvidence重建qjt_pivot的结果，分型下标平移到从0开始，不影响斜率和MACD的读取
+        分型是chan K线的倒数第二根形成的，之后这根K线不会再改变，高低点和时间从chan_k_list读出
+        """
+        offset = self.k_macd.offset
+        if evidence.index and min(evidence.index) < offset:
+            return []
+        base = min(evidence.index) if evidence.index else 0
+        chan_k_list = self.chan_k_list
+        data = [Fx(chan_k_list.high_array.item(index - offset), chan_k_list.low_array.item(index - offset),
+                   chan_k_list.datetime_at(index - offset), direction, index - base)
+                for index, direction in zip(evidence.index, evidence.direction)]
+        macd = IndexMap()
+        for fx, value in zip(data, evidence.macd):
+            macd[fx.index] = value
+        # 重建不重复写计算日志，只关闭临时Chan_Class的日志，不影响其他策略
+        return self.qjt_pivot(data, evidence.type, macd, FixedTime(evidence.eval_dt), log_level=OFF)
+
     def qjt_turn(self, start, end, type):
         # 区间套判断背驰：重新形成新的中枢和买卖点
         qjt_pivot_list = []
@@ -909,44 +1216,26 @@ class Chan_Class:
         chan = self.next
         if not chan:
             return True, qjt_pivot_list
+        if self.pivot_lower is None:
+            # 区间套读了低级别，它们变了下一次on_pivot不能跳过
+            self.pivot_lower = self.get_lower_state()
         ans = True
-        ChanLog.log(self.freq, self.symbol, '区间套判断背驰：')
-        ChanLog.log(self.freq, self.symbol, self.freq)
+        self.log('区间套判断背驰：')
+        self.log(self.freq)
 
         while chan:
             tmp = False
-            data = []
+            # 低级别[start, end]内的笔/线段，二分查找，见FxList.between
             if chan.build_pivot:
-                for i in range(-1, -len(chan.line_list), -1):
-                    d = chan.line_list[i]
-                    if d[2] >= start:
-                        if d[2] <= end:
-                            data.append(d)
-                    else:
-                        if type == 'up' and d[3] == 'down':
-                            data.append(d)
-                        if type == 'down' and d[3] == 'up':
-                            data.append(d)
-                        break
+                data = chan.line_list.between(start, end, type)
             else:
-                for i in range(-1, -len(chan.stroke_list), -1):
-                    d = chan.stroke_list[i]
-                    if d[2] >= start:
-                        if d[2] <= end:
-                            data.append(d)
-                    else:
-                        if type == 'up' and d[3] == 'down':
-                            data.append(d)
-                        if type == 'down' and d[3] == 'up':
-                            data.append(d)
-                        break
-            data.reverse()
+                data = chan.stroke_list.between(start, end, type)
             chan_pivot_list = chan.qjt_pivot(data, type)
-            ChanLog.log(self.freq, self.symbol, str(self.pivot_list[-1]) + ':' + str(start))
-            ChanLog.log(self.freq, self.symbol, chan_pivot_list)
-            qjt_pivot_list.append(chan_pivot_list)
-            if chan_pivot_list and len(chan_pivot_list[-1][12]) > 0:
-                ts_item = chan_pivot_list[-1][12][-1]
+            self.log('%s:%s', self.pivot_list[-1], start)
+            self.log(chan_pivot_list)
+            qjt_pivot_list.append(chan.qjt_evidence(data, type))
+            if chan_pivot_list and len(chan_pivot_list[-1].ts) > 0:
+                ts_item = chan_pivot_list[-1].ts[-1]
                 start = ts_item[0]
                 end = ts_item[1]
                 tmp = True
@@ -963,9 +1252,9 @@ class Chan_Class:
         qjt_pivot_list = []
         if not self.qjt:
             return True, qjt_pivot_list
-        ChanLog.log(self.freq, self.symbol, '区间套判断有无走势：')
-        ChanLog.log(self.freq, self.symbol, str(start) + '--' + str(end))
-        ChanLog.log(self.freq, self.symbol, str(self.pivot_list[-1]))
+        self.log('区间套判断有无走势：')
+        self.log('%s--%s', start, end)
+        self.log(self.pivot_list[-1])
         chan = self.next
         if not chan:
             return True, qjt_pivot_list
@@ -974,11 +1263,11 @@ class Chan_Class:
             tmp = False
             for i in range(-1, -len(chan.pivot_list), -1):
                 last_pivot = chan.pivot_list[i]
-                if last_pivot[1] <= end and last_pivot[0] >= start:
+                if last_pivot.end <= end and last_pivot.start >= start:
                     tmp = True
                     break
             ans = ans or tmp
-            ChanLog.log(self.freq, self.symbol, chan.freq + ':' + str(tmp))
+            self.log('%s:%s', chan.freq, tmp)
             chan = chan.next
         return ans, qjt_pivot_list
 
@@ -990,42 +1279,24 @@ class Chan_Class:
         chan = self.next
         if not chan:
             return True, qjt_pivot_list
+        if self.pivot_lower is None:
+            # 区间套读了低级别，它们变了下一次on_pivot不能跳过
+            self.pivot_lower = self.get_lower_state()
         ans = False
-        ChanLog.log(self.freq, self.symbol, '区间套判断背驰：')
-        ChanLog.log(self.freq, self.symbol, self.freq)
+        self.log('区间套判断背驰：')
+        self.log(self.freq)
 
         while chan:
             tmp = False
-            data = []
+            # 低级别[start, end]内的笔/线段，二分查找，见FxList.between
             if chan.build_pivot:
-                for i in range(-1, -len(chan.line_list), -1):
-                    d = chan.line_list[i]
-                    if d[2] >= start:
-                        if d[2] <= end:
-                            data.append(d)
-                    else:
-                        if type == 'up' and d[3] == 'down':
-                            data.append(d)
-                        if type == 'down' and d[3] == 'up':
-                            data.append(d)
-                        break
+                data = chan.line_list.between(start, end, type)
             else:
-                for i in range(-1, -len(chan.stroke_list), -1):
-                    d = chan.stroke_list[i]
-                    if d[2] >= start:
-                        if d[2] <= end:
-                            data.append(d)
-                    else:
-                        if type == 'up' and d[3] == 'down':
-                            data.append(d)
-                        if type == 'down' and d[3] == 'up':
-                            data.append(d)
-                        break
-            data.reverse()
+                data = chan.stroke_list.between(start, end, type)
             chan_pivot_list = chan.qjt_pivot(data, type)
-            ChanLog.log(self.freq, self.symbol, str(self.pivot_list[-1]) + ':' + str(start))
-            ChanLog.log(self.freq, self.symbol, chan_pivot_list)
-            qjt_pivot_list.append(chan_pivot_list)
+            self.log('%s:%s', self.pivot_list[-1], start)
+            self.log(chan_pivot_list)
+            qjt_pivot_list.append(chan.qjt_evidence(data, type))
             if not len(chan_pivot_list) > 0:
                 chan = chan.next
             else:
@@ -1039,92 +1310,95 @@ class Chan_Class:
     def on_gz(self):
         """共振处理：只关联上一个级别"""
         # 暂时 只处理买点B1
-        chan = self.prev
-        if not chan:
+        # 上一个级别的买点由订阅推送，这里只处理计数和确认
+        if not self.prev:
             return
-        last_bs = None
-        if len(chan.buy_list) > 0:
-            last_bs = chan.buy_list[-1]
+        last_bs = self.gz_last_bs
         # B1不成立
-        if self.gz_delay_k_num >= self.gz_delay_k_max or (len(self.gz_tmp_bs) > 4 and self.gz_tmp_bs[0][5] == 0) or not \
+        if self.gz_delay_k_num >= self.gz_delay_k_max or (len(self.gz_tmp_bs) > 4 and self.gz_tmp_bs[0].valid == 0) or not \
                 self.gz_tmp_bs[0]:
             self.gz_delay_k_num = 0
             self.gz_prev_last_bs = None
-            self.gz_tmp_bs[0] = []
+            self.gz_tmp_bs[0] = None
             self.gz_tmp_bs = None
+            self.on_pivot_change()
         else:
-            if last_bs and last_bs != self.gz_prev_last_bs and (
-                    last_bs[1] == 'B2' or last_bs[2] == 'B3' or last_bs[2] == 'B1'):
-                ChanLog.log(self.freq, self.symbol, 'gz:' + str(self.gz_delay_k_num) + ':')
-                ChanLog.log(self.freq, self.symbol, last_bs)
-                ChanLog.log(self.freq, self.symbol, self.gz_prev_last_bs)
-                ChanLog.log(self.freq, self.symbol, self.gz_tmp_bs[0])
+            # 原来的判断写成了last_bs[1] == 'B2'(价格)，实际只有B1/B3生效
+            if last_bs and last_bs is not self.gz_prev_last_bs and last_bs.kind in (B1, B3):
+                self.log('gz:%s:', self.gz_delay_k_num)
+                self.log(last_bs)
+                self.log(self.gz_prev_last_bs)
+                self.log(self.gz_tmp_bs[0])
                 if self.gz_tmp_bs[0]:
-                    self.gz_tmp_bs[0][3] = self.k_list[-1].datetime
-                    self.gz_tmp_bs[0][5] = 1
+                    self.gz_tmp_bs[0].eval_dt = self.k_list.datetime_at(-1)
+                    self.gz_tmp_bs[0].valid = 1
                     self.on_buy_sell(self.gz_tmp_bs[0])
                 self.gz_delay_k_num = 0
                 self.gz_prev_last_bs = None
                 self.gz_tmp_bs = None
 
     def get_prev_last_bs(self):
-        chan = self.prev
-        if not chan or len(chan.buy_list) < 1:
-            return None
-        return chan.buy_list[-1]
+        return self.gz_last_bs
 
     def on_trend(self, new_pivot, data):
         # 走势列表[[日期1，日期2，走势类型，[背驰点], [中枢]]]
         if not self.trend_list:
             type = 'pzup'
-            if new_pivot[4] == 'down':
+            if new_pivot.direction == DOWN:
                 type = 'pzdown'
-            self.trend_list.append([new_pivot[0], new_pivot[1], type, [], [len(self.pivot_list) - 1]])
+            self.trend_list.append([new_pivot.start, new_pivot.end, type, [], [len(self.pivot_list) - 1]])
         else:
             last_trend = self.trend_list[-1]
             if last_trend[2] == 'up':
-                if new_pivot[4] == 'up':
-                    last_trend[1] = new_pivot[1]
+                if new_pivot.direction == UP:
+                    last_trend[1] = new_pivot.end
                     last_trend[4].append(len(self.pivot_list) - 1)
                 else:
-                    self.trend_list.append([new_pivot[0], new_pivot[1], 'pzdown', [], [len(self.pivot_list) - 1]])
+                    self.trend_list.append([new_pivot.start, new_pivot.end, 'pzdown', [], [len(self.pivot_list) - 1]])
             if last_trend[2] == 'down':
-                if new_pivot[4] == 'down':
-                    last_trend[1] = new_pivot[1]
+                if new_pivot.direction == DOWN:
+                    last_trend[1] = new_pivot.end
                     last_trend[4].append(len(self.pivot_list) - 1)
                 else:
-                    self.trend_list.append([new_pivot[0], new_pivot[1], 'pzup', [], [len(self.pivot_list) - 1]])
+                    self.trend_list.append([new_pivot.start, new_pivot.end, 'pzup', [], [len(self.pivot_list) - 1]])
             if last_trend[2] == 'pzup':
-                if new_pivot[4] == 'up':
-                    last_trend[1] = new_pivot[1]
+                if new_pivot.direction == UP:
+                    last_trend[1] = new_pivot.end
                     last_trend[4].append(len(self.pivot_list) - 1)
                     last_trend[2] = 'up'
                 else:
-                    self.trend_list.append([new_pivot[0], new_pivot[1], 'pzdown', [], [len(self.pivot_list) - 1]])
+                    self.trend_list.append([new_pivot.start, new_pivot.end, 'pzdown', [], [len(self.pivot_list) - 1]])
             if last_trend[2] == 'pzdown':
-                if new_pivot[4] == 'down':
-                    last_trend[1] = new_pivot[1]
+                if new_pivot.direction == DOWN:
+                    last_trend[1] = new_pivot.end
                     last_trend[4].append(len(self.pivot_list) - 1)
                     last_trend[2] = 'down'
                 else:
-                    self.trend_list.append([new_pivot[0], new_pivot[1], 'pzup', [], [len(self.pivot_list) - 1]])
+                    self.trend_list.append([new_pivot.start, new_pivot.end, 'pzup', [], [len(self.pivot_list) - 1]])
+
+    def on_bs_invalid(self, data):
+        """买卖点失效，失效时间为最后一根K线的时间"""
+        data.valid = 0
+        data.invalid_dt = self.k_list.datetime_at(-1)
+        self.emit(DELTA_BS_INVALID, data)
 
     def on_buy_sell(self, data, valid=True):
         if not data:
             return
-        # 买点列表[[日期，值，类型, evaluation_time, 买点位置=index of stroke/line, valid, invalid_time, 类型, 强弱, qjt_pivot_list]]
-        # 卖点列表[[日期，值，类型, evaluation_time, 买点位置=index of stroke/line, valid, invalid_time, 类型, 强弱, qjt_pivot_list]]
+        # 买点列表[BsPoint]，卖点列表[BsPoint]，见BsPoint
         if valid:
-            if data[2].startswith('B'):
-                ChanLog.log(self.freq, self.symbol, 'buy:')
-                ChanLog.log(self.freq, self.symbol, data)
+            if data.kind > 0:
+                self.log('buy:', level=INFO)
+                self.log(data, level=INFO)
                 self.buy_list.append(data)
+                self.emit(DELTA_BS_CREATE, data)
                 if self.buy:
                     self.buy(self.k_list[-1].close_price, 100, self.freq)
             else:
-                ChanLog.log(self.freq, self.symbol, 'sell:')
-                ChanLog.log(self.freq, self.symbol, data)
+                self.log('sell:', level=INFO)
+                self.log(data, level=INFO)
                 self.sell_list.append(data)
+                self.emit(DELTA_BS_CREATE, data)
                 if self.sell:
                     self.sell(self.k_list[-1].close_price, 100, self.freq)
         else:
@@ -0,0 +1,130 @@
+import math
+
+
+class ChanMacd:
+    """
+    逐根K线增量计算MACD，结果与talib.MACD(close, fastperiod, slowperiod, signalperiod)一致，运算顺序相同，
+    talib编译时可能把DEA的乘加合并成FMA，这时只有最后一位不同
+    talib的EMA以前period根的SMA为种子: 慢线种子为[0, slow)，快线种子为[slow - fast, slow)，
+    DEA种子为前signal个DIF，所以前slow + signal - 2根K线的值为nan
+    """
+
+    def __init__(self, fast_period=12, slow_period=26, signal_period=9):
+        self.fast_period = fast_period
+        self.slow_period = slow_period
+        self.signal_period = signal_period
+        self.fast_k = 2.0 / (fast_period + 1)
+        self.slow_k = 2.0 / (slow_period + 1)
+        self.signal_k = 2.0 / (signal_period + 1)
+        # 第一个有效DIF/DEA的位置
+        self.dif_start = slow_period - 1
+        self.start = self.dif_start + signal_period - 1
+
+        self.dif = []
+        self.dea = []
+        self.macd = []
+        # abs(round(macd, 4))的前缀和，以0.0001为单位存整数，区间和没有浮点累加误差
+        # area[i]为前i根K线的和，nan按0累加
+        self.area = [0]
+        # 计算种子需要的收盘价和DIF，种子算完后不再增长
+        self.seed_close = []
+        self.seed_dif = []
+        # 上一根K线的[fast_ema, slow_ema, dea]，最后一根K线改写时从它重新计算
+        self.prev_state = None
+        self.state = None
+        # trim()丢弃的K线数，列表下标加offset为K线的绝对位置
+        self.offset = 0
+
+    def __len__(self):
+        return len(self.macd)
+
+    def append(self, close):
+        """新增一根K线"""
+        self.prev_state = self.state
+        self.dif.append(math.nan)
+        self.dea.append(math.nan)
+        self.macd.append(math.nan)
+        self.area.append(self.area[-1])
+        if len(self.seed_close) < self.slow_period:
+            self.seed_close.append(close)
+        self.on_close(close)
+
+    def extend(self, closes):
+        """批量新增K线"""
+        for close in closes:
+            self.append(close)
+
+    def update(self, close):
+        """最后一根K线被包含处理改写"""
+        if not self.macd:
+            self.append(close)
+            return
+        n = len(self.macd) + self.offset
+        if n <= self.slow_period:
+            self.seed_close[-1] = close
+        if n <= self.start + 1 and n > self.dif_start:
+            self.seed_dif.pop()
+        self.on_close(close)
+
+    def on_close(self, close):
+        pos = len(self.macd) - 1
+        i = pos + self.offset
+        if i < self.dif_start:
+            self.state = None
+            return
+
+        if i == self.dif_start:
+            fast_ema = self.cal_sma(self.seed_close, self.dif_start + 1 - self.fast_period, self.dif_start + 1)
+            slow_ema = self.cal_sma(self.seed_close, 0, self.dif_start + 1)
+        else:
+            prev_fast, prev_slow, _ = self.prev_state
+            fast_ema = ((close - prev_fast) * self.fast_k) + prev_fast
+            slow_ema = ((close - prev_slow) * self.slow_k) + prev_slow
+        dif = fast_ema - slow_ema
+
+        dea = math.nan
+        if i <= self.start:
+            self.seed_dif.append(dif)
+            if i == self.start:
+                dea = self.cal_sma(self.seed_dif, 0, self.signal_period)
+        else:
+            prev_dea = self.prev_state[2]
+            dea = ((dif - prev_dea) * self.signal_k) + prev_dea
+        self.state = [fast_ema, slow_ema, dea]
+
+        if i >= self.start:
+            macd = dif - dea
+            self.dif[pos] = dif
+            self.dea[pos] = dea
+            self.macd[pos] = macd
+            self.area[pos + 1] = self.area[pos] + round(abs(round(macd, 4)) * 10000)
+
+    def cal_area(self, start, end):
+        """
+        第start到第end根K线(包含两端)的abs(round(macd, 4))之和，保留4位小数
+        区间内有nan时返回nan
+        """
+        end = min(end, len(self.macd) - 1)
+        if start > end:
+            return 0
+        if start + self.offset < self.start:
+            return math.nan
+        return (self.area[end + 1] - self.area[start]) / 10000
+
+    def trim(self, count):
+        """丢弃前count根K线，只能在种子算完之后调用，之后的下标都减count"""
+        if count <= 0:
+            return
+        del self.dif[:count]
+        del self.dea[:count]
+        del self.macd[:count]
+        del self.area[:count]
+        self.offset += count
+
+    @staticmethod
+    def cal_sma(data, start, end):
+        # 和talib一样顺序累加，保证浮点结果一致
+        total = 0.0
+        for i in range(start, end):
+            total += data[i]
+        return total / (end - start)
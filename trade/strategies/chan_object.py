@@ -0,0 +1,368 @@
+"""
+缠论计算的数据结构
+分型、买卖点、中枢用__slots__类代替原来的定长list，方向和买卖点类型用整数比较
+下标访问和to_list()返回原来list格式的值(方向'up'/'down'，类型'B1'...'S3')，供图表和导出使用
+"""
+import bisect
+
+# 分型/笔/线段/中枢方向
+UP = 1
+DOWN = -1
+
+DIRECTION_NAME = {UP: 'up', DOWN: 'down'}
+
+# 买卖点类型，买点为正，卖点为负
+B1 = 1
+B2 = 2
+B3 = 3
+S1 = -1
+S2 = -2
+S3 = -3
+
+BS_NAME = {B1: 'B1', B2: 'B2', B3: 'B3', S1: 'S1', S2: 'S2', S3: 'S3'}
+
+# 结构变化事件类型，见ChanDelta
+DELTA_FX = 'fx'
+DELTA_STROKE_APPEND = 'stroke_append'
+DELTA_STROKE_EXTEND = 'stroke_extend'
+DELTA_STROKE_REPLACE = 'stroke_replace'
+DELTA_LINE_APPEND = 'line_append'
+DELTA_LINE_EXTEND = 'line_extend'
+DELTA_LINE_REPLACE = 'line_replace'
+DELTA_LINE_REMOVE = 'line_remove'
+DELTA_PIVOT_CREATE = 'pivot_create'
+DELTA_PIVOT_UPDATE = 'pivot_update'
+DELTA_PIVOT_REMOVE = 'pivot_remove'
+DELTA_BS_CREATE = 'bs_create'
+DELTA_BS_INVALID = 'bs_invalid'
+DELTA_RETAIN = 'retain'
+# 中枢和买卖点的变化
+PIVOT_DELTAS = {DELTA_PIVOT_CREATE, DELTA_PIVOT_UPDATE, DELTA_PIVOT_REMOVE, DELTA_BS_CREATE, DELTA_BS_INVALID,
+                DELTA_RETAIN}
+# 笔和线段的改写，index为改写的位置
+STROKE_DELTAS = {DELTA_STROKE_APPEND, DELTA_STROKE_EXTEND, DELTA_STROKE_REPLACE}
+LINE_DELTAS = {DELTA_LINE_APPEND, DELTA_LINE_EXTEND, DELTA_LINE_REPLACE, DELTA_LINE_REMOVE}
+
+
+def get_field(obj, fields, i):
+    """按原list格式的下标取属性，fields为每个下标对应的属性名，支持负数下标和切片"""
+    if isinstance(i, slice):
+        return [getattr(obj, name) for name in fields[i]]
+    return getattr(obj, fields[i])
+
+
+class Fx:
+    """
+    分型，笔和线段由分型构成
+    原list格式：[high, low, dt, direction, index of chan_k_list]
+    """
+    __slots__ = ('high', 'low', 'dt', 'direction', 'index')
+    # 原list格式每个下标对应的属性
+    _fields = ('high', 'low', 'dt', 'direction_name', 'index')
+
+    def __init__(self, high, low, dt, direction, index):
+        self.high = high
+        self.low = low
+        self.dt = dt
+        self.direction = direction
+        self.index = index
+
+    @property
+    def direction_name(self):
+        return DIRECTION_NAME[self.direction]
+
+    def to_list(self):
+        return [self.high, self.low, self.dt, DIRECTION_NAME[self.direction], self.index]
+
+    def __getitem__(self, i):
+        return get_field(self, self._fields, i)
+
+    def __repr__(self):
+        return repr(self.to_list())
+
+
+class BsPoint:
+    """
+    买卖点
+    原list格式：[日期，值，类型, evaluation_time, 买点位置=index of stroke/line, valid, invalid_time, 类型, 强弱,
+    qjt_pivot_list]
+    qjt为[QjtEvidence]，to_list(chan_map)时才重建出qjt_pivot_list，不给chan_map时为qjt本身
+    """
+    __slots__ = ('dt', 'price', 'kind', 'eval_dt', 'pos', 'valid', 'invalid_dt', 'trend_type', 'strength', 'qjt')
+    # 原list格式每个下标对应的属性，没有qjt时没有最后一项
+    _fields = ('dt', 'price', 'name', 'eval_dt', 'pos', 'valid', 'invalid_dt', 'trend_type', 'strength', 'qjt')
+    _fields_no_qjt = _fields[:-1]
+
+    def __init__(self, dt, price, kind, eval_dt, pos, valid=1, invalid_dt=None, trend_type=None, strength=None,
+                 qjt=None):
+        self.dt = dt
+        self.price = price
+        self.kind = kind
+        self.eval_dt = eval_dt
+        self.pos = pos
+        self.valid = valid
+        self.invalid_dt = invalid_dt
+        self.trend_type = trend_type
+        self.strength = strength
+        self.qjt = qjt
+
+    @property
+    def name(self):
+        return BS_NAME[self.kind]
+
+    def qjt_pivot_list(self, chan_map):
+        """重建区间套的中枢列表，chan_map为Chan_Strategy.chan_freq_map"""
+        return [evidence.pivots(chan_map) for evidence in self.qjt]
+
+    def to_list(self, chan_map=None):
+        data = [self.dt, self.price, BS_NAME[self.kind], self.eval_dt, self.pos, self.valid, self.invalid_dt,
+                self.trend_type, self.strength]
+        if self.qjt is not None:
+            data.append(self.qjt_pivot_list(chan_map) if chan_map is not None else list(self.qjt))
+        return data
+
+    def __getitem__(self, i):
+        return get_field(self, self._fields if self.qjt is not None else self._fields_no_qjt, i)
+
+    def __repr__(self):
+        return repr(self.to_list())
+
+
+class Pivot:
+    """
+    中枢
+    原list格式：[日期1，日期2，中枢低点，中枢高点, 中枢类型，中枢进入段，中枢离开段, 形成时间, GG, DD, BS, BS, TS]
+    buy/sell为[一类, 二类, 三类]买卖点，没有时为None；ts为背驰段[[开始时间, 结束时间]]
+    """
+    __slots__ = ('start', 'end', 'zd', 'zg', 'direction', 'enter', 'exit', 'dt', 'gg', 'dd', 'buy', 'sell', 'ts')
+    # 原list格式每个下标对应的属性
+    _fields = ('start', 'end', 'zd', 'zg', 'direction_name', 'enter', 'exit', 'dt', 'gg', 'dd', 'buy_list',
+               'sell_list', 'ts')
+
+    def __init__(self, start, end, zd, zg, direction, enter, exit, dt, gg, dd):
+        self.start = start
+        self.end = end
+        self.zd = zd
+        self.zg = zg
+        self.direction = direction
+        self.enter = enter
+        self.exit = exit
+        self.dt = dt
+        self.gg = gg
+        self.dd = dd
+        self.buy = [None, None, None]
+        self.sell = [None, None, None]
+        self.ts = []
+
+    @property
+    def direction_name(self):
+        return DIRECTION_NAME[self.direction]
+
+    @property
+    def buy_list(self):
+        return [bs.to_list() if bs else [] for bs in self.buy]
+
+    @property
+    def sell_list(self):
+        return [bs.to_list() if bs else [] for bs in self.sell]
+
+    def to_list(self, chan_map=None):
+        """chan_map见BsPoint.to_list"""
+        return [self.start, self.end, self.zd, self.zg, DIRECTION_NAME[self.direction], self.enter, self.exit,
+                self.dt, self.gg, self.dd, [bs.to_list(chan_map) if bs else [] for bs in self.buy],
+                [bs.to_list(chan_map) if bs else [] for bs in self.sell], self.ts]
+
+    def __getitem__(self, i):
+        return get_field(self, self._fields, i)
+
+    def __repr__(self):
+        return repr(self.to_list())
+
+
+class QjtEvidence:
+    """
+    区间套判断的依据：低级别chan在[start, end]内的笔/线段重建出的中枢列表
+    只保存级别和重建需要的输入：分型所在chan K线的绝对下标(不受on_retain影响)和方向、MACD面积、买卖点评估时间，
+    分型的高低点和时间从低级别的chan_k_list读出，pivots()时重新计算，结果和判断时相同
+    """
+    __slots__ = ('freq', 'index', 'direction', 'type', 'eval_dt', 'macd')
+
+    def __init__(self, freq, index, direction, type, eval_dt, macd):
+        self.freq = freq
+        self.index = tuple(index)
+        self.direction = tuple(direction)
+        self.type = type
+        self.eval_dt = eval_dt
+        self.macd = tuple(macd)
+
+    def __getstate__(self):
+        return self.freq, self.index, self.direction, self.type, self.eval_dt, self.macd
+
+    def __setstate__(self, state):
+        self.freq, self.index, self.direction, self.type, self.eval_dt, self.macd = state
+
+    def pivots(self, chan_map):
+        """chan_map为Chan_Strategy.chan_freq_map，分型所在的K线已经被on_retain丢弃时返回[]"""
+        return chan_map[self.freq].rebuild_qjt_pivot(self)
+
+    def __repr__(self):
+        if not self.index:
+            return 'QjtEvidence(%s, [])' % self.freq
+        return 'QjtEvidence(%s, [%s, %s], %s)' % (self.freq, self.index[0], self.index[-1], len(self.index))
+
+
+class FixedTime:
+    """重建区间套中枢时代替k_list，datetime_at()都返回判断时的评估时间"""
+    __slots__ = ('dt',)
+
+    def __init__(self, dt):
+        self.dt = dt
+
+    def datetime_at(self, index):
+        return self.dt
+
+
+class ChanDelta:
+    """
+    Chan_Class的一次结构变化，由Chan_Class.subscribe订阅
+    kind：DELTA_*
+    data：变化后的Fx/Pivot/BsPoint；DELTA_RETAIN为丢弃的(分型数, 笔数, 线段数, 中枢数)
+    index：data在fx_list/stroke_list/line_list/pivot_list中的位置，买卖点和DELTA_RETAIN为None
+    append为新增，extend为最后一个被同方向更高的顶或更低的底替换，replace为倒数第二个被修正，
+    remove为最后一个被去掉(特征序列划分的线段确认前突破起点)，index为去掉前的位置
+    """
+    __slots__ = ('kind', 'data', 'index')
+
+    def __init__(self, kind, data, index=None):
+        self.kind = kind
+        self.data = data
+        self.index = index
+
+    def __repr__(self):
+        return 'ChanDelta(%s, %s, %s)' % (self.kind, self.index, self.data)
+
+
+class FxList(list):
+    """
+    stroke_list/line_list：分型列表，同时维护分型时间的有序列表dts，区间套按时间取笔/线段时二分查找
+    所有改变列表的操作都经过_replace()，只重新统计被改动位置两侧的相邻分型，dts和列表保持一致
+    inversions为相邻分型时间逆序的个数，不为0时按原来的方式从后往前遍历
+    """
+
+    def __init__(self, iterable=()):
+        super().__init__(iterable)
+        self.reset()
+
+    def __reduce__(self):
+        return self.__class__, (list(self),)
+
+    def reset(self):
+        """按列表重建dts和inversions，只用于步长不为1的切片赋值、排序等不常用的操作"""
+        self.dts = [fx.dt for fx in self]
+        self.inversions = self.count_inversions(0, len(self.dts))
+
+    def count_inversions(self, start, end):
+        """dts[start:end]内相邻逆序的个数，第j个分型和前一个比较"""
+        dts = self.dts
+        return sum(1 for i in range(max(start, 1), min(end, len(dts))) if dts[i - 1] > dts[i])
+
+    def _replace(self, start, stop, items):
+        """[start, stop)替换为items，只重新统计改动位置和它前后的相邻分型"""
+        self.inversions -= self.count_inversions(start, stop + 1)
+        super().__setitem__(slice(start, stop), items)
+        self.dts[start:stop] = [fx.dt for fx in items]
+        self.inversions += self.count_inversions(start, start + len(items) + 1)
+
+    def _range(self, index):
+        """下标或者步长为1的切片 -> [start, stop)，步长不为1时为None"""
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return None
+            return start, max(start, stop)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('FxList index out of range')
+        return index, index + 1
+
+    def append(self, fx):
+        self._replace(len(self), len(self), [fx])
+
+    def extend(self, iterable):
+        self._replace(len(self), len(self), list(iterable))
+
+    def __iadd__(self, iterable):
+        self.extend(iterable)
+        return self
+
+    def insert(self, index, fx):
+        start, _, _ = slice(index, index).indices(len(self))
+        self._replace(start, start, [fx])
+
+    def __setitem__(self, index, value):
+        span = self._range(index)
+        if span is None:
+            super().__setitem__(index, value)
+            self.reset()
+            return
+        self._replace(span[0], span[1], list(value) if isinstance(index, slice) else [value])
+
+    def __delitem__(self, index):
+        span = self._range(index)
+        if span is None:
+            super().__delitem__(index)
+            self.reset()
+            return
+        self._replace(span[0], span[1], [])
+
+    def pop(self, index=-1):
+        start, stop = self._range(index)
+        fx = self[start]
+        self._replace(start, stop, [])
+        return fx
+
+    def remove(self, fx):
+        del self[self.index(fx)]
+
+    def clear(self):
+        self._replace(0, len(self), [])
+
+    def __imul__(self, n):
+        super().__imul__(n)
+        self.reset()
+        return self
+
+    def sort(self, *args, **kwargs):
+        super().sort(*args, **kwargs)
+        self.reset()
+
+    def reverse(self):
+        super().reverse()
+        self.reset()
+
+    def between(self, start, end, direction):
+        """
+        区间套取时间在[start, end]内的分型，再往前补一个方向和direction相反的分型
+        和从后往前遍历的结果相同：不看第一个分型，遇到时间早于start的分型就停止
+        """
+        if self.inversions:
+            data = []
+            for i in range(-1, -len(self), -1):
+                d = self[i]
+                if d.dt >= start:
+                    if d.dt <= end:
+                        data.append(d)
+                else:
+                    if d.direction == -direction:
+                        data.append(d)
+                    break
+            data.reverse()
+            return data
+        lo = bisect.bisect_left(self.dts, start)
+        hi = bisect.bisect_right(self.dts, end)
+        data = self[max(lo, 1):max(hi, 1)]
+        if lo > 1 and self[lo - 1].direction == -direction:
+            data.insert(0, self[lo - 1])
+        return data
+
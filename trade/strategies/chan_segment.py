@@ -0,0 +1,226 @@
+"""
+特征序列划分线段，include_feature=True时Chan_Class.on_line使用
+1. 向上线段的特征序列是其中的向下笔，每个元素为[顶的high, 底的low]，向下线段对称
+2. 线段的极值点(向上线段的最高顶)之后的元素按线段方向做包含处理：向上线段取高高，向下线段取低低
+3. 极值点前后的两个元素和之后第一个不被包含的元素构成特征序列的分型，线段在极值点结束
+   第一种情况：第一、二元素之间没有缺口，分型出现即确认
+   第二种情况：有缺口，要等从极值点开始的反向线段的特征序列也出现分型才确认，之前创出新高则原线段延续
+4. 线段确认前跌破起点(向下线段为突破起点)说明上一条线段没有结束：去掉这条线段已经输出的极值点，
+   上一条线段延伸到新的极值点，它又成为没有确认的线段；
+   当前线段的极值点已经超过上一条线段的起点时上一条线段不能延伸，当前线段在极值点结束；
+   第一条线段被突破起点时重新开始。线段至少三笔，极值点在第一笔时不输出
+只处理不会再改写的笔端点(stroke_list倒数第三个及之前)，每个端点只在确认线段时再回放一次，均摊O(1)
+"""
+from .chan_object import UP
+
+# SegmentState.feed()的结果
+SEGMENT_PEAK = 1
+SEGMENT_END = 2
+
+# FeatureSegment.feed()输出的线段变化
+SEGMENT_APPEND = 1
+SEGMENT_EXTEND = 2
+# 去掉最后一个端点
+SEGMENT_REMOVE = 3
+
+
+class SegmentState:
+    """
+    一条线段的特征序列状态
+    方向统一成向上线段处理：向下线段的高低点取负数并交换
+    元素为(high, low)
+    """
+    __slots__ = ('direction', 'start', 'start_pos', 'peak', 'peak_pos', 'e1', 'e2', 'last', 'top', 'gap',
+                 'buffer', 'published')
+
+    def __init__(self, direction, start, start_pos):
+        self.direction = direction
+        self.start = start
+        self.start_pos = start_pos
+        # 线段的极值点，向上线段为最高的顶
+        self.peak = None
+        self.peak_pos = -1
+        # 极值点之前的元素、极值点开始的元素(已做包含处理)和最后一个元素
+        self.e1 = None
+        self.e2 = None
+        self.last = None
+        # 极值点之后正在形成的元素的起点
+        self.top = None
+        # 第一、二元素之间有缺口
+        self.gap = False
+        # 极值点之后的笔端点[(fx, pos)]，线段确认后回放给反向线段
+        self.buffer = []
+        # 极值点已经加入line_list
+        self.published = False
+
+    def hi(self, fx):
+        return fx.high if self.direction == UP else -fx.low
+
+    def lo(self, fx):
+        return fx.low if self.direction == UP else -fx.high
+
+    def feed(self, fx, pos):
+        """输入下一个笔端点，返回SEGMENT_PEAK(新的极值点)、SEGMENT_END(特征序列出现分型)或None"""
+        if fx.direction == self.direction:
+            value = self.hi(fx)
+            if self.peak is None or value > self.hi(self.peak):
+                self.e1 = self.last
+                self.peak = fx
+                self.peak_pos = pos
+                self.e2 = None
+                self.top = None
+                self.buffer = []
+                return SEGMENT_PEAK
+            self.top = value
+            self.buffer.append((fx, pos))
+            return None
+
+        if self.peak is None:
+            return None
+        self.buffer.append((fx, pos))
+        if self.e2 is None:
+            self.e2 = self.last = (self.hi(self.peak), self.lo(fx))
+            return None
+        high, low = self.e2
+        element = (self.top, self.lo(fx))
+        if (element[0] <= high and element[1] >= low) or (element[0] >= high and element[1] <= low):
+            # 包含处理
+            self.e2 = self.last = (max(high, element[0]), max(low, element[1]))
+            return None
+        self.last = element
+        if self.e1 is None:
+            # 极值点前没有元素，构不成分型
+            return None
+        self.gap = low > self.e1[0]
+        return SEGMENT_END
+
+
+class FeatureSegment:
+    """
+    特征序列划分线段
+    feed()依次输入确定的笔端点和它在stroke_list中的绝对位置，
+    返回线段端点的变化[(SEGMENT_APPEND/SEGMENT_EXTEND, fx, pos)]，SEGMENT_REMOVE时fx和pos为None
+    line_list的最后一个端点是当前线段的极值点，之后还会延伸；第一条线段确认前不输出
+    """
+
+    def __init__(self):
+        self.state = None
+        # 第二种情况下从极值点开始的反向线段
+        self.pending = None
+        self.started = False
+        self.changes = []
+        # 各条线段的起点[(fx, pos)]，最后一个是当前线段的，上一条线段延伸时从它的起点重建状态
+        self.starts = []
+        # starts[0]是第一条线段的起点，trim()丢弃之后为False
+        self.first = True
+        # starts[0]开始的笔端点[(fx, pos)]，pos连续
+        self.items = []
+
+    def feed(self, fx, pos):
+        self.changes = []
+        self.items.append((fx, pos))
+        self.on_fx(fx, pos)
+        return self.changes
+
+    def on_fx(self, fx, pos):
+        state = self.state
+        if state is None:
+            # 底开始向上线段，顶开始向下线段
+            self.state = SegmentState(-fx.direction, fx, pos)
+            return
+        if not self.started and fx.direction != state.direction and state.lo(fx) < state.lo(state.start):
+            # 第一条线段确认前出现更低的起点，从这里重新开始
+            self.state = SegmentState(state.direction, fx, pos)
+            self.pending = None
+            return
+        if self.started and fx.direction != state.direction and state.lo(fx) < state.lo(state.start):
+            if self.on_revert(fx, pos):
+                return
+            state = self.state
+
+        result = state.feed(fx, pos)
+        if result == SEGMENT_PEAK:
+            self.pending = None
+            if self.started and state.e1 is not None:
+                self.changes.append((SEGMENT_EXTEND if state.published else SEGMENT_APPEND, fx, pos))
+                state.published = True
+            return
+        if self.pending is None:
+            if result == SEGMENT_END:
+                if not state.gap:
+                    self.on_end()
+                    return
+                self.pending = SegmentState(-state.direction, state.peak, state.peak_pos)
+                for item in state.buffer:
+                    if self.pending.feed(*item) == SEGMENT_END:
+                        self.on_end()
+                        return
+            return
+        if self.pending.feed(fx, pos) == SEGMENT_END:
+            self.on_end()
+
+    def on_end(self):
+        """当前线段在极值点结束，反向线段从极值点开始，回放极值点之后的笔端点"""
+        state = self.state
+        if not self.started:
+            self.changes.append((SEGMENT_APPEND, state.start, state.start_pos))
+            self.changes.append((SEGMENT_APPEND, state.peak, state.peak_pos))
+            self.started = True
+            self.starts = [(state.start, state.start_pos)]
+            del self.items[:state.start_pos - self.items[0][1]]
+        self.starts.append((state.peak, state.peak_pos))
+        self.state = SegmentState(-state.direction, state.peak, state.peak_pos)
+        self.pending = None
+        for item in state.buffer:
+            self.on_fx(*item)
+
+    def on_revert(self, fx, pos):
+        """
+        当前线段确认前被fx突破起点，上一条线段延伸，从它的起点重新输入到pos的笔端点
+        on_end回放时pos之后还有没回放的笔端点，不能输入
+        第一条线段被突破时从fx重新开始；上一条线段已经被trim()丢弃时不处理，返回False
+        当前线段的极值点超过上一条线段的起点时在极值点结束，返回False，fx由调用方输入新的线段
+        """
+        state = self.state
+        if len(self.starts) < 2:
+            if not self.first:
+                return False
+            # 第一条线段的起点和极值点都已经输出
+            self.changes.append((SEGMENT_REMOVE, None, None))
+            self.changes.append((SEGMENT_REMOVE, None, None))
+            self.started = False
+            self.starts = []
+            self.items = [(fx, pos)]
+            self.state = SegmentState(state.direction, fx, pos)
+            self.pending = None
+            return True
+        if state.peak is not None and state.hi(state.peak) > state.hi(self.starts[-2][0]):
+            # 极值点超过上一条线段的起点，上一条线段不能延伸，当前线段在极值点结束，fx输入反向线段
+            if not state.published:
+                self.changes.append((SEGMENT_APPEND, state.peak, state.peak_pos))
+            self.on_end()
+            return False
+        if state.published:
+            self.changes.append((SEGMENT_REMOVE, None, None))
+        self.starts.pop()
+        start, start_pos = self.starts[-1]
+        state = SegmentState(-state.direction, start, start_pos)
+        base = self.items[0][1]
+        for item in self.items[start_pos - base + 1:pos - base + 1]:
+            state.feed(*item)
+        state.published = True
+        self.state = state
+        self.pending = None
+        self.changes.append((SEGMENT_EXTEND, state.peak, state.peak_pos))
+        return True
+
+    def trim(self, pos):
+        """丢弃起点在pos之前的线段，至少保留当前和上一条线段，on_retain调用"""
+        cut = 0
+        while cut < len(self.starts) - 2 and self.starts[cut][1] < pos:
+            cut += 1
+        if not cut:
+            return
+        del self.starts[:cut]
+        del self.items[:self.starts[0][1] - self.items[0][1]]
+        self.first = False
@@ -1,4 +1,8 @@
-from trade.utility import BarGenerator
+import pickle
+
+import numpy as np
+
+from trade.utility import BarGenerator, extract_stock_symbol
 from trade.template import Template
 from trade.object import (
     StopOrder,
@@ -8,7 +12,14 @@ from trade.object import (
     OrderData,
 )
 from trade.constant import FREQS, INTERVAL_FREQ, Interval, FREQS_WINDOW, METHOD, Direction, Offset
+from trade.chanlog import ChanLog, INFO
+from trade.session import to_timestamp
 from .chan_class import Chan_Class
+from .chan_array import BarBuffer, resample
+from .chan_batch import ChanBatch, replay_levels
+
+# 快照格式版本，Chan_Class的数据结构变化时加1
+CHECKPOINT_VERSION = 16
 
 
 class Chan_Strategy(Template):
@@ -21,8 +32,14 @@ class Chan_Strategy(Template):
     qjt = False
     gz = False
     jb = Interval.MINUTE
+    keep_pivots = None
+    include_feature = False
+    session_window = False
+    # 不影响计算结果，不在parameters里
+    log_level = None
 
-    parameters = ['method', 'symbol', 'include', 'build_pivot', 'qjt', 'gz', 'jb']
+    parameters = ['method', 'symbol', 'include', 'build_pivot', 'qjt', 'gz', 'jb', 'keep_pivots', 'include_feature',
+                  'session_window']
     buy1 = 100
     buy2 = 200
     buy3 = 200
@@ -60,15 +77,23 @@ class Chan_Strategy(Template):
             # 买卖的级别
             if 'jb' in setting.keys():
                 self.jb = setting['jb']
-            # 线段生成方法
-            # if 'include_feature' in setting.keys():
-            #     self.include_feature = setting['include_feature']
+            # 缠论计算日志级别，DEBUG/INFO/OFF，只作用于这个策略，见trade.chanlog
+            if 'log_level' in setting.keys():
+                self.log_level = setting['log_level']
+            # 实盘长时间运行时每个级别只保留最近的中枢和相关数据，见Chan_Class.on_retain
+            if 'keep_pivots' in setting.keys():
+                self.keep_pivots = setting['keep_pivots']
+            # 线段生成方法，True按特征序列划分线段，见chan_segment
+            if 'include_feature' in setting.keys():
+                self.include_feature = setting['include_feature']
+            # 高级别K线按交易时段切分，1分钟K线有缺失时不会错位，见trade.session；默认按根数
+            if 'session_window' in setting.keys():
+                self.session_window = setting['session_window']
 
         super().__init__(engine, strategy_name, vt_symbol, setting)
         self.engine = engine
         self.strategy_name = strategy_name
         self.vt_symbol = vt_symbol
-        self.include_feature = False
 
         # map
         self.chan_freq_map = {}
@@ -82,19 +107,20 @@ class Chan_Strategy(Template):
         for freq in FREQS:
             chan = Chan_Class(freq=freq, symbol=self.vt_symbol, sell=self.sell, buy=self.buy, include=self.include,
                               include_feature=self.include_feature, build_pivot=self.build_pivot, qjt=self.qjt,
-                              gz=self.gz)
+                              gz=self.gz, keep_pivots=self.keep_pivots, log_level=self.log_level)
             self.chan_freq_map[freq] = chan
+            # 限定共振作用级别，在set_prev之前确定，set_prev按gz订阅上一个级别的买点
+            if prev is None or freq != FREQS[-1]:
+                chan.gz = False
             if prev:
                 prev.set_next(chan)
                 chan.set_prev(prev)
             prev = chan
-            # 限定共振作用级别
-            if chan.prev == None or chan.freq != FREQS[-1]:
-                chan.gz = False
             if i > 0:
                 wlist = FREQS_WINDOW[FREQS[i - 1]]
                 self.bg_freq_map[freq] = BarGenerator(on_bar=self.on_pass, on_window_bar=self.on_bar, window=wlist[0],
-                                                      interval=wlist[1], target=wlist[2])
+                                                      interval=wlist[1], target=wlist[2],
+                                                      session=self.session_window)
             i += 1
 
     def on_start(self):
@@ -104,11 +130,19 @@ class Chan_Strategy(Template):
 
     def on_stop(self):
         self.write_log("chan策略停止")
+        for freq, chan in self.chan_freq_map.items():
+            chan.log('on_pivot calls:%s skipped:%s', chan.pivot_calls, chan.pivot_skips, level=INFO)
+        ChanLog.close(self.vt_symbol)
         self.put_event()
 
     def on_tick(self, tick: TickData):
         self.bg.update_tick(tick)
 
+    def on_ticks(self, timestamps, last_price, volume, open_interest, tzinfo=None):
+        """一批tick的数组，回放保存的tick或实盘的小批量行情，见BarGenerator.update_ticks"""
+        symbol, exchange = extract_stock_symbol(self.vt_symbol)
+        self.bg.update_ticks(symbol, exchange, timestamps, last_price, volume, open_interest, tzinfo)
+
     def on_bar(self, bar: BarData):
         # print(bar)
         freq = INTERVAL_FREQ[bar.interval.value]
@@ -118,6 +152,168 @@ class Chan_Strategy(Template):
             # self.put_render_event()
         self.chan_freq_map[freq].on_bar(bar)
 
+    def on_bars(self, bars: list, level_bars: dict = None, cancel=None) -> bool:
+        """
+        批量处理历史1分钟K线，结果和逐根调用on_bar相同，之后可以继续on_bar
+        1. 1分钟K线转成列式存储，各级别K线用resample一次切出，不经过BarGenerator，
+           同时得到每根K线是在第几根1分钟K线处理时生成的
+        2. 每个级别用ChanBatch算出合并K线、MACD和分型
+        3. 按时间先后交替回放各级别的笔、线段、中枢，见replay_levels
+        最后不足一根的K线交给BarGenerator，之后on_bar接着合成
+        level_bars：{freq: list[BarData]}，高级别直接下载的K线，这些级别不再用1分钟K线合成，
+        只合成最后一根之后的部分；按时间和1分钟K线合并，同一时间先处理高级别，见on_merged_bars
+        共振每根K线都要检查高级别的买点，开启时逐根处理
+        cancel：可选，计算过程中定期调用，返回True时停止计算并返回False，这时的状态不完整，不能再保存或继续
+        """
+        level_bars = {freq: native for freq, native in (level_bars or {}).items() if native}
+        if not bars or self.gz or any(len(chan.k_list) for chan in self.chan_freq_map.values()) or \
+                any(bar.interval != Interval.MINUTE for bar in bars):
+            return self.on_merged_bars(bars, level_bars, cancel)
+
+        minute_bars = BarBuffer(len(bars))
+        minute_bars.extend(bars)
+        minute_freq = INTERVAL_FREQ[Interval.MINUTE.value]
+        batch_bars = {minute_freq: minute_bars}
+        batch_steps = {minute_freq: list(range(len(bars)))}
+        for bg in self.bg_freq_map.values():
+            freq = INTERVAL_FREQ[bg.target.value]
+            start = 0
+            native = level_bars.get(freq)
+            if native:
+                native_bars = BarBuffer(len(native))
+                native_bars.extend(native)
+                # 原生K线在时间不早于它的第一根1分钟K线之前处理
+                native_steps = np.searchsorted(minute_bars.datetime, native_bars.datetime)
+                start = int(np.searchsorted(minute_bars.datetime, native_bars.datetime[-1], 'right'))
+            window_bars, end, rest = resample(minute_bars, bg.window, bg.target, start, bg.session)
+            for bar in bars[rest:]:
+                bg.update_bar(bar)
+            bg.last_bar = bars[-1]
+            if native:
+                native_bars.extend_buffer(window_bars)
+                window_bars = native_bars
+                end = np.concatenate([native_steps, end])
+            batch_bars[freq] = window_bars
+            batch_steps[freq] = end.tolist()
+
+        batches = []
+        for freq in FREQS:
+            if cancel and cancel():
+                return False
+            batches.append(ChanBatch(self.chan_freq_map[freq], batch_bars[freq]))
+        return replay_levels(batches, [batch_steps[freq] for freq in FREQS], cancel)
+
+    def on_merged_bars(self, bars: list, level_bars: dict, cancel=None) -> bool:
+        """
+        逐根处理1分钟K线和高级别的原生K线
+        每根1分钟K线先按级别从高到低处理：有原生K线的级别处理时间不晚于它的原生K线，
+        最后一根原生K线之后才由BarGenerator合成，其余级别由BarGenerator合成；最后处理1分钟级别
+        cancel见on_bars
+        """
+        if not level_bars:
+            for bar in bars:
+                if cancel and cancel():
+                    return False
+                self.on_bar(bar)
+            return True
+        minute_freq = INTERVAL_FREQ[Interval.MINUTE.value]
+        bg_map = {INTERVAL_FREQ[bg.target.value]: bg for bg in self.bg_freq_map.values()}
+        pos = {freq: 0 for freq in level_bars}
+        for bar in bars:
+            if cancel and cancel():
+                return False
+            for freq in FREQS:
+                native = level_bars.get(freq)
+                if native:
+                    i = pos[freq]
+                    while i < len(native) and native[i].datetime <= bar.datetime:
+                        self.chan_freq_map[freq].on_bar(native[i])
+                        i += 1
+                    pos[freq] = i
+                    if native[-1].datetime >= bar.datetime:
+                        continue
+                if freq in bg_map:
+                    bg_map[freq].update_bar(bar)
+            self.chan_freq_map[minute_freq].on_bar(bar)
+        for freq in FREQS:
+            for bar in level_bars.get(freq, [])[pos.get(freq, 0):]:
+                self.chan_freq_map[freq].on_bar(bar)
+        return True
+
+    def save_checkpoint(self, path) -> None:
+        """
+        保存全部级别的计算状态，包括K线、分型、笔、线段、中枢、买卖点、macd、line_index、共振计数，
+        以及BarGenerator里还没完成的K线。恢复后继续on_bar和从头计算的结果相同
+        """
+        data = {
+            'version': CHECKPOINT_VERSION,
+            'vt_symbol': self.vt_symbol,
+            'parameters': self.get_parameters(),
+            'chan_freq_map': self.chan_freq_map,
+            'bg': self.get_bg_state(self.bg),
+            'bg_freq_map': {freq: self.get_bg_state(bg) for freq, bg in self.bg_freq_map.items()},
+        }
+        with open(path, 'wb') as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def load_checkpoint(self, path) -> bool:
+        """恢复save_checkpoint保存的状态，版本、股票代码或者参数不一致时不恢复，返回False"""
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+        if data.get('version') != CHECKPOINT_VERSION or data['vt_symbol'] != self.vt_symbol or \
+                data['parameters'] != self.get_parameters():
+            return False
+
+        self.chan_freq_map = data['chan_freq_map']
+        for chan in self.chan_freq_map.values():
+            chan.buy = self.buy
+            chan.sell = self.sell
+            if self.log_level is not None:
+                chan.log_level = self.log_level
+            chan.subscribe_gz()
+        self.bg.__dict__.update(data['bg'])
+        for freq, bg in self.bg_freq_map.items():
+            bg.__dict__.update(data['bg_freq_map'][freq])
+        return True
+
+    def get_last_datetime(self):
+        """最后一根1分钟K线的时间，还没有K线时为None"""
+        k_list = self.chan_freq_map[INTERVAL_FREQ[Interval.MINUTE.value]].k_list
+        if not len(k_list):
+            return None
+        return k_list.datetime_at(-1)
+
+    def match_bars(self, bars: list) -> bool:
+        """
+        重新下载的K线中不晚于最后一根K线的部分和已经计算的1分钟K线价格是否相同
+        数据源是前复权价格，除权除息之后历史价格整体变化，缓存的结果不能接着用；没有可以比较的K线时为False
+        """
+        k_list = self.chan_freq_map[INTERVAL_FREQ[Interval.MINUTE.value]].k_list
+        timestamps = k_list.datetime
+        if not len(timestamps):
+            return False
+        matched = False
+        for bar in bars:
+            ts = to_timestamp(bar.datetime)
+            if ts > timestamps[-1]:
+                break
+            i = int(np.searchsorted(timestamps, ts))
+            if i == len(timestamps) or timestamps[i] != ts:
+                continue
+            if (bar.open_price, bar.high_price, bar.low_price, bar.close_price) != \
+                    (k_list.open[i], k_list.high[i], k_list.low[i], k_list.close[i]):
+                return False
+            matched = True
+        return matched
+
+    @staticmethod
+    def get_bg_state(bg: BarGenerator) -> dict:
+        """BarGenerator的状态，不包括回调"""
+        state = bg.__dict__.copy()
+        state.pop('on_bar')
+        state.pop('on_window_bar')
+        return state
+
     def buy(self, price: float, volume: float, freq: str = '', stop: bool = False, lock: bool = False):
         return self.send_order(Direction.LONG, Offset.OPEN, price, volume, freq, stop, lock)
 
@@ -5,13 +5,16 @@ import sys
 from pathlib import Path
 from typing import Callable, Dict, Tuple, Union, Optional
 from decimal import Decimal
-from math import floor, ceil
+from math import floor, ceil, sqrt
+from collections import deque
+from abc import ABC, abstractmethod
 
 import numpy as np
 import talib
 
 from trade.object import BarData, TickData
 from trade.constant import Exchange, Interval, ZH_TRANS_MAP
+from trade.session import session_bucket, is_bucket_end, is_run_time, local_minutes, to_timestamp, to_datetime
 
 log_formatter = logging.Formatter('[%(asctime)s] %(message)s')
 
@@ -21,6 +24,18 @@ def extract_vt_symbol(vt_symbol: str) -> Tuple[str, Exchange]:
     return symbol, Exchange(exchange_str)
 
 
+def extract_stock_symbol(vt_symbol: str) -> Tuple[str, Exchange]:
+    """
+    return symbol and exchange, also for a bare A-share code such as
+    '000001': codes starting with 6 are SSE, others SZSE.
+    """
+    if "." in vt_symbol:
+        return extract_vt_symbol(vt_symbol)
+    if vt_symbol.startswith("6"):
+        return vt_symbol, Exchange.SSE
+    return vt_symbol, Exchange.SZSE
+
+
 def generate_vt_symbol(symbol: str, exchange: Exchange) -> str:
     """
     return vt_symbol
@@ -124,18 +139,8 @@ def get_digits(value: float) -> int:
 
 
 def check_run_time() -> bool:
-    """ 当前时间是否是开盘时间 """
-    dtime = datetime.datetime
-    now = dtime.now()
-    now_str = str(now.date())
-    start_sw = dtime.strptime(now_str + " 9:30", '%Y-%m-%d %H:%M')
-    end_sw = dtime.strptime(now_str + " 11:32", '%Y-%m-%d %H:%M')
-    start_xw = dtime.strptime(now_str + " 13:00", '%Y-%m-%d %H:%M')
-    end_xw = dtime.strptime(now_str + " 15:02", '%Y-%m-%d %H:%M')
-    if (start_sw <= now <= end_sw) or (start_xw <= now <= end_xw):
-        return True
-    else:
-        return False
+    """ 当前时间是否是开盘时间，见trade.session.is_run_time """
+    return is_run_time(datetime.datetime.now())
 
 
 class BarGenerator:
@@ -147,6 +152,8 @@ class BarGenerator:
     Notice:
     1. for x minute bar, x must be able to divide 60: 2, 3, 5, 6, 10, 15, 20, 30
     2. for x hour bar, x can be any number
+    3. with session=True, x minute bars are cut by A-share session slots instead of
+       bar counts (x must divide 120, or 240 for daily bar), see trade.session
     """
 
     def __init__(
@@ -155,7 +162,8 @@ class BarGenerator:
             window: int = 0,
             on_window_bar: Callable = None,
             interval: Interval = Interval.MINUTE,
-            target: Interval = Interval.MINUTE
+            target: Interval = Interval.MINUTE,
+            session: bool = False
     ):
         self.bar: BarData = None
         self.on_bar: Callable = on_bar
@@ -172,6 +180,9 @@ class BarGenerator:
 
         self.target = target
 
+        self.session: bool = session
+        self.window_bucket: int = -1
+
     def update_tick(self, tick: TickData) -> None:
         """
         Update new tick data into generator.
@@ -224,10 +235,133 @@ class BarGenerator:
 
         self.last_tick = tick
 
+    def update_ticks(
+            self,
+            symbol: str,
+            exchange: Exchange,
+            timestamps: np.ndarray,
+            last_price: np.ndarray,
+            volume: np.ndarray,
+            open_interest: np.ndarray,
+            tzinfo=None
+    ) -> None:
+        """
+        Update a batch of ticks of one symbol into generator.
+
+        Same result as calling update_tick for each tick, but bars are
+        aggregated with numpy. timestamps are int64 microseconds as in
+        BarBuffer (UTC for timezone-aware data, see to_timestamp), volume
+        is the cumulative intraday volume. Unfinished bar and last tick are
+        kept in generator, so stored ticks can be replayed in chunks and
+        live micro-batches can be mixed with update_tick.
+        """
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        last_price = np.asarray(last_price, dtype=float)
+        volume = np.asarray(volume, dtype=float)
+        open_interest = np.asarray(open_interest, dtype=float)
+        if not len(timestamps):
+            return
+
+        # Filter tick data with 0 last price and ticks older than last
+        # accepted one. Accepted ticks are in order, so the latest accepted
+        # datetime is the running max of valid ticks before.
+        valid = last_price != 0
+        latest = np.where(valid, timestamps, np.iinfo(np.int64).min)
+        if self.last_tick:
+            latest = np.concatenate(([to_timestamp(self.last_tick.datetime)], latest[:-1]))
+        else:
+            latest = np.concatenate(([np.iinfo(np.int64).min], latest[:-1]))
+        accepted = valid & (timestamps >= np.maximum.accumulate(latest))
+        if not accepted.all():
+            timestamps = timestamps[accepted]
+            last_price = last_price[accepted]
+            volume = volume[accepted]
+            open_interest = open_interest[accepted]
+        n = len(timestamps)
+        if not n:
+            return
+
+        # Volume change against previous accepted tick, first tick of all has none
+        volume_change = np.empty(n)
+        volume_change[1:] = volume[1:] - volume[:-1]
+        if self.last_tick:
+            volume_change[0] = volume[0] - self.last_tick.volume
+        else:
+            volume_change[0] = 0
+        volume_change = np.maximum(volume_change, 0)
+
+        # New bar starts when minute field changes, same as update_tick
+        minutes = local_minutes(timestamps, tzinfo) % 60
+        new_minute = np.empty(n, dtype=bool)
+        new_minute[1:] = minutes[1:] != minutes[:-1]
+        new_minute[0] = not self.bar or self.bar.datetime.minute != minutes[0]
+        starts = np.flatnonzero(new_minute)
+        if not new_minute[0]:
+            starts = np.concatenate(([0], starts))
+        ends = np.append(starts[1:], n) - 1
+
+        high = np.maximum.reduceat(last_price, starts).tolist()
+        low = np.minimum.reduceat(last_price, starts).tolist()
+        bar_volume = np.add.reduceat(volume_change, starts).tolist()
+        open_price = last_price[starts].tolist()
+        close_price = last_price[ends].tolist()
+        bar_open_interest = open_interest[ends].tolist()
+        bar_timestamps = timestamps[ends].tolist()
+
+        for i in range(len(starts)):
+            dt = to_datetime(bar_timestamps[i], tzinfo)
+            if i == 0 and not new_minute[0]:
+                self.bar.high_price = max(self.bar.high_price, high[0])
+                self.bar.low_price = min(self.bar.low_price, low[0])
+                self.bar.close_price = close_price[0]
+                self.bar.open_interest = bar_open_interest[0]
+                self.bar.datetime = dt
+                self.bar.volume += bar_volume[0]
+                continue
+
+            if self.bar:
+                self.bar.datetime = self.bar.datetime.replace(
+                    second=0, microsecond=0
+                )
+                self.on_bar(self.bar)
+
+            self.bar = BarData(
+                symbol=symbol,
+                exchange=exchange,
+                interval=Interval.MINUTE,
+                datetime=dt,
+                open_price=open_price[i],
+                high_price=high[i],
+                low_price=low[i],
+                close_price=close_price[i],
+                open_interest=bar_open_interest[i],
+                volume=bar_volume[i]
+            )
+
+        self.last_tick = TickData(
+            symbol=symbol,
+            exchange=exchange,
+            datetime=dt,
+            volume=volume[-1].item(),
+            open_interest=open_interest[-1].item(),
+            last_price=last_price[-1].item()
+        )
+
     def update_bar(self, bar: BarData) -> None:
         """
         Update 1 minute bar into generator
         """
+        if self.session and self.interval == Interval.MINUTE:
+            bucket = session_bucket(bar.datetime, self.window)
+            # Bar out of session is merged into current window
+            if bucket < 0:
+                bucket = self.window_bucket
+            # Last minutes of previous window are missing, finish it first
+            elif self.window_bar and bucket != self.window_bucket:
+                self.on_window_bar(self.window_bar)
+                self.window_bar = None
+            self.window_bucket = bucket
+
         # If not inited, creaate window bar object
         if not self.window_bar:
             # Generate timestamp for bar data
@@ -263,7 +397,10 @@ class BarGenerator:
         # Check if window bar completed
         finished = False
 
-        if self.interval == Interval.MINUTE:
+        if self.interval == Interval.MINUTE and self.session:
+            # x-minute bar by session slot
+            finished = is_bucket_end(bar.datetime, self.window)
+        elif self.interval == Interval.MINUTE:
             # x-minute bar
             self.interval_count += 1
 
@@ -792,6 +929,363 @@ class ArrayManager(object):
         return result[-1]
 
 
+class RingArrayManager(ArrayManager):
+    """
+    ArrayManager with circular buffer.
+
+    1. every array has 2 * size elements and each bar is written to both
+       pos and pos + size, so update_bar is O(1) instead of shifting arrays
+    2. open/high/low/close/volume/open_interest return contiguous views of
+       the latest size bars, without copying, so TA-Lib methods still work
+    3. incremental indicators created by add_sma/add_ema/add_macd/add_atr/
+       add_boll are updated on every bar in O(1) and read from their value
+    """
+
+    def __init__(self, size: int = 100):
+        """Constructor"""
+        super().__init__(size)
+        self.pos: int = 0
+
+        self.open_array: np.ndarray = np.zeros(size * 2)
+        self.high_array: np.ndarray = np.zeros(size * 2)
+        self.low_array: np.ndarray = np.zeros(size * 2)
+        self.close_array: np.ndarray = np.zeros(size * 2)
+        self.volume_array: np.ndarray = np.zeros(size * 2)
+        self.open_interest_array: np.ndarray = np.zeros(size * 2)
+
+        self.indicators: list = []
+
+    def update_bar(self, bar: BarData) -> None:
+        """
+        Update new bar data into array manager.
+        """
+        self.count += 1
+        if not self.inited and self.count >= self.size:
+            self.inited = True
+
+        i = self.pos
+        j = i + self.size
+        self.open_array[i] = self.open_array[j] = bar.open_price
+        self.high_array[i] = self.high_array[j] = bar.high_price
+        self.low_array[i] = self.low_array[j] = bar.low_price
+        self.close_array[i] = self.close_array[j] = bar.close_price
+        self.volume_array[i] = self.volume_array[j] = bar.volume
+        self.open_interest_array[i] = self.open_interest_array[j] = bar.open_interest
+        self.pos = (i + 1) % self.size
+
+        for indicator in self.indicators:
+            indicator.update_bar(bar)
+
+    @property
+    def open(self) -> np.ndarray:
+        """
+        Get open price time series.
+        """
+        return self.open_array[self.pos:self.pos + self.size]
+
+    @property
+    def high(self) -> np.ndarray:
+        """
+        Get high price time series.
+        """
+        return self.high_array[self.pos:self.pos + self.size]
+
+    @property
+    def low(self) -> np.ndarray:
+        """
+        Get low price time series.
+        """
+        return self.low_array[self.pos:self.pos + self.size]
+
+    @property
+    def close(self) -> np.ndarray:
+        """
+        Get close price time series.
+        """
+        return self.close_array[self.pos:self.pos + self.size]
+
+    @property
+    def volume(self) -> np.ndarray:
+        """
+        Get trading volume time series.
+        """
+        return self.volume_array[self.pos:self.pos + self.size]
+
+    @property
+    def open_interest(self) -> np.ndarray:
+        """
+        Get open interest time series.
+        """
+        return self.open_interest_array[self.pos:self.pos + self.size]
+
+    def add_indicator(self, indicator: "Accumulator") -> "Accumulator":
+        """
+        Register an incremental indicator, it is updated from the next bar.
+        """
+        self.indicators.append(indicator)
+        return indicator
+
+    def add_sma(self, n: int) -> "SmaAccumulator":
+        """
+        Incremental simple moving average of close price.
+        """
+        return self.add_indicator(SmaAccumulator(n))
+
+    def add_ema(self, n: int) -> "EmaAccumulator":
+        """
+        Incremental exponential moving average of close price.
+        """
+        return self.add_indicator(EmaAccumulator(n))
+
+    def add_macd(self, fast_period: int, slow_period: int, signal_period: int) -> "MacdAccumulator":
+        """
+        Incremental MACD of close price.
+        """
+        return self.add_indicator(MacdAccumulator(fast_period, slow_period, signal_period))
+
+    def add_atr(self, n: int) -> "AtrAccumulator":
+        """
+        Incremental Average True Range.
+        """
+        return self.add_indicator(AtrAccumulator(n))
+
+    def add_boll(self, n: int, dev: float) -> "BollAccumulator":
+        """
+        Incremental Bollinger Channel of close price.
+        """
+        return self.add_indicator(BollAccumulator(n, dev))
+
+
+class Accumulator(ABC):
+    """
+    Incremental indicator updated bar by bar in O(1).
+
+    Values follow TA-Lib over the whole history fed so far, and are nan
+    until enough bars are received (inited is False).
+    """
+
+    def __init__(self):
+        """Constructor"""
+        self.count: int = 0
+        self.inited: bool = False
+        self.value: float = np.nan
+
+    @abstractmethod
+    def update_bar(self, bar: BarData) -> float:
+        """
+        Update new bar and return the latest value.
+        """
+
+
+class CloseAccumulator(Accumulator):
+    """
+    Accumulator calculated from close prices only, also usable on any
+    series of values through update.
+    """
+
+    def update_bar(self, bar: BarData) -> float:
+        """
+        Update new bar and return the latest value.
+        """
+        return self.update(bar.close_price)
+
+    @abstractmethod
+    def update(self, value: float) -> float:
+        """
+        Update new close price and return the latest value.
+        """
+
+
+class SmaAccumulator(CloseAccumulator):
+    """
+    Simple moving average, same as talib.SMA.
+    """
+
+    def __init__(self, n: int):
+        """Constructor"""
+        super().__init__()
+        self.n: int = n
+        self.window: deque = deque(maxlen=n)
+        self.total: float = 0.0
+
+    def update(self, value: float) -> float:
+        """
+        Update new value and return the latest average.
+        """
+        self.count += 1
+        if len(self.window) == self.n:
+            self.total -= self.window[0]
+        self.window.append(value)
+        self.total += value
+        if self.count >= self.n:
+            self.inited = True
+            self.value = self.total / self.n
+        return self.value
+
+
+class EmaAccumulator(CloseAccumulator):
+    """
+    Exponential moving average, same as talib.EMA: seeded with the
+    simple average of the first n values.
+    """
+
+    def __init__(self, n: int):
+        """Constructor"""
+        super().__init__()
+        self.n: int = n
+        self.k: float = 2.0 / (n + 1)
+        self.total: float = 0.0
+
+    def update(self, value: float) -> float:
+        """
+        Update new value and return the latest average.
+        """
+        self.count += 1
+        if self.inited:
+            self.value = (value - self.value) * self.k + self.value
+        else:
+            self.total += value
+            if self.count == self.n:
+                self.inited = True
+                self.value = self.total / self.n
+        return self.value
+
+
+class MacdAccumulator(CloseAccumulator):
+    """
+    MACD, same as talib.MACD: the fast EMA is seeded over the same bars
+    as the slow EMA, and the signal EMA is seeded with the first
+    signal_period DIF values.
+
+    value is the (macd, signal, hist) tuple.
+    """
+
+    def __init__(self, fast_period: int, slow_period: int, signal_period: int):
+        """Constructor"""
+        super().__init__()
+        self.fast_period: int = fast_period
+        self.slow_period: int = slow_period
+        self.fast_k: float = 2.0 / (fast_period + 1)
+        self.slow_k: float = 2.0 / (slow_period + 1)
+        self.signal: EmaAccumulator = EmaAccumulator(signal_period)
+        self.closes: deque = deque(maxlen=slow_period)
+        self.fast_ema: float = np.nan
+        self.slow_ema: float = np.nan
+        self.value: tuple = (np.nan, np.nan, np.nan)
+
+    def update(self, value: float) -> tuple:
+        """
+        Update new close price and return the latest (macd, signal, hist).
+        """
+        self.count += 1
+        if self.count < self.slow_period:
+            self.closes.append(value)
+            return self.value
+
+        if self.count == self.slow_period:
+            self.closes.append(value)
+            closes = list(self.closes)
+            self.slow_ema = sum(closes) / self.slow_period
+            self.fast_ema = sum(closes[self.slow_period - self.fast_period:]) / self.fast_period
+            self.closes = None
+        else:
+            self.fast_ema = (value - self.fast_ema) * self.fast_k + self.fast_ema
+            self.slow_ema = (value - self.slow_ema) * self.slow_k + self.slow_ema
+
+        dif = self.fast_ema - self.slow_ema
+        dea = self.signal.update(dif)
+        if self.signal.inited:
+            self.inited = True
+            self.value = (dif, dea, dif - dea)
+        return self.value
+
+
+class AtrAccumulator(Accumulator):
+    """
+    Average True Range, same as talib.ATR: the first true range needs the
+    previous close, the average is seeded with the simple average of the
+    first n true ranges and then smoothed by Wilder's method.
+    """
+
+    def __init__(self, n: int):
+        """Constructor"""
+        super().__init__()
+        self.n: int = n
+        self.pre_close: float = np.nan
+        self.total: float = 0.0
+
+    def update_bar(self, bar: BarData) -> float:
+        """
+        Update new bar and return the latest ATR.
+        """
+        self.count += 1
+        pre_close = self.pre_close
+        self.pre_close = bar.close_price
+        if self.count == 1:
+            return self.value
+
+        tr = max(bar.high_price, pre_close) - min(bar.low_price, pre_close)
+        if self.inited:
+            self.value = (self.value * (self.n - 1) + tr) / self.n
+        else:
+            self.total += tr
+            if self.count == self.n + 1:
+                self.inited = True
+                self.value = self.total / self.n
+        return self.value
+
+
+class BollAccumulator(CloseAccumulator):
+    """
+    Bollinger Channel, same as ArrayManager.boll: SMA plus/minus dev times
+    the population standard deviation over n bars.
+
+    Mean and sum of squared deviations are kept with a sliding Welford
+    update instead of raw sums, which lose precision by cancellation at
+    high price levels. They are recomputed from the window every n bars,
+    so rounding errors can not accumulate over a long history.
+
+    value is the (up, down) tuple.
+    """
+
+    def __init__(self, n: int, dev: float):
+        """Constructor"""
+        super().__init__()
+        self.n: int = n
+        self.dev: float = dev
+        self.window: deque = deque(maxlen=n)
+        self.mean: float = 0.0
+        self.m2: float = 0.0
+        self.value: tuple = (np.nan, np.nan)
+
+    def update(self, value: float) -> tuple:
+        """
+        Update new close price and return the latest (up, down).
+        """
+        self.count += 1
+        if len(self.window) < self.n:
+            self.window.append(value)
+            delta = value - self.mean
+            self.mean += delta / len(self.window)
+            self.m2 += delta * (value - self.mean)
+        elif self.count % self.n == 0:
+            self.window.append(value)
+            self.mean = sum(self.window) / self.n
+            self.m2 = sum((v - self.mean) ** 2 for v in self.window)
+        else:
+            old = self.window[0]
+            self.window.append(value)
+            old_mean = self.mean
+            self.mean += (value - old) / self.n
+            self.m2 += (value - old) * (value - self.mean + old - old_mean)
+
+        if self.count >= self.n:
+            self.inited = True
+            std = sqrt(max(self.m2 / self.n, 0.0))
+            self.value = (self.mean + std * self.dev, self.mean - std * self.dev)
+        return self.value
+
+
 def virtual(func: Callable) -> Callable:
     """
     mark a function as "virtual", which means that this function can be override.